@@ -0,0 +1,67 @@
+"""Microbenchmark of the parser of monitored values on stderr
+
+Usage: python benchmarks/bench_monitor.py [--lines N] [--monitored-ratio R]
+
+Reports the number of stderr lines per second that capture_value handles for a mix of plain lines
+(warnings, progress bars) and lines written by log_value, next to the regex + literal_eval parser
+it replaced.
+"""
+import argparse
+import ast
+import random
+import re
+import time
+
+from jikken.monitor import capture_value
+
+legacy_matcher = re.compile(pattern=r"JEKKIN_MONITOR\t([\w_]+)\t([\w.]+)")
+
+
+def legacy_capture_value(line):
+    results = legacy_matcher.search(line)
+    if results:
+        return results.group(1), ast.literal_eval(results.group(2))
+
+
+PLAIN_LINES = [
+    "/usr/lib/python3/site-packages/module.py:12: DeprecationWarning: this call is deprecated\n",
+    " 42%|####      | 420/1000 [00:12<00:17, 33.52it/s]\n",
+    "Epoch 3/10\n",
+]
+MONITORED_VALUES = ["0.5", "12", "0.0001"]  # values the legacy parser can also read
+
+
+def make_lines(count: int, monitored_ratio: float, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    lines = []
+    for index in range(count):
+        if rng.random() < monitored_ratio:
+            lines.append("2018-01-01 00:00:00,000 - jekkin - INFO - JEKKIN_MONITOR\tloss\t{}\n".format(
+                rng.choice(MONITORED_VALUES)))
+        else:
+            lines.append(rng.choice(PLAIN_LINES))
+    return lines
+
+
+def lines_per_second(parser, lines: list, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            parser(line)
+        best = min(best, time.perf_counter() - start)
+    return len(lines) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--monitored-ratio", type=float, default=0.01)
+    args = parser.parse_args()
+    lines = make_lines(args.lines, args.monitored_ratio)
+    for name, function in [("capture_value", capture_value), ("legacy regex", legacy_capture_value)]:
+        print("{:<14} {:>12,.0f} lines/s".format(name, lines_per_second(function, lines)))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ setup(name='jikken',
       packages=find_packages(where='src'),
       package_dir={'': 'src'},
       install_requires=['Click', 'tinydb', 'pymongo', 'gitpython', 'pyyaml', 'blessings','Pygments', "elasticsearch"],
+      extras_require={'series': ['numpy']},
       tests_require=['pytest', 'pytest-mock'],
       entry_points={
           'console_scripts': [
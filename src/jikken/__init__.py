@@ -1,4 +1,24 @@
 # from .data_formater import print_experiment
-from .monitor import log_value
-from .experiment import Experiment
-from .multistage import MultiStageExperiment
+import sys
+import types
+
+from .monitor import log_value, log_metric, Monitor
+
+
+class _LazyModule(types.ModuleType):
+    """Import Experiment and MultiStageExperiment on first use, training scripts only need the monitor
+
+    A module level __getattr__ needs Python 3.7, the class of a module can be replaced since Python 3.5
+    """
+
+    def __getattr__(self, name):
+        if name == "Experiment":
+            from .experiment import Experiment
+            return Experiment
+        elif name == "MultiStageExperiment":
+            from .multistage import MultiStageExperiment
+            return MultiStageExperiment
+        raise AttributeError("module {} has no attribute {}".format(self.__name__, name))
+
+
+sys.modules[__name__].__class__ = _LazyModule
@@ -1,22 +1,50 @@
-from subprocess import PIPE, Popen
+from contextlib import contextmanager
+from queue import Queue
+from tempfile import TemporaryDirectory
+from threading import BoundedSemaphore, Thread
 
 from jikken import MultiStageExperiment
 from .multistage import load_stage_metadata
 
-from .database import setup_database, ExperimentQuery, MultiStageExperimentQuery
+from .database import setup_database, BatchWriter, ExperimentQuery, MultiStageExperimentQuery, Series
+from .database import PAGE_SIZE
 from .setups import ExperimentSetup, MultiStageExperimentSetup
 from .experiment import Experiment
-from .monitor import capture_value
-from .utils import prepare_variables, prepare_command, get_resume_name
+from .monitor import capture_value, MetricsReceiver
+from .resources import ResourceSampler, RESOURCE_INTERVAL
+from .sweep import load_sweep, grid_variants, random_variants, unique_variants, worker_cpus
+from .utils import prepare_variables, prepare_command, get_resume_name, create_directory_from_variables
 import os
-import sys
+import time
 
-BUFFER_LIMIT = 1000  # the number of characters added to an std stream before updating the database
+STREAM_LIMIT = 2 ** 20  # the size of the line buffer of the child streams of run_async, longer lines are read in chunks
 
 
-def run(*, setup: ExperimentSetup) -> None:
+@contextmanager
+def prepare_experiment(setup: ExperimentSetup, name: str = None):
+    """Prepare the experiment and the command of a setup, the name defaults to the name of the setup
+
+    The configuration the command points to only exists inside the context
+    """
+    with prepare_variables(config_directory=setup.configuration_path,
+                           reference_directory=setup.reference_configuration_path) as vr:
+        variables, configuration_path = vr
+        extra_vars = {argument[0]: argument[1] for argument in setup.args}
+        variables = {**variables, **extra_vars}
+        cmd = prepare_command(configuration_path=configuration_path, setup=setup)
+        exp = Experiment(name=setup.name if name is None else name,
+                         variables=variables,
+                         code_dir=os.path.dirname(setup.script_path),
+                         tags=setup.tags)
+        yield exp, cmd
+
+
+def run(*, setup: ExperimentSetup, force: bool = False) -> str:
     """Runs an experiment script and captures the stdout and stderr
 
+    If an experiment with the same name, parameters and commit has already completed the script is not run
+    again and the id of the completed experiment is returned instead
+
     Args:
         setup (ExperimentSetup): An object with the setup to run an experiment including:
             configuration_path (str): The path to the configuration file/dir of the experiment
@@ -27,20 +55,19 @@ def run(*, setup: ExperimentSetup) -> None:
             reference_configuration_path (str): Optional a path for a reference configuration. If it is given
                 the reference_configuration_path defines the experiment and the configuration_path only requires
                 the updated variables
+        force (bool): If True the script is run even if the same experiment has already completed
+    Returns:
+        str: The id of the experiment
     """
-    with prepare_variables(config_directory=setup.configuration_path,
-                           reference_directory=setup.reference_configuration_path) as vr:
-        variables, configuration_path = vr
-        extra_vars = {argument[0]: argument[1] for argument in setup.args}
-        variables = {**variables, **extra_vars}
-        cmd = prepare_command(configuration_path=configuration_path, setup=setup)
-        exp = Experiment(name=setup.name,
-                         variables=variables,
-                         code_dir=os.path.dirname(setup.script_path),
-                         tags=setup.tags)
+    with prepare_experiment(setup) as (exp, cmd):
         with setup_database() as db:
+            completed = None if force else db.find_completed(exp)
+            if completed is not None:
+                print("Experiment already completed with id {}, use --force to run it again".format(completed['id']))
+                return completed['id']
             exp_id = db.add(exp)
-            run_experiment(db=db, exp_id=exp_id, cmd=cmd)
+            run_experiment(db=db, exp_id=exp_id, cmd=cmd, resource_interval=setup.resource_interval)
+    return exp_id
 
 
 def resume_stage(*, setup: MultiStageExperimentSetup) -> None:
@@ -67,20 +94,11 @@ def resume_stage(*, setup: MultiStageExperimentSetup) -> None:
             ml_id = db.add(multistage)
             multistage._id = ml_id
             multistage.export_metadata(setup.output_path)
-            run_experiment(db=db, exp_id=exp_id, cmd=cmd)
+            run_experiment(db=db, exp_id=exp_id, cmd=cmd, resource_interval=setup.resource_interval)
 
 
 def run_stage(*, setup: MultiStageExperimentSetup) -> None:
-    with prepare_variables(config_directory=setup.configuration_path,
-                           reference_directory=setup.reference_configuration_path) as vr:
-        variables, configuration_path = vr
-        extra_vars = {argument[0]: argument[1] for argument in setup.args}
-        variables = {**variables, **extra_vars}
-        cmd = prepare_command(configuration_path=configuration_path, setup=setup)
-        exp = Experiment(name=setup.stage_name,
-                         variables=variables,
-                         code_dir=os.path.dirname(setup.script_path),
-                         tags=setup.tags)
+    with prepare_experiment(setup, name=setup.stage_name) as (exp, cmd):
         with setup_database() as db:
             exp_id = db.add(exp)
             if setup.input_path is not None:
@@ -95,48 +113,344 @@ def run_stage(*, setup: MultiStageExperimentSetup) -> None:
             ml_id = db.add(multistage)
             multistage._id = ml_id
             multistage.export_metadata(setup.output_path, exp_id)
-            run_experiment(db=db, exp_id=exp_id, cmd=cmd)
+            run_experiment(db=db, exp_id=exp_id, cmd=cmd, resource_interval=setup.resource_interval)
+
+
+class OutputCapture:
+    """Route the output lines of a running experiment to a BatchWriter"""
+
+    def __init__(self, writer: BatchWriter, exp_id):
+        self._writer = writer
+        self._exp_id = exp_id
+        self.error_found = False
+
+    def start(self) -> None:
+        self._writer.update_status(self._exp_id, 'running')
+
+    def add_metric(self, name: str, step, timestamp: float, value: float) -> None:
+        """Store a value received through the binary metrics channel"""
+        self._writer.update_monitored(self._exp_id, name, value, step=step, timestamp=timestamp)
+
+    def add_line(self, std_type: str, line: bytes) -> None:
+        """Store a line of the stdout or stderr of the experiment, capturing any monitored value"""
+        print_out = line.decode('utf-8')
+        monitored = capture_value(print_out) if std_type == 'stderr' else None
+        if monitored is not None:
+            self._writer.update_monitored(self._exp_id, monitored[0], monitored[1], timestamp=time.time())
+        else:
+            self._writer.update_std(self._exp_id, print_out, std_type=std_type)
+            print(print_out)
+        if std_type == 'stderr' and 'Error' in print_out:
+            self.error_found = True
+            self._writer.update_status(self._exp_id, 'error')
+            print("Experiment Failed")
+
+    def interrupt(self) -> None:
+        self._writer.update_status(self._exp_id, 'interrupted')
+        print("Experiment Interrupted")
+        self.error_found = True
+
+    def finish(self) -> None:
+        """Mark the experiment completed if no error was found"""
+        if not self.error_found:
+            self._writer.update_status(self._exp_id, 'completed')
+            print("Experiment Done")
+
+
+def start_stream_reader(stream, std_type: str, line_queue: Queue) -> Thread:
+    """Forward the lines of a child stream to a queue from a daemon thread
+
+    A (std_type, None) item is put on the queue when the stream reaches EOF
+    """
+
+    def read_lines():
+        try:
+            for line in iter(stream.readline, b''):
+                line_queue.put((std_type, line))
+        finally:
+            line_queue.put((std_type, None))
+
+    reader = Thread(target=read_lines, daemon=True)
+    reader.start()
+    return reader
+
+
+def run_experiment(*, db, exp_id, cmd, resource_interval: float = RESOURCE_INTERVAL):
+    """Run the experiment command and capture its stdout, stderr and monitored values as they are produced
+
+    Both streams are read concurrently so monitored values reach the database while the script is
+    still running and a chatty stderr can never fill its pipe and stall the child process. The database
+    writes are batched by a BatchWriter so reading the output never waits for the database. The resources
+    used by the child and its descendants are sampled every resource_interval seconds and stored as
+    monitored values, None or 0 disables the sampling
+    """
+    from subprocess import PIPE, Popen
+    line_queue = Queue()
+    with BatchWriter(db) as writer:
+        capture = OutputCapture(writer, exp_id)
+        metrics = MetricsReceiver(capture.add_metric)
+        try:
+            with Popen(cmd, stderr=PIPE, stdout=PIPE, env=metrics.env, pass_fds=(metrics.write_fd,)) as p:
+                metrics.start()
+                sampler = ResourceSampler(p.pid, capture.add_metric, interval=resource_interval)
+                sampler.start()
+                try:
+                    pump_streams(p, capture, line_queue)
+                finally:
+                    sampler.stop()
+        finally:
+            metrics.close()
+        capture.finish()
+
+
+def pump_streams(p: "Popen", capture: OutputCapture, line_queue: Queue) -> None:
+    """Pass the stdout and stderr lines of the child to the capture until both streams are closed"""
+    open_streams = {'stdout', 'stderr'}
+    start_stream_reader(p.stdout, 'stdout', line_queue)
+    start_stream_reader(p.stderr, 'stderr', line_queue)
+    capture.start()
+    while len(open_streams) > 0:
+        try:
+            std_type, line = line_queue.get()
+            if line is None:
+                open_streams.discard(std_type)
+            else:
+                capture.add_line(std_type, line)
+        except KeyboardInterrupt:
+            # the child receives the interrupt as well, keep draining its streams until they close
+            capture.interrupt()
+
+
+async def read_line_async(stream: "asyncio.StreamReader") -> bytes:
+    """Read a line of any length, the parts of lines longer than the limit of the stream are read one by one
+
+    The last line is returned without a line break and b'' at EOF
+    """
+    import asyncio
+    chunks = []
+    while True:
+        try:
+            chunks.append(await stream.readuntil(b'\n'))
+            return b''.join(chunks)
+        except asyncio.IncompleteReadError as error:
+            chunks.append(error.partial)
+            return b''.join(chunks)
+        except asyncio.LimitOverrunError as error:
+            chunks.append(await stream.read(error.consumed))
+
+
+async def pump_stream_async(stream: "asyncio.StreamReader", std_type: str, capture: OutputCapture) -> None:
+    """Pass the lines of a child stream to the capture until EOF"""
+    while True:
+        line = await read_line_async(stream)
+        if line == b'':
+            break
+        capture.add_line(std_type, line)
+
+
+async def run_experiment_async(*, db, exp_id, cmd, writer: BatchWriter = None,
+                               resource_interval: float = RESOURCE_INTERVAL):
+    """Coroutine version of run_experiment
+
+    Many experiments can be supervised from the same event loop, passing them the same writer
+    makes all their database writes go through a single thread and database handle
+    """
+    import asyncio
+    if writer is None:
+        with BatchWriter(db) as writer:
+            await run_experiment_async(db=db, exp_id=exp_id, cmd=cmd, writer=writer,
+                                       resource_interval=resource_interval)
+        return
+    capture = OutputCapture(writer, exp_id)
+    metrics = MetricsReceiver(capture.add_metric)
+    try:
+        process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.PIPE, limit=STREAM_LIMIT,
+                                                       env=metrics.env, pass_fds=(metrics.write_fd,))
+    except Exception:
+        metrics.close()
+        raise
+    metrics.start()
+    sampler = ResourceSampler(process.pid, capture.add_metric, interval=resource_interval)
+    sampler.start()
+    capture.start()
+    try:
+        await asyncio.gather(pump_stream_async(process.stdout, 'stdout', capture),
+                             pump_stream_async(process.stderr, 'stderr', capture))
+        await process.wait()
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        capture.interrupt()
+        raise
+    finally:
+        sampler.stop()
+        await asyncio.get_event_loop().run_in_executor(None, metrics.close)
+        capture.finish()
+
+
+async def run_setup_async(*, db, writer: BatchWriter, setup: ExperimentSetup, semaphore: "asyncio.Semaphore") -> str:
+    """Add the experiment of a setup to the db and run it once the semaphore allows it"""
+    import asyncio
+    async with semaphore:
+        with prepare_experiment(setup) as (exp, cmd):
+            exp_id = await asyncio.wrap_future(writer.execute(db.add, exp))
+            await run_experiment_async(db=db, exp_id=exp_id, cmd=cmd, writer=writer,
+                                       resource_interval=setup.resource_interval)
+    return exp_id
+
+
+async def run_setups_async(*, db, writer: BatchWriter, setups: list, max_concurrency: int) -> list:
+    import asyncio
+    semaphore = asyncio.Semaphore(max_concurrency)
+    return await asyncio.gather(*[run_setup_async(db=db, writer=writer, setup=setup, semaphore=semaphore)
+                                  for setup in setups])
+
+
+def run_async(*, setups: list, max_concurrency: int = None) -> list:
+    """Runs many experiment scripts concurrently from a single process
+
+    Every setup is run, unlike run completed experiments with the same hash are not looked up
+
+    Args:
+        setups (list): A list of ExperimentSetup objects, one per experiment to run
+        max_concurrency (int): Optional, the maximum number of scripts running at the same time.
+            If it is None all the experiments are started at once
+    Returns:
+        list: The ids of the experiments in the order of the setups
+    """
+    max_concurrency = len(setups) if max_concurrency is None else max_concurrency
+    assert max_concurrency > 0, "max_concurrency: {} must be positive".format(max_concurrency)
+    import asyncio
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        with setup_database() as db, BatchWriter(db) as writer:
+            task = loop.create_task(run_setups_async(db=db, writer=writer, setups=setups,
+                                                     max_concurrency=max_concurrency))
+            try:
+                exp_ids = loop.run_until_complete(task)
+            except KeyboardInterrupt:
+                task.cancel()
+                loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+                raise
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    return exp_ids
+
+
+_sweep_started = None  # the queue a sweep worker puts the ids of the experiments it adds on
+
+
+def init_sweep_worker(counter, workers: int, pin_cpus: bool, started=None) -> None:
+    """Pin each sweep worker, and the scripts it runs, to its own share of the cpus"""
+    global _sweep_started
+    _sweep_started = started
+    if pin_cpus:
+        with counter.get_lock():
+            worker_index = counter.value
+            counter.value += 1
+        os.sched_setaffinity(0, worker_cpus(worker_index, workers))
+
+
+def run_variant(*, setup: ExperimentSetup, variables: dict, single_file: bool, force: bool = False) -> str:
+    """Run one variant of a sweep inside a pool worker and return the experiment id
+
+    A variant that has already completed is not run again unless force is True
+    """
+    with TemporaryDirectory() as config_dir:
+        create_directory_from_variables(config_dir, variables)
+        configuration_path = os.path.join(config_dir, list(variables.keys())[0]) if single_file else config_dir
+        extra_vars = {argument[0]: argument[1] for argument in setup.args}
+        cmd = prepare_command(configuration_path=configuration_path, setup=setup)
+        exp = Experiment(name=setup.name,
+                         variables={**variables, **extra_vars},
+                         code_dir=os.path.dirname(setup.script_path),
+                         tags=setup.tags)
+        with setup_database() as db:
+            completed = None if force else db.find_completed(exp)
+            if completed is not None:
+                return completed['id']
+            exp_id = db.add(exp)
+            if _sweep_started is not None:
+                _sweep_started.put(exp_id)
+            run_experiment(db=db, exp_id=exp_id, cmd=cmd, resource_interval=setup.resource_interval)
+    return exp_id
+
 
+def interrupt_started(started) -> None:
+    """Mark the experiments of the started queue that terminated sweep workers left unfinished as interrupted"""
+    exp_ids = []
+    while not started.empty():
+        exp_ids.append(started.get())
+    with setup_database() as db:
+        for exp_id, exp in zip(exp_ids, db.get_many(exp_ids, fields=["status"])):
+            if exp is not None and exp["status"] in ("created", "running"):
+                db.update_status(exp_id, "interrupted")
+
+
+def sweep(*, setup: ExperimentSetup, sweep_path: str, samples: int = None, seed: int = None, workers: int = 1,
+          pin_cpus: bool = False, force: bool = False) -> list:
+    """Runs a grid or random search over the variables of a configuration with a pool of workers
 
-def run_experiment(*, db, exp_id, cmd):
-    error_found = False
-    with Popen(cmd, stderr=PIPE, stdout=PIPE, bufsize=1) as p:
-        line_buffer = ''
+    Args:
+        setup (ExperimentSetup): The setup of the experiment, its configuration is the one that is swept
+        sweep_path (str): The path to the sweep specification. It mirrors the configuration but its leaves
+            are lists with the candidate values of each swept variable
+        samples (int): Optional, the number of random combinations to run. If it is None the whole grid is run
+        seed (int): Optional, the seed of the random search
+        workers (int): The number of experiments that run at the same time
+        pin_cpus (bool): If True every worker and its scripts are pinned to an even share of the cpus
+        force (bool): If True variants that have already completed are run again
+    Returns:
+        list: The ids of the experiments of the variants. Variants with the same parameters hash are run once
+            and variants that have already completed return the id of the completed experiment. Variants that
+            fail before their experiment finishes are reported and left out
+    """
+    assert workers > 0, "workers: {} must be positive".format(workers)
+    from multiprocessing import Pool, SimpleQueue, Value
+    with prepare_variables(config_directory=setup.configuration_path,
+                           reference_directory=setup.reference_configuration_path) as vr:
+        variables, _ = vr
+        sweep_spec = load_sweep(sweep_path, setup.configuration_path)
+        if samples is None:
+            variants = grid_variants(variables, sweep_spec)
+        else:
+            variants = random_variants(variables, sweep_spec, samples=samples, seed=seed)
+        extra_vars = {argument[0]: argument[1] for argument in setup.args}
+        single_file = os.path.isfile(setup.configuration_path)
+        # bound the number of queued variants so the expansion stays lazy
+        slots = BoundedSemaphore(2 * workers)
+        release = lambda _: slots.release()
+        results = []
+        started = SimpleQueue()
+        pool = Pool(processes=workers, initializer=init_sweep_worker,
+                    initargs=(Value('i', 0), workers, pin_cpus, started))
         try:
-            db.update_status(exp_id, 'running')
-            for line in p.stdout:
-                print_out = line.decode('utf-8')
-                line_buffer += print_out
-                print(print_out)
-                if len(line_buffer) > BUFFER_LIMIT:
-                    db.update_std(exp_id, line_buffer, std_type='stdout')
-                    line_buffer = ''
+            for variant in unique_variants(variants, extra_vars=extra_vars):
+                slots.acquire()
+                results.append(pool.apply_async(run_variant,
+                                                kwds={"setup": setup, "variables": variant,
+                                                      "single_file": single_file, "force": force},
+                                                callback=release, error_callback=release))
+            pool.close()
+            pool.join()
         except KeyboardInterrupt:
-            db.update_status(exp_id, 'interrupted')
-            print("Experiment Interrupted")
-            error_found = True
+            pool.terminate()
+            pool.join()
+            interrupt_started(started)
+            raise
         finally:
-            if line_buffer != '':
-                db.update_std(exp_id, line_buffer, std_type='stdout')
-            line_buffer = ''
-            for line in p.stderr:
-                print_out = line.decode('utf-8')
-                monitored = capture_value(print_out)
-                if monitored is not None:
-                    db.update_monitored(exp_id, monitored[0], monitored[1])
-                else:
-                    line_buffer += print_out
-                    print(print_out)
-                if 'Error' in print_out:
-                    error_found = True
-                    db.update_status(exp_id, 'error')
-                    print("Experiment Failed")
-
-            if line_buffer != '':
-                db.update_std(exp_id, line_buffer, std_type='stderr')
-            if not error_found:
-                db.update_status(exp_id, 'completed')
-                print("Experiment Done")
+            pool.terminate()
+    exp_ids = []
+    for result in results:
+        try:
+            exp_ids.append(result.get())
+        except Exception as error:
+            print("Variant Failed: {}".format(error))
+    return exp_ids
 
 
 def get(_id: int) -> dict:
@@ -154,19 +468,74 @@ def get(_id: int) -> dict:
     return experiment
 
 
-def list_experiments(*, query: ExperimentQuery) -> list:
+def get_series(_id, metric: str) -> Series:
+    """Return the series of a monitored metric of an experiment
+
+    Args:
+        _id: the id of the experiment
+        metric (str): the name of the monitored metric
+
+    Returns:
+        Series: a namedtuple with the step, timestamp and value NumPy arrays of the metric
+
+    """
+    with setup_database() as db:
+        series = db.get_series(_id, metric)
+    return series
+
+
+def read_log(_id, std_type: str, start: int = 0, end: int = None) -> str:
+    """Return part of the stdout or stderr of an experiment
+
+    Args:
+        _id: the id of the experiment
+        std_type (str): stdout or stderr
+        start (int): the byte offset where the part starts
+        end (int): Optional, the byte offset where the part ends. If it is None the rest of the log is returned
+
+    Returns:
+        str: the part of the log
+    """
+    with setup_database() as db:
+        log = db.read_log(_id, std_type, start=start, end=end)
+    return log
+
+
+def tail_log(_id, std_type: str, lines: int = 10) -> str:
+    """Return the last lines of the stdout or stderr of an experiment"""
+    with setup_database() as db:
+        log = db.tail_log(_id, std_type, lines=lines)
+    return log
+
+
+def list_experiments(*, query: ExperimentQuery, load_logs: bool = False) -> list:
     """return a list of experiment documents either based on ids or based on tags
 
     Args:
         query: ExperimentQuery with ids, tags, query_type schema and params_schema
+        load_logs (bool): read the stdout and stderr of experiments that are kept in the log store
     Returns:
             list: A list of dicts with each dict being an experiment document
     """
     with setup_database() as db:
-        results = db.list_experiments(query=query)
+        results = db.list_experiments(query=query, load_logs=load_logs)
     return results
 
 
+def iter_experiments(*, query: ExperimentQuery, load_logs: bool = False, page_size: int = PAGE_SIZE):
+    """yield the experiment documents that match the query as they are read from the db
+
+    Args:
+        query: ExperimentQuery with ids, tags, query_type schema and params_schema
+        load_logs (bool): read the stdout and stderr of experiments that are kept in the log store
+        page_size (int): the number of documents read from the db per request
+    Yields:
+            dict: an experiment document
+    """
+    with setup_database() as db:
+        yield from db.iter_experiments(query=query, page_size=page_size, load_logs=load_logs)
+
+
 def list_multi_stage_experiments(*, query: MultiStageExperimentQuery) -> list:
     """return a list of mse experiment documents either based on ids or based on tags
 
@@ -191,8 +560,7 @@ def list_tags() -> set:
             set: A set of all tags found in the db
     """
     with setup_database() as db:
-        results = db.list_experiments()
-    return set({tag for exp in results for tag in exp['tags']})
+        return set(db.distinct('tags'))
 
 
 def delete(_id: int, doc_type) -> None:
@@ -206,18 +574,57 @@ def delete(_id: int, doc_type) -> None:
         db.delete(_id, doc_type=doc_type)
 
 
-def count() -> int:
-    """Returns the count of all items in the database
+def count(*, query: (ExperimentQuery, MultiStageExperimentQuery) = None, doc_type: str = None) -> int:
+    """Returns the count of the items in the database that match the query
 
+    Args:
+        query: ExperimentQuery or MultiStageExperimentQuery, all items are counted without one
+        doc_type (str): experiment or multistage, defaults to the documents the query selects
     Returns:
         int: The number of items in the database
 
     """
     with setup_database() as db:
-        count = db.count()
+        count = db.count(query=query, doc_type=doc_type)
     return count
 
 
+def count_groups(*, group_by: str, query: ExperimentQuery = None) -> dict:
+    """Returns the number of experiments that match the query per value of a field
+
+    Args:
+        group_by (str): the field to group the experiments by e.g. status or name
+        query: ExperimentQuery that the counted experiments match
+    Returns:
+        dict: The number of experiments per value of the field
+    """
+    with setup_database() as db:
+        counts = db.count(query=query, group_by=group_by)
+    return counts
+
+
+def index_stats() -> dict:
+    """Returns how often every index of the database was used
+
+    Returns:
+        dict: The number of operations and the start of the count of every index per collection
+    """
+    with setup_database() as db:
+        stats = db.index_stats()
+    return stats
+
+
+def migrate() -> int:
+    """Updates the documents that older versions of jikken stored to the current layout
+
+    Returns:
+        int: The number of updated documents
+    """
+    with setup_database() as db:
+        updated = db.migrate()
+    return updated
+
+
 def delete_all() -> None:
     """deletes all items from the database """
     with setup_database() as db:
@@ -225,29 +632,11 @@ def delete_all() -> None:
 
 
 def get_best(*, query: ExperimentQuery, metric: str, optimum: str = "min"):
+    """Return the experiment with the best last value of the metric, the selection is done by the db"""
     assert optimum in ["min", "max"]
     with setup_database() as db:
-        results = db.list_experiments(query=query)
-
-    if optimum == "min":
-        default_value = sys.float_info.max
-        compare = lambda x, y: x > y
-    else:
-        default_value = sys.float_info.min
-        compare = lambda x, y: x < y
-
-    best_result = default_value
-    best_experiment = None
-    for result in results:
-        metric_values = result['monitored'].get(metric, default_value)
-        if isinstance(metric_values, list):
-            current_value = float(metric_values[-1])
-        else:
-            current_value = float(metric_values)
-        if compare(best_result, current_value):
-            best_result = current_value
-            best_experiment = result
-    return best_experiment
+        results = db.best(query, metric=metric, optimum=optimum, k=1, load_logs=True)
+    return results[0] if len(results) > 0 else None
 
 
 def export_config():
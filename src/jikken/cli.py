@@ -1,7 +1,7 @@
 import click
 import jikken.api as api
 from .setups import ExperimentSetup, MultiStageExperimentSetup
-from .data_formater import PrintExperiment
+from .resources import RESOURCE_INTERVAL
 
 
 @click.group(context_settings={'help_option_names': ['-h', '--help']})
@@ -25,7 +25,11 @@ def jikken_cli():
 @click.option('--tags', '-t', multiple=True,
               help="tags that can be used to distinguish the experiment inside the database."
                    " Multiple can be added e.g. -t org_name -t small_data -t model_1")
-def run(script_path, configuration_path, ref_path, args, tags, name):
+@click.option('--resource_interval', type=float, default=RESOURCE_INTERVAL,
+              help="seconds between samples of the cpu, memory and io used by the script, e.g. 5. "
+                   "The resources are not sampled if it is not given")
+@click.option('--force', '-f', is_flag=True, help="run the script even if the same experiment has already completed")
+def run(script_path, configuration_path, ref_path, args, tags, name, resource_interval, force):
     """Runs an experiment"""
     setup = ExperimentSetup(
         name=name,
@@ -33,9 +37,53 @@ def run(script_path, configuration_path, ref_path, args, tags, name):
         configuration_path=configuration_path,
         args=args,
         tags=tags,
-        reference_configuration_path=ref_path
+        reference_configuration_path=ref_path,
+        resource_interval=resource_interval
     )
-    api.run(setup=setup)
+    api.run(setup=setup, force=force)
+
+
+@jikken_cli.command(
+    help="run a grid or random search over the configuration. e.g. jikken sweep script.py -c config.yaml -s sweep.yaml")
+@click.argument('script_path', type=click.Path(exists=True, file_okay=True, dir_okay=False))
+@click.option('--configuration_path', '-c', required=True, type=click.Path(exists=True, file_okay=True, dir_okay=True),
+              help="A file or a directory with files that hold the variables that define the experiment")
+@click.option('--sweep_path', '-s', required=True, type=click.Path(exists=True, file_okay=True, dir_okay=True),
+              help="A file or a directory that mirrors the configuration with lists of values to sweep over")
+@click.option('--name', '-n', required=True, type=str, help="the experiment name")
+@click.option('--ref_path', '-r', required=False, type=click.Path(exists=True, file_okay=True, dir_okay=True),
+              default=None,
+              help="A file or a directory with files that hold the variables that define the experiment")
+@click.option('--args', '-a', multiple=True,
+              help="extra arguments that can be passed to the script multiple can be added,"
+                   "e.g. -a a=2 -a batch_size=63 -a early_stopping=False")
+@click.option('--tags', '-t', multiple=True,
+              help="tags that can be used to distinguish the experiment inside the database."
+                   " Multiple can be added e.g. -t org_name -t small_data -t model_1")
+@click.option('--samples', type=int, default=None,
+              help="run a random search with this number of samples instead of the whole grid")
+@click.option('--seed', type=int, default=None, help="the seed of the random search")
+@click.option('--workers', '-w', type=int, default=1, help="the number of experiments that run at the same time")
+@click.option('--pin/--no-pin', default=False, help="pin every worker to its own share of the cpus")
+@click.option('--force', '-f', is_flag=True, help="run the variants that have already completed again")
+@click.option('--resource_interval', type=float, default=RESOURCE_INTERVAL,
+              help="seconds between samples of the cpu, memory and io used by the script, e.g. 5. "
+                   "The resources are not sampled if it is not given")
+def sweep(script_path, configuration_path, sweep_path, ref_path, args, tags, name, samples, seed, workers, pin, force,
+          resource_interval):
+    """Runs a parameter sweep"""
+    setup = ExperimentSetup(
+        name=name,
+        script_path=script_path,
+        configuration_path=configuration_path,
+        args=args,
+        tags=tags,
+        reference_configuration_path=ref_path,
+        resource_interval=resource_interval
+    )
+    exp_ids = api.sweep(setup=setup, sweep_path=sweep_path, samples=samples, seed=seed, workers=workers,
+                        pin_cpus=pin, force=force)
+    print("experiments run: {}".format(len(exp_ids)))
 
 
 @jikken_cli.group(
@@ -62,7 +110,11 @@ def stage():
 @click.option('--tags', '-t', multiple=True,
               help="tags that can be used to distinguish the experiment inside the database."
                    " Multiple can be added e.g. -t org_name -t small_data -t model_1")
-def run(script_path, input_dir, output_dir, configuration_path, ref_path, args, tags, name, stage_name):
+@click.option('--resource_interval', type=float, default=RESOURCE_INTERVAL,
+              help="seconds between samples of the cpu, memory and io used by the script, e.g. 5. "
+                   "The resources are not sampled if it is not given")
+def run(script_path, input_dir, output_dir, configuration_path, ref_path, args, tags, name, stage_name,
+        resource_interval):
     setup = MultiStageExperimentSetup(script_path=script_path,
                                       input_path=input_dir,
                                       output_path=output_dir,
@@ -71,7 +123,8 @@ def run(script_path, input_dir, output_dir, configuration_path, ref_path, args,
                                       args=args,
                                       tags=tags,
                                       name=name,
-                                      stage_name=stage_name
+                                      stage_name=stage_name,
+                                      resource_interval=resource_interval
                                       )
     api.run_stage(setup=setup)
 
@@ -91,7 +144,10 @@ def run(script_path, input_dir, output_dir, configuration_path, ref_path, args,
 @click.option('--tags', '-t', multiple=True,
               help="tags that can be used to distinguish the experiment inside the database."
                    " Multiple can be added e.g. -t org_name -t small_data -t model_1")
-def resume(script_path, input_dir, output_dir, configuration_path, ref_path, args, tags):
+@click.option('--resource_interval', type=float, default=RESOURCE_INTERVAL,
+              help="seconds between samples of the cpu, memory and io used by the script, e.g. 5. "
+                   "The resources are not sampled if it is not given")
+def resume(script_path, input_dir, output_dir, configuration_path, ref_path, args, tags, resource_interval):
     setup = MultiStageExperimentSetup(script_path=script_path,
                                       input_path=input_dir,
                                       output_path=output_dir,
@@ -100,11 +156,18 @@ def resume(script_path, input_dir, output_dir, configuration_path, ref_path, arg
                                       args=args,
                                       tags=tags,
                                       name="",
-                                      stage_name=""
+                                      stage_name="",
+                                      resource_interval=resource_interval
                                       )
     api.resume_stage(setup=setup)
 
 
+def unprinted_fields(stdout: bool, stderr: bool, var: bool, monitored: bool) -> list:
+    """Return the fields of the experiments that are not printed, they are not read from the db"""
+    printed = {"stdout": stdout, "stderr": stderr, "variables": var, "monitored": monitored, "series": False}
+    return [field for field, is_printed in sorted(printed.items()) if not is_printed]
+
+
 @jikken_cli.group(context_settings={'help_option_names': ['-h', '--help']},
                   help="Retrieve list of experiments from db matching a query")
 def list():
@@ -137,9 +200,11 @@ def exp(ids, query, tags, names, schema, param_schema, status, stdout, stderr, v
         schema_hashes=schema,
         schema_param_hashes=param_schema,
         query_type=query,
-        status=status
+        status=status,
+        exclude=unprinted_fields(stdout, stderr, var, monitored)
     )
-    results = api.list_experiments(query=query)
+    results = api.iter_experiments(query=query, load_logs=stdout or stderr)
+    from .data_formater import PrintExperiment
     pe = PrintExperiment(stdout=stdout, stderr=stderr, variables=var, git=git, monitored=monitored)
     for res in results:
         pe.print_experiment(res)
@@ -178,6 +243,7 @@ def best(ids, query, tags, names, schema, param_schema, status, stdout, stderr,
     )
     best_result = api.get_best(query=query, optimum=optimum, metric=metric)
     if best_result is not None:
+        from .data_formater import PrintExperiment
         pe = PrintExperiment(stdout=stdout, stderr=stderr, variables=var, git=git, monitored=monitored)
         pe.print_experiment(best_result)
     else:
@@ -203,10 +269,12 @@ def mse(ids, query, names, hashes, steps, stdout, stderr, var, git, monitored):
         ids=ids,
         hashes=hashes,
         query_type=query,
-        steps=steps
+        steps=steps,
+        exclude=unprinted_fields(stdout, stderr, var, monitored)
     )
     results = api.list_multi_stage_experiments(query=query)
 
+    from .data_formater import PrintExperiment
     pe = PrintExperiment(stdout=stdout, stderr=stderr, variables=var, git=git, monitored=monitored)
     for res in results:
         pe.print_experiment(res)
@@ -218,19 +286,55 @@ def tags():
     print("tags".center(100), tags, sep='\n')
 
 
-@list.command(help="Return total number of experiments in db or number that match tags query")
+@list.command(help="Return total number of items in db or number of experiments that match the query")
 @click.option('--tags', '-t', multiple=True, help="tags that describe experiment")
 @click.option('--query', '-q', type=click.Choice(['all', 'any']), default='all', help="the type of query")
 @click.option('--names', '-n', multiple=True, help="experiment names that need to be matched")
-def count(tags, query, names):
-    if len(tags) == 0 or len(names) == 0:
-        count = api.count()
-    else:
-        query = api.ExperimentQuery(ids=[], names=names, tags=tags, query_type=query)
-        count = len(api.list(query=query))
+@click.option('--status', type=click.Choice(["running", "error", "interrupted", "completed"]), multiple=True,
+              help="status of the experiment")
+@click.option('--group_by', '-g', type=str, default=None,
+              help="count the experiments per value of this field e.g. status or name")
+def count(tags, query, names, status, group_by):
+    query = api.ExperimentQuery(names=names, tags=tags, status=status, query_type=query)
+    if group_by is not None:
+        for value, count in sorted(api.count_groups(group_by=group_by, query=query).items(), key=lambda x: str(x[0])):
+            print("{}: {}".format(value, count))
+        return
+    count = api.count(query=None if query.is_empty() else query)
     print("number of items: {}".format(count))
 
 
+@jikken_cli.group(context_settings={'help_option_names': ['-h', '--help']},
+                  help="Inspect the database")
+def db():
+    """Run the db command"""
+    pass
+
+
+@db.command(help="print how often every index of the db was used")
+def indexes():
+    stats = api.index_stats()
+    if len(stats) == 0:
+        print("the db has no secondary indexes")
+    for collection, collection_stats in sorted(stats.items()):
+        print(collection.center(100))
+        for name, usage in sorted(collection_stats.items()):
+            print("{}: {} ops since {}".format(name, usage["ops"], usage["since"]))
+
+
+@db.command(help="update the documents stored by older versions of jikken")
+def migrate():
+    print("migrated {} documents".format(api.migrate()))
+
+
+@jikken_cli.command(help="print the last lines of the stdout or stderr of an experiment. e.g. jikken tail 1 -l 20")
+@click.argument('exp_id', type=str)
+@click.option('--lines', '-l', type=int, default=10, help="the number of lines to print")
+@click.option('--stderr', is_flag=True, default=False, help="print the stderr instead of the stdout")
+def tail(exp_id, lines, stderr):
+    print(api.tail_log(exp_id, 'stderr' if stderr else 'stdout', lines=lines), end='')
+
+
 def abort_if_false(ctx, param, value):
     if not value:
         ctx.abort()
@@ -1,2 +1,4 @@
 from .config import get_config
-from .database import setup_database, DataBase, ExperimentQuery, MultiStageExperimentQuery
+from .database import setup_database, close_databases, DataBase, ExperimentQuery, MultiStageExperimentQuery, PAGE_SIZE
+from .writer import BatchWriter
+from .series import Series
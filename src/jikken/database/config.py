@@ -2,8 +2,9 @@ import os
 from collections import namedtuple
 from configparser import ConfigParser
 
-JikkenConfig = namedtuple("JikkenConfig", ['db_path', 'db_type', 'db_name'])
-JikkenConfig.__new__.__defaults__ = ("~/.jikken/jikken_db", "tiny", "jikken")
+JikkenConfig = namedtuple("JikkenConfig", ['db_path', 'db_type', 'db_name', 'log_path', 'refresh'])
+JikkenConfig.__new__.__defaults__ = ("~/.jikken/jikken_db", "tiny", "jikken", None, "wait_for")
+REFRESH_POLICIES = ("false", "wait_for", "true")  # when es makes the documents it writes visible to searches
 
 DEFAULT_FILE = \
     """
@@ -29,7 +30,11 @@ def read_config(config_file):
     parser.read(config_file)
     db_path = os.path.expanduser(parser['db']['path'])
     db_type = parser['db']['type']
-    return JikkenConfig(db_type=db_type, db_path=db_path)
+    log_path = os.path.expanduser(parser['logs']['path']) if parser.has_option('logs', 'path') else None
+    refresh = parser['db'].get('refresh', 'wait_for')
+    if refresh not in REFRESH_POLICIES:
+        raise ValueError("refresh {} is not one of {}".format(refresh, ", ".join(REFRESH_POLICIES)))
+    return JikkenConfig(db_type=db_type, db_path=db_path, log_path=log_path, refresh=refresh)
 
 
 def get_config(config_file=None):
@@ -1,5 +1,7 @@
+import atexit
 import os
 from contextlib import contextmanager
+from threading import Lock
 
 from .query import ExperimentQuery, MultiStageExperimentQuery
 
@@ -7,42 +9,88 @@ from jikken.experiment import Experiment
 from jikken.multistage import MultiStageExperiment
 
 from .config import get_config, JikkenConfig
+from .logs import LogStore, log_directory
+from .series import Series
+PAGE_SIZE = 100  # the number of documents read per request while iterating over the results of a query
 
 
-class Singleton(type):
+class HandleRegistry(type):
+    """Keep one DataBase per config in the process
+
+    DataBase(config) returns the handle that was created for an equal config, so its connection is reused
+    across calls. A process started with fork gets its own handles instead of sharing the parent's clients.
+    The handles are disconnected when the process exits, the exit hook is registered with the first handle.
+    """
+
     def __init__(self, *args, **kwargs):
-        self._instance = None
-        super(Singleton, self).__init__(*args, **kwargs)
-
-    def __call__(self, *args, **kwargs):
-        if self._instance is None:
-            self._instance = super(Singleton, self).__call__(*args, **kwargs)
-            return self._instance
-        elif self._instance.db != kwargs['config'].db_type:
-            self._instance = super(Singleton, self).__call__(*args, **kwargs)
-            return self._instance
-        else:
-            return self._instance
+        self._instances = {}
+        self._pid = os.getpid()
+        self._lock = Lock()
+        self._closes_at_exit = False
+        super(HandleRegistry, self).__init__(*args, **kwargs)
+
+    def __call__(self, config: JikkenConfig):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._instances, self._pid = {}, os.getpid()
+            if config not in self._instances:
+                self._instances[config] = super(HandleRegistry, self).__call__(config=config)
+                if not self._closes_at_exit:
+                    atexit.register(self.close_all)
+                    self._closes_at_exit = True
+            return self._instances[config]
 
+    def is_open(self, config: JikkenConfig) -> bool:
+        return self._pid == os.getpid() and config in self._instances
 
-class DataBase(metaclass=Singleton):
+    def close_all(self) -> None:
+        """Disconnect and forget every handle of the process"""
+        with self._lock:
+            instances, self._instances = self._instances, {}
+            if self._pid == os.getpid():
+                for instance in instances.values():
+                    instance.stop_db()
+
+
+class DataBase(metaclass=HandleRegistry):
     def __init__(self, config: JikkenConfig):
+        """The database is connected on first use, see HandleRegistry for how handles are shared"""
+        self.config = config
         self.db = config.db_type
+        if config.db_type not in ['tiny', 'sqlite', 'mongo', 'es']:
+            raise ValueError("db_type must be a 'tiny', 'sqlite', 'mongo' or 'es'")
+        self._backend = None
+        self._connect_lock = Lock()
+        self._logs = None if config.log_path is None else \
+            LogStore(log_directory(config.log_path, config.db_type, config.db_path, config.db_name))
+
+    @property
+    def _database(self):
+        if self._backend is None:
+            with self._connect_lock:
+                if self._backend is None:
+                    self._backend = self._connect()
+        return self._backend
+
+    def _connect(self):
+        config = self.config
         if config.db_type == 'tiny':
             os.makedirs(config.db_path, exist_ok=True)
             from .db_tinydb import TinyDB
-            self._database = TinyDB(config.db_path, config.db_name)
+            backend = TinyDB(config.db_path, config.db_name)
+        elif config.db_type == 'sqlite':
+            os.makedirs(config.db_path, exist_ok=True)
+            from .db_sqlite import SQLiteDB
+            backend = SQLiteDB(config.db_path, config.db_name)
         elif config.db_type == 'mongo':
             from .db_mongo import MongoDB
-            self._database = MongoDB(config.db_path, config.db_name)
-        elif config.db_type == 'es':
-            from .db_es import ElasticSearchDB
-            self._database = ElasticSearchDB(config.db_path, config.db_name)
+            backend = MongoDB(config.db_path, config.db_name)
         else:
-            raise ValueError("db_type must be a 'tiny' or 'mongo'")
-
-        if self._database is None:
+            from .db_es import ElasticSearchDB
+            backend = ElasticSearchDB(config.db_path, config.db_name, refresh=config.refresh)
+        if backend is None:
             raise ConnectionError("could not connect to database")
+        return backend
 
     def add(self, data_object: (Experiment, MultiStageExperiment)) -> int:
         if isinstance(data_object, Experiment):
@@ -50,48 +98,167 @@ class DataBase(metaclass=Singleton):
             return self._database.add(data_object.to_dict())
         elif isinstance(data_object, MultiStageExperiment):
             multistage_dict = data_object.to_dict()
+            stored_ids = [exp.doc_id for _, exp in data_object if exp.doc_id is not None]
+            stored = {_id: doc for _id, doc in zip(stored_ids, self._database.get_many(stored_ids, "experiment"))}
+            new_steps = [(step, exp) for step, exp in data_object if stored.get(exp.doc_id) is None]
+            new_ids = dict(zip([step for step, _ in new_steps],
+                               self._database.add_many([exp.to_dict() for _, exp in new_steps])))
             for step, exp in data_object:
-                exp_dict = None
-                if exp.doc_id is not None:
-                    exp_dict = self._database.get(exp.doc_id, "experiment")
-                if exp_dict is None:
-                    _id = self._database.add(exp.to_dict())
-                else:
-                    _id = exp.doc_id
+                _id = new_ids.get(step, exp.doc_id)
                 step_index = data_object.step_index(step)
                 multistage_dict['experiments'][step_index] = (step, _id)
             return self._database.add(multistage_dict)
         else:
             raise TypeError("experiment {} was not Experiment|multistage".format(type(data_object)))
 
+    def add_many(self, experiments: list) -> list:
+        """Add experiments with as few requests as the backend allows and return their ids in the same order"""
+        return self._database.add_many([experiment.to_dict() for experiment in experiments])
+
     def get(self, doc_id: int, doc_type: str) -> dict:  # type (int) -> dict
         """Return a experiment dict with matching id."""
         assert doc_type in self._database.collections, "doc_type {} not in db"
         doc = self._database.get(doc_id, doc_type)
         if doc["type"] == "multistage":
-            for index, (step, exp_id) in enumerate(doc["experiments"]):
-                exp = self._database.get(exp_id, "experiment")
-                doc["experiments"][index] = (step, exp)
+            self._load_stages([doc])
+        else:
+            self.load_logs(doc)
         return doc
 
-    def list_experiments(self, query: ExperimentQuery = None) -> list:  # type (str) -> list[dict]
-        """Return list of experiments."""
+    def list_experiments(self, query: ExperimentQuery = None, load_logs: bool = False) -> list:
+        """Return list of experiments.
+
+        The stdout and stderr of experiments kept in the log store are only read if load_logs is True
+        """
         query = ExperimentQuery() if query is None else query
-        return self._database.list_experiments(query=query)
+        if self._logs is not None and len(set(query.fields) & {'stdout', 'stderr'}) > 0:
+            # the logs of the log store are found through the logs field
+            query = query.with_projection(fields=query.fields + ['logs'])
+        results = self._database.list_experiments(query=query)
+        if load_logs:
+            for doc in results:
+                self.load_logs(doc)
+        return results
+
+    def iter_experiments(self, query: ExperimentQuery = None, page_size: int = PAGE_SIZE, load_logs: bool = False):
+        """Lazily yield the experiments that match the query, reading page_size of them per request
+
+        The stdout and stderr of experiments kept in the log store are only read if load_logs is True
+        """
+        query = ExperimentQuery() if query is None else query
+        if self._logs is not None and len(set(query.fields) & {'stdout', 'stderr'}) > 0:
+            query = query.with_projection(fields=query.fields + ['logs'])
+        for doc in self._database.iter_experiments(query, page_size=page_size):
+            if load_logs:
+                self.load_logs(doc)
+            yield doc
+
+    def best(self, query: ExperimentQuery = None, *, metric: str, optimum: str = "min", k: int = 1,
+             load_logs: bool = False) -> list:
+        """Return the k experiments that match the query with the best last value of the metric, best first
+
+        The selection is done by the backend, experiments without a real number as the last value of the
+        metric are skipped
+        """
+        assert optimum in ["min", "max"], "optimum {} is not min or max".format(optimum)
+        query = ExperimentQuery() if query is None else query
+        results = self._database.best(query, metric, optimum=optimum, k=k)
+        if load_logs:
+            for doc in results:
+                self.load_logs(doc)
+        return results
+
+    def find_completed(self, experiment: Experiment) -> (dict, None):
+        """Return a completed experiment with the same hash (name, parameters and commit) or None
+
+        The hash does not cover uncommitted changes, so an experiment of a dirty working tree is never found
+        """
+        if experiment.commit_status:
+            return None
+        query = ExperimentQuery(hashes=[experiment.hash], status=["completed"])
+        results = self._database.list_experiments(query=query)
+        return results[0] if len(results) > 0 else None
+
+    def load_logs(self, doc: dict) -> dict:
+        """Fill the stdout and stderr of an experiment document from the log store
+
+        Logs that were left out of the document by a projection are not read
+        """
+        for std_type, log in doc.get('logs', {}).items():
+            if std_type in doc:
+                doc[std_type] = self._log_store().read(doc['id'], std_type)
+        return doc
+
+    def read_log(self, experiment_id, std_type: str, start: int = 0, end: int = None) -> str:
+        """Return the part of the stdout or stderr of an experiment between the byte offsets start and end"""
+        if self._logs is not None and self._logs.size(experiment_id, std_type) > 0:
+            return self._logs.read(experiment_id, std_type, start=start, end=end)
+        log = self._database.get(experiment_id, "experiment")[std_type].encode('utf-8')
+        return log[start:end].decode('utf-8', errors='replace')
+
+    def tail_log(self, experiment_id, std_type: str, lines: int = 10) -> str:
+        """Return the last lines of the stdout or stderr of an experiment"""
+        if self._logs is not None and self._logs.size(experiment_id, std_type) > 0:
+            return self._logs.tail(experiment_id, std_type, lines=lines)
+        log = self._database.get(experiment_id, "experiment")[std_type]
+        tail_lines = log.rstrip("\n").split("\n")[-lines:] if lines > 0 and log != "" else []
+        return "\n".join(tail_lines) + ("\n" if log.endswith("\n") and len(tail_lines) > 0 else "")
+
+    def _log_store(self) -> LogStore:
+        if self._logs is None:
+            raise ValueError("experiment logs are in the log store but no logs path is configured")
+        return self._logs
 
     def list_ms_experiments(self, query: MultiStageExperimentQuery = None) -> list:
         query = MultiStageExperimentQuery() if query is None else query
         results = self._database.list_ms_experiments(query=query)
-        for doc in results:
-            for index, (step, exp_id) in enumerate(doc['experiments']):
-                exp = self._database.get(exp_id, "experiment")
-                doc["experiments"][index] = (step, exp)
+        self._load_stages(results, fields=query.fields, exclude=query.exclude)
         return results
 
-    def count(self) -> int:  # type () -> int
-        """Return number of experiments in db."""
-        # TODO add ability to return count of experiments, multistage experiments or everything
-        return self._database.count()
+    def get_many(self, doc_ids: list, doc_type: str = "experiment", fields: list = None,
+                 exclude: list = None) -> list:
+        """Return the documents of doc_ids in the same order with a single request, None for missing ones
+
+        Only fields or every field except exclude are returned if they are given
+        """
+        assert doc_type in self._database.collections, "doc_type {} not in db"
+        return self._database.get_many(list(doc_ids), doc_type, fields=fields, exclude=exclude)
+
+    def _load_stages(self, multistage_docs: list, fields: list = None, exclude: list = None) -> None:
+        """Replace the experiment ids of the stages of multistage documents with the experiments"""
+        exp_ids = [exp_id for doc in multistage_docs for _, exp_id in doc["experiments"]]
+        experiments = iter(self._database.get_many(exp_ids, "experiment", fields=fields, exclude=exclude))
+        for doc in multistage_docs:
+            doc["experiments"] = [(step, next(experiments)) for step, _ in doc["experiments"]]
+
+    def count(self, query: (ExperimentQuery, MultiStageExperimentQuery) = None, doc_type: str = None,
+              group_by: str = None) -> (int, dict):
+        """Return number of documents in db.
+
+        Only the documents of doc_type that match the query are counted, the doc_type of a query defaults to
+        the documents it selects. Every experiment and multistage experiment is counted without either.
+        With group_by the experiments that match the query are counted per value of that field
+        """
+        if group_by is not None:
+            return self._database.group_count(group_by, ExperimentQuery() if query is None else query)
+        if doc_type is None and query is not None:
+            doc_type = "multistage" if isinstance(query, MultiStageExperimentQuery) else "experiment"
+        return self._database.count(query, doc_type)
+
+    def index_stats(self) -> dict:
+        """Return the number of operations that used every index of the db per collection"""
+        return self._database.index_stats()
+
+    def migrate(self) -> int:
+        """Update the documents stored by older versions of jikken, returns how many were updated"""
+        return self._database.migrate()
+
+    def distinct(self, field: str, query: ExperimentQuery = None) -> list:
+        """Return the distinct values of a field of the experiments that match the query
+
+        The elements of list fields like tags are returned one by one
+        """
+        return self._database.distinct(field, ExperimentQuery() if query is None else query)
 
     def update(self, experiment_id: int, experiment: Experiment) -> None:
         """Modify experiment in db with given experiment_id."""
@@ -99,10 +266,17 @@ class DataBase(metaclass=Singleton):
 
     def update_std(self, experiment_id, string, std_type):
         """Update the std tag with new data"""
-        if std_type in ['stdout', 'stderr']:
+        if std_type not in ['stdout', 'stderr']:
+            raise ValueError("std_type was not stdout or stderr")
+        elif self._logs is None:
             self._database.update_key(experiment_id, string, std_type, mode='add')
         else:
-            raise ValueError("std_type was not stdout or stderr")
+            size = self._logs.append(experiment_id, std_type, string)
+            self._database.update_key(experiment_id, {"bytes": size}, ['logs', std_type], mode='set')
+
+    def update_std_batch(self, experiment_id, strings: list, std_type):
+        """Append a batch of strings to the std tag with a single update"""
+        self.update_std(experiment_id, "".join(strings), std_type)
 
     def update_status(self, experiment_id: int, status: str):
         "udpate the status of the experiment"
@@ -111,40 +285,93 @@ class DataBase(metaclass=Singleton):
         else:
             raise ValueError("status: {} not correct".format(status))
 
-    def update_monitored(self, experiment_id, key, value):
-        exp = self._database.get(experiment_id, collection="experiment")
-        if key not in exp['monitored']:
-            self._database.update_key(experiment_id, value=[value], key=['monitored', key], mode='set')
-        else:
-            self._database.update_key(experiment_id, value=[value], key=['monitored', key], mode='add')
+    def update_monitored(self, experiment_id, key, value, step: int = None, timestamp: float = None):
+        """Append a value to a monitored key, the key is created by the backend if it is missing"""
+        self.update_monitored_batch(experiment_id, key, [value], steps=[step], timestamps=[timestamp])
+
+    def update_monitored_batch(self, experiment_id, key, values: list, steps: list = None, timestamps: list = None):
+        """Append a batch of values to a monitored key with their steps and timestamps in a single update
+
+        Missing steps are stored as NO_STEP and missing timestamps as None
+        """
+        self._database.append_monitored(experiment_id, key, list(values), steps=steps, timestamps=timestamps)
+
+    def get_series(self, experiment_id, metric: str) -> Series:
+        """Return the step, timestamp and value NumPy arrays of the numeric values of a monitored metric
+
+        Values stored before their steps and timestamps were kept get NO_STEP and nan
+        """
+        return self._database.get_series(experiment_id, metric)
 
     def delete(self, experiment_id, doc_type="experiment"):  # type (int) -> ()
         """Remove a experiment from db with given experiment_id."""
         if doc_type == "experiment":
             self._database.delete(experiment_id)
+            exp_ids = [experiment_id]
         elif doc_type == "multistage":
+            exp_ids = [] if self._logs is None else \
+                [exp_id for _, exp_id in self._database.get(experiment_id, "multistage")["experiments"]]
             self._database.delete_mse(experiment_id)
         else:
             raise ValueError("doc_type {} not supported".format(doc_type))
+        if self._logs is not None:
+            for exp_id in exp_ids:
+                self._logs.delete(exp_id)
+
+    def delete_many(self, experiment_ids: list) -> None:
+        """Remove the experiments of experiment_ids with as few requests as the backend allows."""
+        self._database.delete_many(list(experiment_ids))
+        if self._logs is not None:
+            for exp_id in experiment_ids:
+                self._logs.delete(exp_id)
 
     def delete_all(self):
         """Remove all experiments from db."""
         self._database.delete_all()
+        if self._logs is not None:
+            self._logs.delete_all()
+
+    def flush(self) -> None:
+        """Write the changes the backend buffers in memory"""
+        if self._backend is not None:
+            self._backend.flush()
 
     def stop_db(self):
-        """Disconnect from DB."""
-        self._database.stop_db()
+        """Disconnect from DB, the handle connects again the next time it is used."""
+        with self._connect_lock:
+            backend, self._backend = self._backend, None
+        if backend is not None:
+            backend.stop_db()
+
+
+_configs = {}  # the config read from every config file, with the modification time of the file
+
+
+def load_config(config_path: str) -> JikkenConfig:
+    """Return the config of a file, it is only read again if the file changed"""
+    mtime = os.path.getmtime(config_path) if os.path.exists(config_path) else None
+    if config_path not in _configs or _configs[config_path][0] != mtime or mtime is None:
+        _configs[config_path] = (mtime, get_config(config_path))
+    return _configs[config_path][1]
+
+
+def close_databases() -> None:
+    """Disconnect every database handle of the process"""
+    DataBase.close_all()
 
 
 @contextmanager
 def setup_database():
-    config_path = os.path.join(os.getcwd(), ".jikken", "config")
-    _database = None
-    try:
-        config = get_config(config_path)
+    """Yield the database handle of the config in the working directory
+
+    The handle is shared by every call in the process and stays connected after the block, use
+    close_databases to disconnect. The changes the backend buffers are written when the block ends.
+    """
+    config = load_config(os.path.join(os.getcwd(), ".jikken", "config"))
+    if not DataBase.is_open(config):
         print(config)
-        _database = DataBase(config)
-        yield _database
+    db = DataBase(config)
+    try:
+        yield db
     finally:
-        _database.stop_db()
-        _database = None
+        db.flush()
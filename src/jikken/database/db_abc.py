@@ -1,7 +1,8 @@
 from abc import ABCMeta, abstractmethod
 from typing import Any
 
-from .database import ExperimentQuery, MultiStageExperimentQuery
+from .database import ExperimentQuery, MultiStageExperimentQuery, PAGE_SIZE
+from .series import Series, decode_series, series_columns
 
 from enum import Enum
 
@@ -24,16 +25,57 @@ class DB(metaclass=ABCMeta):
     def get(self, doc_id: int, collection: str) -> dict:
         pass
 
+    @abstractmethod
+    def get_many(self, doc_ids: list, collection: str, fields: list = None, exclude: list = None) -> list:
+        """Return the documents of doc_ids in the same order with a single request, None for missing ones
+
+        Only fields or every field except exclude are returned if they are given
+        """
+        pass
+
     @abstractmethod
     def list_experiments(self, query: ExperimentQuery) -> dict:
         pass
 
+    @abstractmethod
+    def iter_experiments(self, query: ExperimentQuery, page_size: int = PAGE_SIZE):
+        """Lazily yield the experiments that match the query, reading page_size documents per request"""
+        pass
+
+    @abstractmethod
+    def best(self, query: ExperimentQuery, metric: str, optimum: str = "min", k: int = 1) -> list:
+        """Return the k experiments that match the query with the best last value of the metric, best first
+
+        Experiments whose last value of the metric is missing or not a real number are skipped
+        """
+        pass
+
     @abstractmethod
     def list_ms_experiments(self, query: MultiStageExperimentQuery) -> dict:
         pass
 
     @abstractmethod
-    def count(self) -> int:
+    def count(self, query: (ExperimentQuery, MultiStageExperimentQuery) = None, collection: str = None) -> int:
+        """Return the number of documents of the collection that match the query without reading them
+
+        Every document of every collection is counted if no collection is given
+        """
+        pass
+
+    @abstractmethod
+    def distinct(self, field: str, query: ExperimentQuery) -> list:
+        """Return the distinct values of a field of the experiments that match the query
+
+        The elements of list fields like tags are returned one by one
+        """
+        pass
+
+    @abstractmethod
+    def group_count(self, field: str, query: ExperimentQuery) -> dict:
+        """Return the number of experiments that match the query per value of a field
+
+        An experiment is counted once for every element of a list field like tags
+        """
         pass
 
     @abstractmethod
@@ -56,6 +98,65 @@ class DB(metaclass=ABCMeta):
     def delete_all(self) -> None:
         pass
 
+    def flush(self) -> None:
+        """Write the changes that the backend buffers, backends that write through have none"""
+        pass
+
+    def extend_many(self, experiment_id: int, extensions: list) -> None:
+        """Extend the list field of every (key, values) of extensions, backends that can use one update"""
+        for key, values in extensions:
+            self.update_key(experiment_id, values, key, mode='extend')
+
+    def append_monitored(self, experiment_id: int, key: str, values: list, steps: list = None,
+                         timestamps: list = None) -> None:
+        """Append values to a monitored key and their steps and timestamps to the series of the key in one update
+
+        Every value is stored once, in monitored, which best, the last values of elasticsearch and the
+        experiment views read. The series only adds a step and a timestamp column that are extended in
+        place, so a batch of one value adds a few bytes instead of a new chunk. Packing the columns into
+        typed, compressed arrays would only pay off for batches of hundreds of points, while the writer
+        flushes every second and mostly sends a handful, so they are converted to NumPy arrays on read
+        """
+        columns = series_columns(values, steps, timestamps)
+        self.extend_many(experiment_id, [(['monitored', key], values),
+                                         (['series', key, 'step'], columns["step"]),
+                                         (['series', key, 'timestamp'], columns["timestamp"])])
+
+    def get_series(self, experiment_id: int, key: str) -> Series:
+        """Return the series of a monitored key, only the key is read"""
+        exp = self.get_many([experiment_id], "experiment", fields=["series." + key, "monitored." + key])[0]
+        if exp is None:
+            raise KeyError("experiment {} not found".format(experiment_id))
+        return decode_series(exp.get('monitored', {}).get(key, []), exp.get('series', {}).get(key))
+
+    def add_many(self, docs: list) -> list:
+        """Add the documents and return their ids in the same order, backends with a bulk api use one request"""
+        return [self.add(doc) for doc in docs]
+
+    def delete_many(self, experiment_ids: list) -> None:
+        """Remove the experiments of experiment_ids, backends with a bulk api use one request"""
+        for experiment_id in experiment_ids:
+            self.delete(experiment_id)
+
+    def index_stats(self) -> dict:
+        """Return the usage of the secondary indexes per collection, empty for backends without them"""
+        return {}
+
+    def migrate(self) -> int:
+        """Update the documents stored by older versions to the current layout, returns how many were updated
+
+        It is only run on request, e.g. by jikken db migrate, as it can rewrite every document
+        """
+        return 0
+
+    def iter_many(self, doc_ids: list, collection: str, page_size: int = PAGE_SIZE, fields: list = None,
+                  exclude: list = None):
+        """Yield the documents of doc_ids that exist, reading page_size of them per request"""
+        for start in range(0, len(doc_ids), page_size):
+            for doc in self.get_many(doc_ids[start:start + page_size], collection, fields=fields, exclude=exclude):
+                if doc is not None:
+                    yield doc
+
     @property
     def collections(self):
         return ["experiment", "multistage"]
@@ -1,9 +1,11 @@
 from typing import Any
 
 from elasticsearch import Elasticsearch, ConnectionError, NotFoundError
+from elasticsearch.helpers import scan, streaming_bulk
 
-from .database import ExperimentQuery, MultiStageExperimentQuery
-from .helpers import inv_map_es_experiment, map_es_experiment, nested_dict
+from .database import ExperimentQuery, MultiStageExperimentQuery, PAGE_SIZE
+from .config import REFRESH_POLICIES
+from .helpers import LAST_VALUES, inv_map_es_experiment, last_value, map_es_experiment, nested_dict
 from .db_abc import DB
 
 
@@ -36,7 +38,9 @@ def create_es_exp_query(query: ExperimentQuery):
     if len(query.schema_param_hashes) > 0:
         complex_query = add_filter_query(complex_query, key="parameter_hash", values=query.schema_param_hashes)
     if len(query.schema_hashes) > 0:
-        complex_query = add_filter_query(complex_query, key="schema_has", values=query.schema_hashes)
+        complex_query = add_filter_query(complex_query, key="schema_hash", values=query.schema_hashes)
+    if len(query.hashes) > 0:
+        complex_query = add_filter_query(complex_query, key="hash", values=query.hashes)
     if len(query.status) > 0:
         complex_query = add_filter_query(complex_query, key="status", values=query.status)
     complex_query = {"query": complex_query}
@@ -60,14 +64,204 @@ def create_es_mse_query(query: MultiStageExperimentQuery):
     return complex_query
 
 
+BULK_SIZE = 500  # the number of documents written per request of the bulk api
+GROUP_SIZE = 1000  # the number of buckets a terms aggregation returns at first
+
+KEYWORD = {"type": "keyword"}
+STORED_ONLY = {"type": "object", "enabled": False}  # kept in _source without mapping any of its keys
+NAME = {"type": "text", "fields": {"keyword": {"type": "keyword"}}}
+# the mappings of the documents of every collection, the templates install them on the indices when they are created
+MAPPINGS = {
+    "experiment": {
+        "dynamic": False,
+        "dynamic_templates": [
+            {"last_values": {"path_match": LAST_VALUES + ".*", "mapping": {"type": "double"}}},
+        ],
+        "properties": {
+            "name": NAME,
+            "type": KEYWORD,
+            "tags": KEYWORD,
+            "status": KEYWORD,
+            "hash": KEYWORD,
+            "parameter_hash": KEYWORD,
+            "schema_hash": KEYWORD,
+            # only read, never filtered or sorted on
+            "commit_id": {"type": "keyword", "doc_values": False},
+            "repo": {"type": "keyword", "doc_values": False},
+            "dirty": {"type": "boolean", "doc_values": False},
+            "stdout": {"type": "text", "index": False, "norms": False},
+            "stderr": {"type": "text", "index": False, "norms": False},
+            "variables": STORED_ONLY,
+            "monitored": STORED_ONLY,
+            "series": STORED_ONLY,
+            "logs": STORED_ONLY,
+            LAST_VALUES: {"type": "object", "dynamic": True},
+        },
+    },
+    "multistage": {
+        "dynamic": False,
+        "properties": {
+            "name": NAME,
+            "type": KEYWORD,
+            "tags": KEYWORD,
+            "hash": KEYWORD,
+            "steps": KEYWORD,
+            "experiments": STORED_ONLY,
+        },
+    },
+}
+
+
+def source_filter(fields: list = None, exclude: list = None) -> dict:
+    """Return the _source filtering arguments of a search or mget for a projection
+
+    The singular names are the ones es accepts since 6.0, the plural ones were only added in 6.6
+    """
+    if fields:
+        return {"_source_include": list(fields) + ["type"]}
+    elif exclude:
+        return {"_source_exclude": list(exclude)}
+    return {}
+
+
+def keyword_field(field: str, mapping: dict = None) -> str:
+    """Return the field to aggregate on, text fields cannot be aggregated so their keyword sub field is used
+
+    mapping is the mapping of the field in the index, by default the one of the templates. Indices that were
+    created before the templates were installed map every string, e.g. tags and status, as text
+    """
+    mapping = MAPPINGS["experiment"]["properties"].get(field, {}) if mapping is None else mapping
+    return field + ".keyword" if mapping.get("type") == "text" and "keyword" in mapping.get("fields", {}) else field
+
+
+# extends the list at the path of every extension with its value, creating the missing maps and list on the way
+EXTEND_SCRIPT = """
+for (def extension : params.extensions) {
+    def path = extension.get('path');
+    def parent = ctx._source;
+    for (int index = 0; index < path.size() - 1; index++) {
+        if (parent.get(path.get(index)) == null) {
+            parent.put(path.get(index), new HashMap());
+        }
+        parent = parent.get(path.get(index));
+    }
+    def field = path.get(path.size() - 1);
+    if (parent.get(field) == null) {
+        parent.put(field, new ArrayList(extension.get('value')));
+    } else {
+        parent.get(field).addAll(extension.get('value'));
+    }
+}
+"""
+# stores the last value of every metric of params.last next to the monitored values
+LAST_VALUES_SCRIPT = """
+if (ctx._source['""" + LAST_VALUES + """'] == null) {
+    ctx._source['""" + LAST_VALUES + """'] = new HashMap();
+}
+ctx._source['""" + LAST_VALUES + """'].putAll(params.last);
+"""
+
+
+def extend_script(extensions: list) -> dict:
+    """Return a painless script that extends the list field of every (key, values) of extensions
+
+    The keys are passed as params, so any name of a metric can be used. The last value of every monitored
+    metric is kept next to it so best can sort on it
+    """
+    script = {"source": EXTEND_SCRIPT, "lang": "painless", "params": {"extensions": [
+        {"path": key if isinstance(key, list) else [key], "value": list(values)} for key, values in extensions]}}
+    last = {key[1]: last_value(values) for key, values in extensions
+            if isinstance(key, list) and len(key) == 2 and key[0] == "monitored"}
+    if len(last) > 0:
+        script["source"] += LAST_VALUES_SCRIPT
+        script["params"]["last"] = last
+    return script
+
+
+# stores the last finite value of every monitored metric of an experiment that was indexed before they were kept
+BACKFILL_LAST_VALUES_SCRIPT = """
+Map last = new HashMap();
+if (ctx._source.monitored != null) {
+    for (def entry : ctx._source.monitored.entrySet()) {
+        def value = entry.getValue();
+        if (value instanceof List) {
+            value = value.isEmpty() ? null : value.get(value.size() - 1);
+        }
+        if (value instanceof Number && !Double.isNaN(value.doubleValue()) && !Double.isInfinite(value.doubleValue())) {
+            last.put(entry.getKey(), value.doubleValue());
+        }
+    }
+}
+ctx._source['""" + LAST_VALUES + """'] = last;
+"""
+
+
 class ElasticSearchDB(DB):
     """Wrapper class for MongoDB.
     """
 
-    def __init__(self, db_path: str, db_name: str):
+    def __init__(self, db_path: str, db_name: str, refresh: str = "wait_for"):
+        """refresh is the policy of the writes, false returns before the documents are searchable, wait_for waits
+        for the next refresh of the index and true forces one"""
+        assert refresh in REFRESH_POLICIES, "refresh {} not in {}".format(refresh, REFRESH_POLICIES)
         self._client = None
         self._db = self._connect(db_path)
         self.index = db_name
+        self.refresh = refresh
+        self._field_mappings = {}
+        self.install_templates()
+
+    def install_templates(self) -> None:
+        """Install the index templates with the mappings of every collection
+
+        They apply to the indices created afterwards, existing indices keep their dynamic mapping, so the fields
+        that are aggregated are looked up in the mapping of the index, see field_mapping
+        """
+        for collection, mapping in MAPPINGS.items():
+            self._db.indices.put_template(name=self.get_index(collection),
+                                          body={"index_patterns": [self.get_index(collection)],
+                                                "mappings": {collection: mapping}})
+
+    def migrate(self) -> int:
+        return self.backfill_last_values()
+
+    def backfill_last_values(self) -> int:
+        """Store the last values that best sorts on in the experiments that were indexed before they were kept
+
+        An index whose mapping has no last values predates them, its experiments are updated once. Returns the
+        number of updated experiments
+        """
+        try:
+            result = self._db.indices.get_mapping(index=self.get_index("experiment"))
+        except NotFoundError:
+            return 0
+        mappings = [type_mapping for index_mappings in result.values()
+                    for type_mapping in index_mappings.get("mappings", {}).values()]
+        if len(mappings) == 0 or any(LAST_VALUES in mapping.get("properties", {}) for mapping in mappings):
+            return 0
+        result = self._db.update_by_query(index=self.get_index("experiment"), conflicts="proceed", refresh=True,
+                                          body={"script": {"source": BACKFILL_LAST_VALUES_SCRIPT, "lang": "painless"}})
+        return result.get("updated", 0)
+
+    def field_mapping(self, field: str, collection: str = "experiment") -> (dict, None):
+        """Return the mapping of a field in the index of the collection, None if the field or index is missing
+
+        The mapping of a field does not change once it exists, so it is asked once and kept until the indices
+        are deleted
+        """
+        if (collection, field) in self._field_mappings:
+            return self._field_mappings[(collection, field)]
+        try:
+            result = self._db.indices.get_field_mapping(index=self.get_index(collection), fields=field)
+        except NotFoundError:
+            return None
+        for index_mappings in result.values():
+            for type_mapping in index_mappings.get("mappings", {}).values():
+                if field in type_mapping:
+                    mapping = type_mapping[field]["mapping"][field.split(".")[-1]]
+                    self._field_mappings[(collection, field)] = mapping
+                    return mapping
+        return None
 
     def get_index(self, collection: str = "experiment"):
         """ES 6.0 doesn't handle multiple types in the same index so creating one index per type"""
@@ -87,18 +281,49 @@ class ElasticSearchDB(DB):
 
     def add(self, doc: dict):
         result = self._db.index(index=self.get_index(doc['type']), doc_type=doc['type'],
-                                body=map_es_experiment(doc, doc['type']), refresh='wait_for')
+                                body=map_es_experiment(doc, doc['type']), refresh=self.refresh)
         _id = result["_id"]
         return str(_id)
 
-    def count(self) -> int:
-        result = self._db.count()
+    def count(self, query: (ExperimentQuery, MultiStageExperimentQuery) = None, collection: str = None) -> int:
+        if collection is None:
+            result = self._db.count(index=self.index + "_*")
+        else:
+            body = None if query is None else {"query": self._query_dsl(query, collection)}
+            result = self._db.count(index=self.get_index(collection), body=body)
         return result['count']
 
+    def _query_dsl(self, query: (ExperimentQuery, MultiStageExperimentQuery), collection: str = "experiment") -> dict:
+        if len(query.ids) > 0:
+            return {"ids": {"values": [str(_id) for _id in query.ids]}}
+        elif query.is_empty():
+            return {"match_all": {}}
+        elif collection == "multistage":
+            return create_es_mse_query(query=query)["query"]
+        return create_es_exp_query(query=query)["query"]
+
+    def distinct(self, field: str, query: ExperimentQuery) -> list:
+        return list(self.group_count(field, query).keys())
+
+    def group_count(self, field: str, query: ExperimentQuery) -> dict:
+        """Count with a terms aggregation of the field, asked again with twice the buckets while some are left out
+
+        The composite aggregation would page through the buckets but it needs es 6.1 and its after_key 6.3
+        """
+        size = GROUP_SIZE
+        aggregated = keyword_field(field, self.field_mapping(field))
+        while True:
+            terms = {"field": aggregated, "size": size}
+            body = {"size": 0, "query": self._query_dsl(query), "aggs": {"groups": {"terms": terms}}}
+            result = self._db.search(index=self.get_index("experiment"), body=body)["aggregations"]["groups"]
+            if result["sum_other_doc_count"] == 0:
+                return {bucket["key"]: bucket["doc_count"] for bucket in result["buckets"]}
+            size *= 2
+
     def delete(self, experiment_id: int):
         try:
             result = self._db.delete(index=self.get_index("experiment"), doc_type="experiment", id=experiment_id,
-                                     refresh='wait_for')
+                                     refresh=self.refresh)
         except NotFoundError:
             raise KeyError("experiment id {} not found".format(experiment_id))
 
@@ -106,45 +331,86 @@ class ElasticSearchDB(DB):
         doc = self.get(experiment_id, "multistage")
         try:
             result = self._db.delete(index=self.get_index("multistage"), doc_type="multistage", id=experiment_id,
-                                     refresh='wait_for')
+                                     refresh=self.refresh)
         except NotFoundError:
             raise KeyError("experiment id {} not found".format(experiment_id))
-        for step, exp_id in doc["experiments"]:
-            self.delete(exp_id)
+        self.delete_many([exp_id for step, exp_id in doc["experiments"]])
+
+    def add_many(self, docs: list) -> list:
+        """Index the documents with the bulk api, BULK_SIZE of them per request"""
+        actions = ({"_op_type": "index", "_index": self.get_index(doc['type']), "_type": doc['type'],
+                    "_source": map_es_experiment(doc, doc['type'])} for doc in docs)
+        return [str(item["index"]["_id"])
+                for _, item in streaming_bulk(self._db, actions, chunk_size=BULK_SIZE, refresh=self.refresh)]
+
+    def delete_many(self, experiment_ids: list) -> None:
+        """Delete the experiments with the bulk api, BULK_SIZE of them per request"""
+        actions = ({"_op_type": "delete", "_index": self.get_index("experiment"), "_type": "experiment",
+                    "_id": experiment_id} for experiment_id in experiment_ids)
+        missing = [item["delete"]["_id"] for ok, item in streaming_bulk(self._db, actions, chunk_size=BULK_SIZE,
+                                                                        refresh=self.refresh, raise_on_error=False)
+                   if not ok]
+        if len(missing) > 0:
+            raise KeyError("experiment ids {} not found".format(missing))
 
     def delete_all(self) -> None:
         """Remove all experiments from db"""
         for index in self._db.indices.get(self.index + '*').keys():
             self._db.indices.delete(index=index)
+        self._field_mappings = {}
 
     def get(self, _id: str, collection: str = "experiment") -> (dict, None):
         """Get a document from the database or None if document not found"""
         res = self._db.get(index=self.get_index(collection), doc_type=collection, id=_id)
         return inv_map_es_experiment(res, collection)
 
+    def get_many(self, doc_ids: list, collection: str = "experiment", fields: list = None,
+                 exclude: list = None) -> list:
+        """Get the documents of doc_ids with a single mget request, None for the ones that are not found"""
+        if len(doc_ids) == 0:
+            return []
+        res = self._db.mget(index=self.get_index(collection), doc_type=collection,
+                            body={"ids": [str(_id) for _id in doc_ids]}, **source_filter(fields, exclude))
+        return [inv_map_es_experiment(doc, collection) if doc.get("found", False) else None for doc in res["docs"]]
+
     def list_experiments(self, query: ExperimentQuery) -> list:
         """return a list of experiments that match the query"""
-        if query.is_empty():
-            results = self._db.search(index=self.get_index("experiment"))
-            return [inv_map_es_experiment(doc) for doc in results['hits']['hits']]
-        elif len(query.ids) > 0:
-            return [self.get(_id, collection="experiment") for _id in query.ids]
-        else:
-            complex_query = create_es_exp_query(query=query)
-            results = self._db.search(index=self.get_index("experiment"), body=complex_query)
-            return [inv_map_es_experiment(doc) for doc in results['hits']['hits']]
+        if len(query.ids) > 0:
+            return self.get_many(query.ids, "experiment", fields=query.fields, exclude=query.exclude)
+        return list(self.iter_experiments(query))
+
+    def iter_experiments(self, query: ExperimentQuery, page_size: int = PAGE_SIZE):
+        """Yield all the experiments that match the query by scrolling through them page_size at a time
+
+        A plain search returns only the first 10 hits, the scroll reads every match
+        """
+        if len(query.ids) > 0:
+            yield from self.iter_many(query.ids, "experiment", page_size=page_size, fields=query.fields,
+                                      exclude=query.exclude)
+            return
+        body = None if query.is_empty() else create_es_exp_query(query=query)
+        for doc in scan(self._db, query=body, index=self.get_index("experiment"), size=page_size,
+                        **source_filter(query.fields, query.exclude)):
+            yield inv_map_es_experiment(doc)
+
+    def best(self, query: ExperimentQuery, metric: str, optimum: str = "min", k: int = 1) -> list:
+        """Sort the matching experiments on the stored last value of the metric"""
+        last_field = "{}.{}".format(LAST_VALUES, metric)
+        body = {
+            "query": {"bool": {"must": [self._query_dsl(query)], "filter": [{"exists": {"field": last_field}}]}},
+            "sort": [{last_field: {"order": "asc" if optimum == "min" else "desc"}}],
+            "size": k,
+        }
+        results = self._db.search(index=self.get_index("experiment"), body=body,
+                                  **source_filter(query.fields, query.exclude))
+        return [inv_map_es_experiment(doc) for doc in results['hits']['hits']]
 
     def list_ms_experiments(self, query: MultiStageExperimentQuery) -> list:
-        if query.is_empty():
-            results = self._db.search(index=self.get_index("multistage"))
-            results = [inv_map_es_experiment(doc, "multistage") for doc in results['hits']['hits']]
-        elif len(query.ids) > 0:
-            results = [self.get(_id, collection="multistage") for _id in query.ids]
-        else:
-            complex_query = create_es_mse_query(query=query)
-            results = self._db.search(index=self.get_index("multistage"), body=complex_query)
-            results = [inv_map_es_experiment(doc, "multistage") for doc in results['hits']['hits']]
-        return results
+        if len(query.ids) > 0:
+            return [self.get(_id, collection="multistage") for _id in query.ids]
+        body = None if query.is_empty() else create_es_mse_query(query=query)
+        return [inv_map_es_experiment(doc, "multistage")
+                for doc in scan(self._db, query=body, index=self.get_index("multistage"), size=PAGE_SIZE)]
 
     def update(self, experiment_id: int, experiment: dict):
         pass
@@ -152,20 +418,12 @@ class ElasticSearchDB(DB):
     def update_key(self, experiment_id: int, value: Any, key: str, mode='set') -> None:
         if mode == "set":
             body = {"doc": nested_dict(key, value)}
+        elif mode == "extend":
+            body = {"script": extend_script([(key, value)])}
         else:
             if isinstance(value, list):
                 value = value[0]
-            if isinstance(key, list):
-                key = ".".join(key)
-            body = {
-                "script": {
-                    "source": "ctx._source.{field}.add(params.value)".format(field=key),
-                    "lang": "painless",
-                    "params": {
-                        "value": value
-                    }
-                }
-            }
+            body = {"script": extend_script([(key, [value])])}
 
         self._db.update(index=self.get_index("experiment"),
                         doc_type="experiment",
@@ -173,6 +431,11 @@ class ElasticSearchDB(DB):
                         body=body,
                         )
 
+    def extend_many(self, experiment_id: int, extensions: list) -> None:
+        """Extend every key with a single scripted update"""
+        self._db.update(index=self.get_index("experiment"), doc_type="experiment", id=experiment_id,
+                        body={"script": extend_script(extensions)})
+
     @property
     def collections(self) -> list:
         mapping = self._db.indices.get_mapping()
@@ -4,12 +4,33 @@ from bson import ObjectId
 from bson.errors import InvalidId
 import pymongo
 
-from .database import ExperimentQuery, MultiStageExperimentQuery
+from .database import ExperimentQuery, MultiStageExperimentQuery, PAGE_SIZE
 from pymongo.errors import ConnectionFailure
 
-from .helpers import add_mongo, map_experiment, inv_map_experiment, set_mongo
+from .helpers import add_mongo, extend_mongo, map_experiment, inv_map_experiment, mongo_projection, set_mongo
 from .db_abc import DB
 
+LAST_VALUE = "_last_value"  # the field the best aggregation adds to sort on the last value of a metric
+
+# the (name, keys, options) of the indexes of every collection, they are created once when the db is opened
+INDEXES = {
+    "experiment": [
+        ("search_index", [("name", pymongo.TEXT)], {"default_language": "english"}),
+        # the result cache looks up completed experiments by their hash before running them
+        ("hash_index", [("hash", pymongo.ASCENDING), ("status", pymongo.ASCENDING)], {}),
+        ("tags_index", [("tags", pymongo.ASCENDING)], {}),
+        ("status_index", [("status", pymongo.ASCENDING)], {}),
+        ("parameter_hash_index", [("parameter_hash", pymongo.ASCENDING)], {}),
+        ("schema_hash_index", [("schema_hash", pymongo.ASCENDING)], {}),
+    ],
+    "multistage": [
+        ("search_index", [("name", pymongo.TEXT)], {"default_language": "english"}),
+        ("hash_index", [("hash", pymongo.ASCENDING)], {}),
+        ("tags_index", [("tags", pymongo.ASCENDING)], {}),
+        ("steps_index", [("steps", pymongo.ASCENDING)], {}),
+    ],
+}
+
 
 def create_mongodb_exp_query(query: ExperimentQuery):
     """Create a complex mongodb query from an ExperimentQuery Object"""
@@ -24,6 +45,8 @@ def create_mongodb_exp_query(query: ExperimentQuery):
         query_list.append({"parameter_hash": {"$in": query.schema_param_hashes}})
     if len(query.schema_hashes) > 0:
         query_list.append({"schema_hash": {"$in": query.schema_hashes}})
+    if len(query.hashes) > 0:
+        query_list.append({"hash": {"$in": query.hashes}})
     if len(query.status) > 0:
         query_list.append({"status": {"$in": query.status}})
     complex_query = query_list[0] if len(query_list) == 1 else {"$and": query_list}
@@ -54,8 +77,7 @@ class MongoDB(DB):
     def __init__(self, db_path: str, db_name: str):
         self._client = None
         self._db = self._connect(db_path, db_name)
-        for collection in self.collections:
-            self._db[collection].create_index([("name", pymongo.TEXT)], name="search_index", default_language='english')
+        self.ensure_indexes()
 
     def _connect(self, db_path, db_name):
         for index in range(3):
@@ -66,8 +88,24 @@ class MongoDB(DB):
                 index += 1
         return self._client[db_name] if self._client else None
 
+    def ensure_indexes(self) -> None:
+        """Create the declared indexes that are missing, existing ones are left as they are"""
+        for collection, indexes in INDEXES.items():
+            self._db[collection].create_indexes([pymongo.IndexModel(keys, name=name, **options)
+                                                 for name, keys, options in indexes])
+
+    def index_stats(self) -> dict:
+        """Return the number of operations that used every index since the server or the index was started"""
+        stats = {}
+        for collection in INDEXES.keys():
+            stats[collection] = {index["name"]: {"ops": index["accesses"]["ops"], "since": index["accesses"]["since"]}
+                                 for index in self._db[collection].aggregate([{"$indexStats": {}}])}
+        return stats
+
     def stop_db(self):
         """Disconnect from DB."""
+        if self._client is not None:
+            self._client.close()
         self._client = None
 
     def add(self, doc: dict):
@@ -79,11 +117,26 @@ class MongoDB(DB):
         _id = col.insert_one(doc).inserted_id
         return str(_id)
 
-    def count(self) -> int:
-        count = 0
-        for collection in self._db.collection_names(include_system_collections=False):
-            count += self._db[collection].count()
-        return count
+    def count(self, query: (ExperimentQuery, MultiStageExperimentQuery) = None, collection: str = None) -> int:
+        if collection is None:
+            count = 0
+            for collection in self._db.collection_names(include_system_collections=False):
+                count += self._db[collection].count()
+            return count
+        query_filter = {} if query is None else self._query_filter(query, collection)
+        # count_documents needs pymongo 3.7, the count of a cursor runs the same count command on the server
+        return self._db[collection].find(query_filter).count()
+
+    def distinct(self, field: str, query: ExperimentQuery) -> list:
+        return self._db.experiment.distinct(field, self._query_filter(query))
+
+    def group_count(self, field: str, query: ExperimentQuery) -> dict:
+        pipeline = [
+            {"$match": self._query_filter(query)},
+            {"$unwind": "$" + field},
+            {"$group": {"_id": "$" + field, "count": {"$sum": 1}}},
+        ]
+        return {group["_id"]: group["count"] for group in self._db.experiment.aggregate(pipeline)}
 
     def delete(self, experiment_id: int):
         try:
@@ -97,8 +150,26 @@ class MongoDB(DB):
             self._db.multistage.delete_one({"_id": ObjectId(experiment_id)})
         except InvalidId:
             raise KeyError("experiment id {} not found".format(experiment_id))
-        for step, exp_id in doc['experiments']:
-            self.delete(exp_id)
+        self.delete_many([exp_id for step, exp_id in doc['experiments']])
+
+    def add_many(self, docs: list) -> list:
+        """Insert the documents with a single insert_many per collection"""
+        ids = [None] * len(docs)
+        for collection in self.collections:
+            indices = [index for index, doc in enumerate(docs) if doc["type"] == collection]
+            if len(indices) > 0:
+                mapped = [map_experiment(docs[index]) if collection == "experiment" else docs[index]
+                          for index in indices]
+                for index, _id in zip(indices, self._db[collection].insert_many(mapped).inserted_ids):
+                    ids[index] = str(_id)
+        return ids
+
+    def delete_many(self, experiment_ids: list) -> None:
+        try:
+            object_ids = [ObjectId(experiment_id) for experiment_id in experiment_ids]
+        except InvalidId:
+            raise KeyError("experiment ids {} not found".format(experiment_ids))
+        self._db.experiment.delete_many({"_id": {"$in": object_ids}})
 
     def delete_all(self) -> None:
         """Remove all experiments from db"""
@@ -108,9 +179,19 @@ class MongoDB(DB):
     def get(self, _id: str, collection: str = "experiment") -> (dict, None):
         """Get a document from the database or None if document not found"""
         doc = self._db[collection].find_one({"_id": ObjectId(_id)})
-        if doc is None:
-            return
-        elif doc["type"] == "experiment":
+        return None if doc is None else self._from_mongo(doc)
+
+    def get_many(self, doc_ids: list, collection: str = "experiment", fields: list = None,
+                 exclude: list = None) -> list:
+        """Get the documents of doc_ids with a single $in query, None for the ones that are not found"""
+        docs = {str(doc["_id"]): doc for doc in
+                self._db[collection].find({"_id": {"$in": [ObjectId(_id) for _id in set(doc_ids)]}},
+                                          mongo_projection(fields, exclude))}
+        return [None if str(_id) not in docs else self._from_mongo(docs[str(_id)]) for _id in doc_ids]
+
+    @staticmethod
+    def _from_mongo(doc: dict) -> dict:
+        if doc["type"] == "experiment":
             return inv_map_experiment(doc)
         else:
             doc['id'] = doc.pop('_id')
@@ -118,16 +199,46 @@ class MongoDB(DB):
 
     def list_experiments(self, query: ExperimentQuery) -> list:
         """return a list of experiments that match the query"""
-        if query.is_empty():
-            return [inv_map_experiment(i) for i in self._db.experiment.find()]
-        elif len(query.ids) > 0:
-            return [self.get(_id) for _id in query.ids]
-        else:
-            if len(query.names) > 0:
-                self._db.experiment.create_index([("name", pymongo.TEXT)], name="search_index",
-                                                 default_language='english')
-            complex_query = create_mongodb_exp_query(query=query)
-            return [inv_map_experiment(i) for i in self._db.experiment.find(complex_query)]
+        if len(query.ids) > 0:
+            return self.get_many(query.ids, "experiment", fields=query.fields, exclude=query.exclude)
+        return list(self.iter_experiments(query))
+
+    def iter_experiments(self, query: ExperimentQuery, page_size: int = PAGE_SIZE):
+        """Yield the experiments that match the query from a cursor that fetches page_size of them per batch"""
+        if len(query.ids) > 0:
+            yield from self.iter_many(query.ids, "experiment", page_size=page_size, fields=query.fields,
+                                      exclude=query.exclude)
+            return
+        projection = mongo_projection(query.fields, query.exclude)
+        for doc in self._db.experiment.find(self._query_filter(query), projection).batch_size(page_size):
+            yield inv_map_experiment(doc)
+
+    def _query_filter(self, query: (ExperimentQuery, MultiStageExperimentQuery),
+                      collection: str = "experiment") -> dict:
+        if len(query.ids) > 0:
+            return {"_id": {"$in": [ObjectId(_id) for _id in query.ids]}}
+        elif query.is_empty():
+            return {}
+        elif collection == "multistage":
+            return create_mongodb_mse_query(query=query)
+        return create_mongodb_exp_query(query=query)
+
+    def best(self, query: ExperimentQuery, metric: str, optimum: str = "min", k: int = 1) -> list:
+        """Select the k best experiments with an aggregation that sorts on the last value of the metric"""
+        field = "$monitored." + metric
+        projection = mongo_projection(query.fields, query.exclude)
+        if not query.fields:
+            projection = dict(projection or {}, **{LAST_VALUE: 0})
+        pipeline = [
+            {"$match": self._query_filter(query)},
+            {"$addFields": {LAST_VALUE: {"$cond": [{"$isArray": field}, {"$arrayElemAt": [field, -1]}, field]}}},
+            # nan sorts below every number in mongo, the bounds leave it out together with the infinities
+            {"$match": {LAST_VALUE: {"$type": "number", "$gt": float("-inf"), "$lt": float("inf")}}},
+            {"$sort": {LAST_VALUE: 1 if optimum == "min" else -1}},
+            {"$limit": k},
+            {"$project": projection},
+        ]
+        return [inv_map_experiment(doc) for doc in self._db.experiment.aggregate(pipeline)]
 
     def list_ms_experiments(self, query: MultiStageExperimentQuery) -> list:
         if query.is_empty():
@@ -135,9 +246,6 @@ class MongoDB(DB):
         elif len(query.ids) > 0:
             return [self.get(_id, collection="multistage") for _id in query.ids]
         else:
-            if len(query.names) > 0:
-                self._db.multistage.create_index([("name", pymongo.TEXT)], name="search_index",
-                                                 default_language='english')
             complex_query = create_mongodb_mse_query(query=query)
             return [i for i in self._db.multistage.find(complex_query)]
 
@@ -149,3 +257,14 @@ class MongoDB(DB):
             self._db.experiment.update({"_id": ObjectId(experiment_id)}, set_mongo(value, key=key))
         elif mode == 'add':
             self._db.experiment.update({"_id": ObjectId(experiment_id)}, add_mongo(value, key=key))
+        elif mode == 'extend':
+            self._db.experiment.update({"_id": ObjectId(experiment_id)}, extend_mongo(value, key=key))
+        else:
+            raise ValueError("update mode {} not supported ".format(mode))
+
+    def extend_many(self, experiment_id: int, extensions: list) -> None:
+        """Push the values of every key with a single update"""
+        pushes = {}
+        for key, values in extensions:
+            pushes.update(extend_mongo(values, key=key)["$push"])
+        self._db.experiment.update({"_id": ObjectId(experiment_id)}, {"$push": pushes})
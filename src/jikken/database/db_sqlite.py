@@ -0,0 +1,507 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import reduce
+from typing import Any
+
+from .database import ExperimentQuery, MultiStageExperimentQuery, PAGE_SIZE
+from .helpers import extend_inner, project, set_inner
+from .series import NO_STEP, Series, decode_series, is_numeric, series_columns
+from .db_abc import DB
+
+BUSY_TIMEOUT = 30.0  # the number of seconds a write waits for the writes of other processes to finish
+MAX_VARIABLES = 500  # the number of ids bound per statement, older sqlite versions allow at most 999 variables
+LIST_FIELDS = {"experiment": ("tags",), "multistage": ("tags", "steps")}  # kept in the values table to be indexed
+
+# the (name, expressions) of the indexes of every collection, they are created once when the db is opened
+INDEXES = {
+    "experiment": [
+        ("name_index", ["name"]),
+        # the result cache looks up completed experiments by their hash before running them
+        ("hash_index", ["hash", "status"]),
+        ("status_index", ["status"]),
+        ("parameter_hash_index", ["parameter_hash"]),
+        ("schema_hash_index", ["schema_hash"]),
+    ],
+    "multistage": [
+        ("name_index", ["name"]),
+        ("hash_index", ["hash"]),
+    ],
+}
+
+
+def json_path(field: str) -> str:
+    """Return the json path of a field, nested fields are selected with dots e.g. monitored.loss"""
+    return "$" + "".join('."{}"'.format(key.replace('"', '""')) for key in field.split("."))
+
+
+def field_sql(field: str, table: str = None) -> str:
+    """Return the expression of a top level field of the doc column
+
+    Queries use the same expression as the declared indexes, otherwise sqlite does not use them
+    """
+    return "json_extract({}doc, '$.{}')".format("" if table is None else table + ".", field)
+
+
+def placeholders(values: list) -> str:
+    return ", ".join("?" * len(values))
+
+
+def chunks(values: list, size: int = MAX_VARIABLES):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def in_clause(field: str, values: list, table: str) -> tuple:
+    return "{} IN ({})".format(field_sql(field, table), placeholders(values)), list(values)
+
+
+def name_clause(names: list, table: str) -> tuple:
+    """Names match the experiments whose name contains any of them"""
+    clause = " OR ".join("instr({}, ?) > 0".format(field_sql("name", table)) for _ in names)
+    return "(" + clause + ")", list(names)
+
+
+def list_clause(field: str, values: list, query_type: str, table: str) -> tuple:
+    """Match the documents whose list field has all (and) or any (or) of the values through the values table"""
+    values = sorted(set(values), key=str)
+    clause = "{table}.id IN (SELECT doc_id FROM {table}_values WHERE field = ? AND value IN ({values})".format(
+        table=table, values=placeholders(values))
+    if query_type == "and":
+        return clause + " GROUP BY doc_id HAVING COUNT(DISTINCT value) = ?)", [field] + values + [len(values)]
+    return clause + ")", [field] + values
+
+
+def join_clauses(clauses: list) -> tuple:
+    return " AND ".join(clause for clause, _ in clauses), reduce(lambda x, y: x + y, [params for _, params in clauses])
+
+
+def create_sqlite_exp_query(query: ExperimentQuery, table: str) -> tuple:
+    """Create the WHERE clause and its parameters from an ExperimentQuery Object"""
+    clauses = []
+    if len(query.names) > 0:
+        clauses.append(name_clause(query.names, table))
+    if len(query.tags) > 0:
+        clauses.append(list_clause("tags", query.tags, query.query_type, table))
+    if len(query.schema_hashes) > 0:
+        clauses.append(in_clause("schema_hash", query.schema_hashes, table))
+    if len(query.schema_param_hashes) > 0:
+        clauses.append(in_clause("parameter_hash", query.schema_param_hashes, table))
+    if len(query.hashes) > 0:
+        clauses.append(in_clause("hash", query.hashes, table))
+    if len(query.status) > 0:
+        clauses.append(in_clause("status", query.status, table))
+    return join_clauses(clauses)
+
+
+def create_sqlite_mse_query(query: MultiStageExperimentQuery, table: str) -> tuple:
+    """Create the WHERE clause and its parameters from an MultiStageExperimentQuery Object"""
+    clauses = []
+    if len(query.names) > 0:
+        clauses.append(name_clause(query.names, table))
+    if len(query.tags) > 0:
+        clauses.append(list_clause("tags", query.tags, query.query_type, table))
+    if len(query.hashes) > 0:
+        clauses.append(in_clause("hash", query.hashes, table))
+    if len(query.steps) > 0:
+        clauses.append(list_clause("steps", query.steps, query.query_type, table))
+    return join_clauses(clauses)
+
+
+def encode_metric(value):
+    """Finite numbers are stored as sqlite numbers so they can be sorted, every other value as json text"""
+    if is_numeric(value) and isinstance(value, (int, float)) and math.isfinite(value) and -2 ** 63 <= value < 2 ** 63:
+        return value
+    return json.dumps(value)
+
+
+def decode_metric(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def monitored_keys(fields: list = None, exclude: list = None) -> (list, bool, None):
+    """Return which monitored keys a projection returns, True for all of them and None for none"""
+    if fields:
+        keys = [field.split(".")[1] if "." in field else True for field in fields if field.split(".")[0] == "monitored"]
+        return None if len(keys) == 0 else True if True in keys else keys
+    return None if exclude and "monitored" in exclude else True
+
+
+def update_doc(doc: dict, value: Any, key: (list, str), mode: str) -> None:
+    keys = key if isinstance(key, list) else [key]
+    if mode == 'set':
+        set_inner(keys, value)(doc)
+    elif mode == 'add':
+        ref = reduce(lambda ref, field: ref[field], keys[:-1], doc)
+        ref[keys[-1]] += value
+    elif mode == 'extend':
+        extend_inner(keys, value)(doc)
+    else:
+        raise ValueError("update mode {} not supported ".format(mode))
+
+
+class SQLiteDB(DB):
+    """Wrapper class for SQLite.
+
+    Every collection is a table with the documents as json in its doc column, the fields that queries
+    filter on have indexes on their json expressions and list fields like tags are also kept in a values
+    table to be indexed. The values of the monitored lists are rows of a metrics table, so appending a
+    value does not rewrite the document. The db is in WAL mode, every thread and process has its own
+    connection and writes wait up to BUSY_TIMEOUT for each other.
+    """
+
+    def __init__(self, db_path: str, db_name: str):
+        """Connect to db and create the tables and indexes that are missing"""
+        self._path = os.path.join(db_path, "jikken_db.sqlite")
+        self._connections = {}
+        self._tables = {collection: db_name + "_" + collection for collection in self.collections}
+        self._metrics = db_name + "_metrics"
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode = WAL")
+        with self._transaction() as connection:
+            self.ensure_schema(connection)
+
+    def ensure_schema(self, connection: sqlite3.Connection) -> None:
+        for collection, table in self._tables.items():
+            connection.execute("CREATE TABLE IF NOT EXISTS {} (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                               "doc TEXT NOT NULL)".format(table))
+            connection.execute("CREATE TABLE IF NOT EXISTS {table}_values (doc_id INTEGER NOT NULL REFERENCES "
+                               "{table}(id) ON DELETE CASCADE, field TEXT NOT NULL, value)".format(table=table))
+            connection.execute("CREATE INDEX IF NOT EXISTS {table}_values_index ON {table}_values "
+                               "(field, value, doc_id)".format(table=table))
+            connection.execute("CREATE INDEX IF NOT EXISTS {table}_values_doc_index ON {table}_values (doc_id)"
+                               .format(table=table))
+            for name, fields in INDEXES[collection]:
+                connection.execute("CREATE INDEX IF NOT EXISTS {table}_{name} ON {table} ({expressions})".format(
+                    table=table, name=name, expressions=", ".join(field_sql(field) for field in fields)))
+        # step is the position of the value in the monitored list of the key, logged_step and timestamp are
+        # the columns of its series
+        connection.execute("CREATE TABLE IF NOT EXISTS {} (exp_id INTEGER NOT NULL REFERENCES {}(id) "
+                           "ON DELETE CASCADE, key TEXT NOT NULL, step INTEGER NOT NULL, value, "
+                           "logged_step INTEGER, timestamp REAL, "
+                           "PRIMARY KEY (exp_id, key, step)) WITHOUT ROWID".format(self._metrics,
+                                                                                   self._tables["experiment"]))
+        columns = {row[1] for row in connection.execute("PRAGMA table_info({})".format(self._metrics))}
+        for column, column_type in (("logged_step", "INTEGER"), ("timestamp", "REAL")):
+            if column not in columns:
+                # metrics tables created before the series columns were added
+                connection.execute("ALTER TABLE {} ADD COLUMN {} {}".format(self._metrics, column, column_type))
+        connection.execute("CREATE INDEX IF NOT EXISTS {table}_key_index ON {table} (key, exp_id, step)"
+                           .format(table=self._metrics))
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return the connection of the thread, connections are not shared with forked processes"""
+        key = (os.getpid(), threading.get_ident())
+        connection = self._connections.get(key)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA foreign_keys = ON")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            self._connections[key] = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self, write: bool = True):
+        """Run the statements of the block in a transaction, writes take the write lock when they begin"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def stop_db(self):
+        """Disconnect from DB."""
+        connections, self._connections = self._connections, {}
+        for (pid, _), connection in connections.items():
+            if pid == os.getpid():
+                connection.close()
+
+    def _query_clause(self, query: (ExperimentQuery, MultiStageExperimentQuery), collection: str) -> tuple:
+        """Return the WHERE clause of a query on the table of the collection, empty if it selects every document"""
+        table = self._tables[collection]
+        if len(query.ids) > 0:
+            return "{}.id IN ({})".format(table, placeholders(query.ids)), [int(_id) for _id in query.ids]
+        elif query.is_empty():
+            return "", []
+        elif collection == "multistage":
+            return create_sqlite_mse_query(query, table)
+        return create_sqlite_exp_query(query, table)
+
+    def _write(self, connection: sqlite3.Connection, collection: str, doc: dict, doc_id: int = None,
+               fields: set = None) -> int:
+        """Insert the document or replace the one of doc_id, the values and metrics rows are only replaced for
+        the top level fields that changed if fields is given"""
+        doc = dict(doc)
+        doc.pop("id", None)
+        metrics = {}
+        if collection == "experiment" and "monitored" in doc:
+            metrics = {key: values for key, values in doc["monitored"].items() if isinstance(values, list)}
+            doc["monitored"] = {key: value for key, value in doc["monitored"].items() if key not in metrics}
+        table = self._tables[collection]
+        if doc_id is None:
+            doc_id = connection.execute("INSERT INTO {} (doc) VALUES (?)".format(table), (json.dumps(doc),)).lastrowid
+        else:
+            connection.execute("UPDATE {} SET doc = ? WHERE id = ?".format(table), (json.dumps(doc), doc_id))
+        for field in LIST_FIELDS[collection]:
+            if fields is None or field in fields:
+                connection.execute("DELETE FROM {}_values WHERE doc_id = ? AND field = ?".format(table),
+                                   (doc_id, field))
+                connection.executemany("INSERT INTO {}_values (doc_id, field, value) VALUES (?, ?, ?)".format(table),
+                                       [(doc_id, field, value) for value in set(doc.get(field) or [])])
+        if collection == "experiment" and (fields is None or "monitored" in fields):
+            connection.execute("DELETE FROM {} WHERE exp_id = ?".format(self._metrics), (doc_id,))
+            for key, values in metrics.items():
+                self._append_metric(connection, doc_id, key, values)
+        return doc_id
+
+    def _append_metric(self, connection: sqlite3.Connection, exp_id: int, key: str, values: list,
+                       columns: dict = None) -> None:
+        """Insert a row per value, with the step and timestamp of the series columns if they are given"""
+        start = connection.execute("SELECT COALESCE(MAX(step) + 1, 0) FROM {} WHERE exp_id = ? AND key = ?"
+                                   .format(self._metrics), (exp_id, key)).fetchone()[0]
+        steps = [None] * len(values) if columns is None else columns["step"]
+        timestamps = [None] * len(values) if columns is None else columns["timestamp"]
+        connection.executemany("INSERT INTO {} (exp_id, key, step, value, logged_step, timestamp) "
+                               "VALUES (?, ?, ?, ?, ?, ?)".format(self._metrics),
+                               [(exp_id, key, start + index, encode_metric(value), step, timestamp)
+                                for index, (value, step, timestamp) in enumerate(zip(values, steps, timestamps))])
+
+    def _check_experiment(self, connection: sqlite3.Connection, experiment_id: int) -> None:
+        if connection.execute("SELECT 1 FROM {} WHERE id = ?".format(self._tables["experiment"]),
+                              (experiment_id,)).fetchone() is None:
+            raise KeyError("key {} not found in SQLite".format(experiment_id))
+
+    def _read(self, connection: sqlite3.Connection, collection: str, clause: str = "", params: list = (),
+              fields: list = None, exclude: list = None, suffix: str = "") -> list:
+        """Return the projected documents that match the clause, the excluded fields are removed by sqlite"""
+        table = self._tables[collection]
+        doc_sql, doc_params = "doc", []
+        if not fields and exclude:
+            doc_sql, doc_params = "json_remove(doc, {})".format(placeholders(exclude)), [json_path(field)
+                                                                                        for field in exclude]
+        rows = connection.execute("SELECT id, {} FROM {} {} {}".format(
+            doc_sql, table, "" if clause == "" else "WHERE " + clause, suffix), doc_params + list(params)).fetchall()
+        docs = []
+        for doc_id, doc in rows:
+            doc = json.loads(doc)
+            doc["id"] = str(doc_id)
+            docs.append(doc)
+        keys = monitored_keys(fields, exclude)
+        if collection == "experiment" and keys is not None and len(docs) > 0:
+            self._load_metrics(connection, docs, None if keys is True else keys)
+        return [project(doc, fields, exclude) for doc in docs]
+
+    def _load_metrics(self, connection: sqlite3.Connection, docs: list, keys: list = None) -> None:
+        monitored = {doc["id"]: doc.setdefault("monitored", {}) for doc in docs}
+        key_clause = "" if keys is None else " AND key IN ({})".format(placeholders(keys))
+        for exp_ids in chunks([int(doc["id"]) for doc in docs]):
+            rows = connection.execute("SELECT exp_id, key, value FROM {} WHERE exp_id IN ({}){} "
+                                      "ORDER BY exp_id, key, step".format(self._metrics, placeholders(exp_ids),
+                                                                          key_clause),
+                                      exp_ids + ([] if keys is None else list(keys)))
+            for exp_id, key, value in rows:
+                monitored[str(exp_id)].setdefault(key, []).append(decode_metric(value))
+
+    def add(self, doc: dict) -> str:
+        with self._transaction() as connection:
+            return str(self._write(connection, doc["type"], doc))
+
+    def add_many(self, docs: list) -> list:
+        """Insert the documents in a single transaction"""
+        with self._transaction() as connection:
+            return [str(self._write(connection, doc["type"], doc)) for doc in docs]
+
+    def get(self, doc_id: str, collection: str) -> (dict, None):
+        """Return the document with matching id or None if it is not found"""
+        return self.get_many([doc_id], collection)[0]
+
+    def get_many(self, doc_ids: list, collection: str, fields: list = None, exclude: list = None) -> list:
+        table = self._tables[collection]
+        docs = {}
+        with self._transaction(write=False) as connection:
+            for ids in chunks(sorted(set(int(doc_id) for doc_id in doc_ids))):
+                docs.update((doc["id"], doc) for doc in self._read(connection, collection, "{}.id IN ({})".format(
+                    table, placeholders(ids)), ids, fields=fields, exclude=exclude))
+        return [docs.get(str(doc_id)) for doc_id in doc_ids]
+
+    def list_experiments(self, query: ExperimentQuery) -> list:
+        """return a list of experiments that match the query"""
+        if len(query.ids) > 0:
+            return self.get_many(query.ids, "experiment", fields=query.fields, exclude=query.exclude)
+        return list(self.iter_experiments(query))
+
+    def iter_experiments(self, query: ExperimentQuery, page_size: int = PAGE_SIZE):
+        """Yield the experiments that match the query, every page is read after the last id of the previous one
+
+        No transaction is open while the experiments are yielded, so the caller can write between them
+        """
+        if len(query.ids) > 0:
+            yield from self.iter_many(query.ids, "experiment", page_size=page_size, fields=query.fields,
+                                      exclude=query.exclude)
+            return
+        table = self._tables["experiment"]
+        clause, params = self._query_clause(query, "experiment")
+        last_id = 0
+        while True:
+            with self._transaction(write=False) as connection:
+                docs = self._read(connection, "experiment", " AND ".join(
+                    [clause for clause in [clause, "{}.id > ?".format(table)] if clause != ""]), params + [last_id],
+                    fields=query.fields, exclude=query.exclude, suffix="ORDER BY id LIMIT {}".format(int(page_size)))
+            yield from docs
+            if len(docs) < page_size:
+                return
+            last_id = int(docs[-1]["id"])
+
+    def best(self, query: ExperimentQuery, metric: str, optimum: str = "min", k: int = 1) -> list:
+        """Sort the last values of the metric in the metrics table and read the k best experiments"""
+        table = self._tables["experiment"]
+        clause, params = self._query_clause(query, "experiment")
+        sql = "SELECT {table}.id FROM {table} JOIN {metrics} last ON last.exp_id = {table}.id AND last.key = ? " \
+              "WHERE last.step = (SELECT MAX(step) FROM {metrics} WHERE exp_id = {table}.id AND key = ?) " \
+              "AND typeof(last.value) IN ('integer', 'real') {clause} " \
+              "ORDER BY last.value {order}, {table}.id LIMIT ?".format(
+                  table=table, metrics=self._metrics, clause="" if clause == "" else "AND " + clause,
+                  order="ASC" if optimum == "min" else "DESC")
+        with self._transaction(write=False) as connection:
+            ids = [row[0] for row in connection.execute(sql, [metric, metric] + params + [k])]
+        return self.get_many(ids, "experiment", fields=query.fields, exclude=query.exclude)
+
+    def list_ms_experiments(self, query: MultiStageExperimentQuery) -> list:
+        if len(query.ids) > 0:
+            return [self.get(_id, "multistage") for _id in query.ids]
+        clause, params = self._query_clause(query, "multistage")
+        with self._transaction(write=False) as connection:
+            return self._read(connection, "multistage", clause, params, suffix="ORDER BY id")
+
+    def count(self, query: (ExperimentQuery, MultiStageExperimentQuery) = None, collection: str = None) -> int:
+        with self._transaction(write=False) as connection:
+            if collection is None:
+                return sum(connection.execute("SELECT COUNT(*) FROM {}".format(table)).fetchone()[0]
+                           for table in self._tables.values())
+            clause, params = ("", []) if query is None else self._query_clause(query, collection)
+            return connection.execute("SELECT COUNT(*) FROM {} {}".format(
+                self._tables[collection], "" if clause == "" else "WHERE " + clause), params).fetchone()[0]
+
+    def distinct(self, field: str, query: ExperimentQuery) -> list:
+        return list(self.group_count(field, query).keys())
+
+    def group_count(self, field: str, query: ExperimentQuery) -> dict:
+        """Count list fields like tags in the values table and every other field with json_each"""
+        table = self._tables["experiment"]
+        clause, params = self._query_clause(query, "experiment")
+        if field in LIST_FIELDS["experiment"]:
+            source = "JOIN {table}_values field_values ON field_values.doc_id = {table}.id".format(table=table)
+            conditions, params = ["field_values.field = ?"], [field] + params
+        else:
+            source = ", json_each({}.doc, ?) field_values".format(table)
+            conditions, params = ["field_values.type != 'null'"], [json_path(field)] + params
+        sql = "SELECT field_values.value, COUNT(*) FROM {} {} WHERE {} GROUP BY field_values.value".format(
+            table, source, " AND ".join(conditions + ([] if clause == "" else [clause])))
+        with self._transaction(write=False) as connection:
+            return {value: count for value, count in connection.execute(sql, params)}
+
+    def _read_for_update(self, connection: sqlite3.Connection, experiment_id: int) -> dict:
+        docs = self._read(connection, "experiment", "id = ?", [experiment_id])
+        if len(docs) == 0:
+            raise KeyError("key {} not found in SQLite".format(experiment_id))
+        return docs[0]
+
+    def update(self, experiment_id: str, experiment: dict) -> None:
+        """Modify experiment in db with given experiment_id."""
+        with self._transaction() as connection:
+            doc = self._read_for_update(connection, int(experiment_id))
+            doc.update(experiment)
+            self._write(connection, "experiment", doc, int(experiment_id), fields=set(experiment.keys()))
+
+    def update_key(self, experiment_id: str, value: Any, key: (list, str), mode='set') -> None:
+        """Monitored values are appended to the metrics table, other updates rewrite the document"""
+        experiment_id = int(experiment_id)
+        keys = key if isinstance(key, list) else [key]
+        with self._transaction() as connection:
+            if mode == 'extend' and len(keys) == 2 and keys[0] == "monitored":
+                self._check_experiment(connection, experiment_id)
+                self._append_metric(connection, experiment_id, keys[1], value)
+                return
+            doc = self._read_for_update(connection, experiment_id)
+            update_doc(doc, value, keys, mode)
+            self._write(connection, "experiment", doc, experiment_id, fields={keys[0]})
+
+    def extend_many(self, experiment_id: str, extensions: list) -> None:
+        """Extend every key in a single transaction, the document is rewritten once for the keys that are not metrics"""
+        experiment_id = int(experiment_id)
+        extensions = [(key if isinstance(key, list) else [key], values) for key, values in extensions]
+        metrics = [(keys[1], values) for keys, values in extensions if len(keys) == 2 and keys[0] == "monitored"]
+        others = [(keys, values) for keys, values in extensions if not (len(keys) == 2 and keys[0] == "monitored")]
+        with self._transaction() as connection:
+            if len(others) > 0:
+                doc = self._read_for_update(connection, experiment_id)
+                for keys, values in others:
+                    update_doc(doc, values, keys, 'extend')
+                self._write(connection, "experiment", doc, experiment_id, fields={keys[0] for keys, _ in others})
+            else:
+                self._check_experiment(connection, experiment_id)
+            for metric, values in metrics:
+                self._append_metric(connection, experiment_id, metric, values)
+
+    def append_monitored(self, experiment_id: str, key: str, values: list, steps: list = None,
+                         timestamps: list = None) -> None:
+        """Insert the values with their steps and timestamps as rows of the metrics table, the document is not read"""
+        experiment_id = int(experiment_id)
+        with self._transaction() as connection:
+            self._check_experiment(connection, experiment_id)
+            self._append_metric(connection, experiment_id, key, values, series_columns(values, steps, timestamps))
+
+    def get_series(self, experiment_id: str, key: str) -> Series:
+        """Read the series of a monitored key from its rows of the metrics table"""
+        experiment_id = int(experiment_id)
+        with self._transaction(write=False) as connection:
+            self._check_experiment(connection, experiment_id)
+            rows = connection.execute("SELECT value, logged_step, timestamp FROM {} WHERE exp_id = ? AND key = ? "
+                                      "ORDER BY step".format(self._metrics), (experiment_id, key)).fetchall()
+        return decode_series([decode_metric(value) for value, _, _ in rows],
+                             {"step": [NO_STEP if step is None else step for _, step, _ in rows],
+                              "timestamp": [timestamp for _, _, timestamp in rows]})
+
+    def delete(self, experiment_id: str) -> None:
+        """Remove a experiment from db with given experiment_id."""
+        self.delete_many([experiment_id])
+
+    def delete_many(self, experiment_ids: list) -> None:
+        """Delete the experiments in a single transaction, the ones that are found are deleted before raising"""
+        self._delete(self._tables["experiment"], experiment_ids)
+
+    def _delete(self, table: str, doc_ids: list) -> None:
+        try:
+            doc_ids = sorted(set(int(doc_id) for doc_id in doc_ids))
+        except ValueError:
+            raise KeyError("keys {} not found in SQLite".format(doc_ids))
+        deleted = 0
+        with self._transaction() as connection:
+            for ids in chunks(doc_ids):
+                deleted += connection.execute("DELETE FROM {} WHERE id IN ({})".format(table, placeholders(ids)),
+                                              ids).rowcount
+        if deleted < len(doc_ids):
+            raise KeyError("keys {} not found in SQLite".format(doc_ids))
+
+    def delete_mse(self, experiment_id: str) -> None:
+        """Remove a experiment from db with given experiment_id."""
+        doc = self.get(experiment_id, "multistage")
+        if doc is None:
+            raise KeyError("key {} not found in SQLite".format(experiment_id))
+        self._delete(self._tables["multistage"], [experiment_id])
+        self.delete_many([exp_id for step, exp_id in doc['experiments']])
+
+    def delete_all(self) -> None:
+        """Remove all experiments from db."""
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM {}".format(self._metrics))
+            for table in self._tables.values():
+                connection.execute("DELETE FROM {}_values".format(table))
+                connection.execute("DELETE FROM {}".format(table))
@@ -1,10 +1,19 @@
+import copy
+import heapq
+from collections import Counter
 from functools import reduce
 import tinydb
-from .database import ExperimentQuery, MultiStageExperimentQuery
+from .database import ExperimentQuery, MultiStageExperimentQuery, PAGE_SIZE
 from typing import Any
-from .helpers import set_inner, add_inner
+from .helpers import set_inner, add_inner, extend_inner, last_value, project
 from tinydb.operations import add, set
 from .db_abc import DB
+from .storage import AtomicJSONStorage, WriteBehindMiddleware
+
+
+def detach(doc: (dict, None)) -> (dict, None):
+    """Copy a document that shares its values with the cached data, so changing it does not change the db"""
+    return copy.deepcopy(doc)
 
 
 def create_tinydb_exp_query(query: ExperimentQuery):
@@ -24,6 +33,8 @@ def create_tinydb_exp_query(query: ExperimentQuery):
     if len(query.schema_param_hashes) > 0:
         pattern = r"(" + r")|(".join(query.schema_param_hashes) + r")"
         query_list.append(eq.parameter_hash.matches(pattern))
+    if len(query.hashes) > 0:
+        query_list.append(eq.hash.test(lambda value: value in query.hashes))
     if len(query.status) > 0:
         pattern = r"(" + r")|(".join(query.status) + r")"
         query_list.append(eq.status.matches(pattern))
@@ -43,7 +54,7 @@ def create_tinydb_mse_query(query: MultiStageExperimentQuery):
         else:
             query_list.append(eq.tags.any(query.tags))
     if len(query.hashes) > 0:
-        pattern = r"(" + r")|(".join(query.schema_hashes) + r")"
+        pattern = r"(" + r")|(".join(query.hashes) + r")"
         query_list.append(eq.hash.matches(pattern))
     if len(query.steps) > 0:
         if query.query_type == "and":
@@ -63,85 +74,162 @@ class TinyDB(DB):  # noqa : E801
     """
 
     def __init__(self, db_path: str, db_name: str):
-        """Connect to db."""
-        db = tinydb.TinyDB(db_path + '/jikken_db.json')
+        """Connect to db, the data is kept in memory and written behind, see WriteBehindMiddleware"""
+        self._storage = WriteBehindMiddleware(AtomicJSONStorage)
+        db = tinydb.TinyDB(db_path + '/jikken_db.json', storage=self._storage)
+        self._handle = db
         self._db = dict()
+        self._tables = dict()
         for collection in self.collections:
-            self._db[collection] = db.table(db_name + "_" + collection)
+            self._tables[collection] = db_name + "_" + collection
+            self._db[collection] = db.table(self._tables[collection])
 
     def stop_db(self):
-        """Disconnect from DB."""
-        pass
+        """Write the buffered changes and disconnect from DB."""
+        self._handle.close()
+
+    def flush(self) -> None:
+        self._storage.flush()
 
     def add(self, doc: dict) -> str:
-        _id = self._db[doc["type"]].insert(doc)
-        doc['id'] = str(_id)
-        self._db[doc["type"]].update(doc, eids=[_id])
+        """Insert the document together with its id in a single write
+
+        The id is taken under the file lock after the writes of other processes are read, and the document is
+        written before the lock is released, so two processes never add documents with the same id
+        """
+        with self._storage.exclusive():
+            _id = self._storage.next_id(self._tables[doc["type"]])
+            doc['id'] = str(_id)
+            self._storage.insert(self._tables[doc["type"]], _id, doc)
+            self._db[doc["type"]].clear_cache()
         return str(_id)
 
     def get(self, doc_id: str, collection: str) -> int:
         """Return a experiment dict with matching id."""
-        return self._db[collection].get(eid=int(doc_id))
+        return detach(self._db[collection].get(eid=int(doc_id)))
+
+    def get_many(self, doc_ids: list, collection: str, fields: list = None, exclude: list = None) -> list:
+        """Return the documents of doc_ids from a single read of the table."""
+        docs = {doc.doc_id: doc for doc in self._db[collection].all()}
+        return [detach(project(docs.get(int(doc_id)), fields, exclude)) for doc_id in doc_ids]
 
     def list_experiments(self, query: ExperimentQuery) -> list:
-        """Return list of experiments."""
-        if query.is_empty():
-            return self._db["experiment"].all()
-        elif len(query.ids) > 0:
-            return [self.get(_id, "experiment") for _id in query.ids]
-        else:
-            complex_query = create_tinydb_exp_query(query=query)
-            return self._db["experiment"].search(complex_query)
+        """Return list of experiments, the projection of the query is applied after reading them."""
+        if len(query.ids) > 0:
+            return self.get_many(query.ids, "experiment", fields=query.fields, exclude=query.exclude)
+        return list(self.iter_experiments(query))
+
+    def iter_experiments(self, query: ExperimentQuery, page_size: int = PAGE_SIZE):
+        """Yield the experiments that match the query one at a time
+
+        TinyDB reads the whole file at once, so only the matching and the projection are done lazily
+        """
+        if len(query.ids) > 0:
+            yield from self.iter_many(query.ids, "experiment", page_size=page_size, fields=query.fields,
+                                      exclude=query.exclude)
+            return
+        complex_query = None if query.is_empty() else create_tinydb_exp_query(query=query)
+        for doc in self._db["experiment"]:
+            if complex_query is None or complex_query(doc):
+                yield detach(project(doc, query.fields, query.exclude))
+
+    def best(self, query: ExperimentQuery, metric: str, optimum: str = "min", k: int = 1) -> list:
+        """Keep the k best last values in a heap while scanning the matching experiments
+
+        Only the metric is projected during the scan, the k best documents are read once it is done
+        """
+        scan_query = query.with_projection(fields=["monitored." + metric])
+        values = ((last_value(doc.get("monitored", {}).get(metric)), doc["id"])
+                  for doc in self.iter_experiments(scan_query))
+        select = heapq.nsmallest if optimum == "min" else heapq.nlargest
+        best = select(k, ((value, _id) for value, _id in values if value is not None), key=lambda item: item[0])
+        return self.get_many([_id for _, _id in best], "experiment", fields=query.fields, exclude=query.exclude)
 
     def list_ms_experiments(self, query: MultiStageExperimentQuery) -> None:
         if query.is_empty():
-            return self._db["multistage"].all()
+            return detach(self._db["multistage"].all())
         elif len(query.ids) > 0:
             return [self.get(_id, "multistage") for _id in query.ids]
         else:
             complex_query = create_tinydb_mse_query(query=query)
-            return self._db["multistage"].search(complex_query)
+            return detach(self._db["multistage"].search(complex_query))
+
+    def count(self, query: (ExperimentQuery, MultiStageExperimentQuery) = None, collection: str = None) -> int:
+        """Return number of documents of a collection that match the query or of every collection in db."""
+        if collection is None:
+            return sum([len(self._db[collection]) for collection in self.collections])
+        elif query is None or query.is_empty():
+            return len(self._db[collection])
+        elif len(query.ids) > 0:
+            return len([doc for doc in self.get_many(query.ids, collection) if doc is not None])
+        create_query = create_tinydb_mse_query if collection == "multistage" else create_tinydb_exp_query
+        return self._db[collection].count(create_query(query=query))
 
-    def count(self) -> int:
-        """Return number of experiments in db."""
-        count = sum([len(self._db[collection]) for collection in self.collections])
-        return count
+    def distinct(self, field: str, query: ExperimentQuery) -> list:
+        """Return the distinct values of a field, TinyDB has no indexes so only the field is projected in a scan"""
+        return list(self.group_count(field, query).keys())
+
+    def group_count(self, field: str, query: ExperimentQuery) -> dict:
+        counts = Counter()
+        for doc in self.iter_experiments(query.with_projection(fields=[field])):
+            value = reduce(lambda ref, key: ref.get(key) if isinstance(ref, dict) else None, field.split("."), doc)
+            counts.update(value if isinstance(value, list) else [] if value is None else [value])
+        return dict(counts)
 
     def update(self, experiment_id: str, experiment: dict) -> None:
         """Modify experiment in db with given experiment_id."""
-        self._db["experiment"].update(experiment, eids=[int(experiment_id)])
+        with self._storage.changing(self._tables["experiment"], [experiment_id]):
+            self._db["experiment"].update(experiment, eids=[int(experiment_id)])
 
     def update_key(self, experiment_id: str, value: Any, key: (list, str), mode='set') -> None:
         experiment_id = int(experiment_id)
-        if mode == 'set' and isinstance(key, list):
-            self._db["experiment"].update(set_inner(key, value), eids=[experiment_id])
-        elif mode == 'set':
-            self._db["experiment"].update(set(key, value), eids=[experiment_id])
-        elif mode == 'add' and isinstance(key, list):
-            self._db["experiment"].update(add_inner(key, value), eids=[experiment_id])
-        elif mode == 'add':
-            self._db["experiment"].update(add(key, value), eids=[experiment_id])
-        else:
-            raise ValueError("update mode {} not supported ".format(mode))
+        with self._storage.changing(self._tables["experiment"], [experiment_id]):
+            if mode == 'set' and isinstance(key, list):
+                self._db["experiment"].update(set_inner(key, value), eids=[experiment_id])
+            elif mode == 'set':
+                self._db["experiment"].update(set(key, value), eids=[experiment_id])
+            elif mode == 'add' and isinstance(key, list):
+                self._db["experiment"].update(add_inner(key, value), eids=[experiment_id])
+            elif mode == 'add':
+                self._db["experiment"].update(add(key, value), eids=[experiment_id])
+            elif mode == 'extend':
+                key = key if isinstance(key, list) else [key]
+                self._db["experiment"].update(extend_inner(key, value), eids=[experiment_id])
+            else:
+                raise ValueError("update mode {} not supported ".format(mode))
+
+    def extend_many(self, experiment_id: str, extensions: list) -> None:
+        """Extend every key with a single update of the document"""
+        experiment_id = int(experiment_id)
+        transforms = [extend_inner(key if isinstance(key, list) else [key], values) for key, values in extensions]
+
+        def transform(doc):
+            for extend in transforms:
+                extend(doc)
+
+        with self._storage.changing(self._tables["experiment"], [experiment_id]):
+            self._db["experiment"].update(transform, eids=[experiment_id])
 
     def delete(self, experiment_id: str) -> None:
         """Remove a experiment from db with given experiment_id."""
-        try:
-            self._db["experiment"].remove(eids=[int(experiment_id)])
-        except ValueError:
-            raise KeyError("key {} not found in TinyDB".format(experiment_id))
+        with self._storage.changing(self._tables["experiment"], [experiment_id]):
+            try:
+                self._db["experiment"].remove(eids=[int(experiment_id)])
+            except ValueError:
+                raise KeyError("key {} not found in TinyDB".format(experiment_id))
 
     def delete_mse(self, experiment_id: str) -> None:
         """Remove a experiment from db with given experiment_id."""
         doc = self.get(experiment_id, "multistage")
-        try:
-            self._db["multistage"].remove(eids=[int(experiment_id)])
-        except ValueError:
-            raise KeyError("key {} not found in TinyDB".format(experiment_id))
-        for step, exp_id in doc['experiments']:
-            self.delete(exp_id)
+        with self._storage.changing(self._tables["multistage"], [experiment_id]):
+            try:
+                self._db["multistage"].remove(eids=[int(experiment_id)])
+            except ValueError:
+                raise KeyError("key {} not found in TinyDB".format(experiment_id))
+        self.delete_many([exp_id for step, exp_id in doc['experiments']])
 
     def delete_all(self) -> None:
         """Remove all experiments from db."""
         for collection in self.collections:
-            self._db[collection].purge()
+            with self._storage.changing(self._tables[collection]):
+                self._db[collection].purge()
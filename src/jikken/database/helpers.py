@@ -1,5 +1,10 @@
+import math
 from functools import singledispatch
 
+from .series import is_numeric
+
+LAST_VALUES = "monitored_last"  # the field with the last value of every monitored metric that es sorts on
+
 
 def map_multistage(multistage):
     return multistage
@@ -17,17 +22,77 @@ def map_experiment(experiment: dict):
 
 
 def inv_map_experiment(experiment: dict):
-    new_experiment = {}
-    for key in experiment['variables'].keys():
-        new_key = key.replace("__", ".")
-        new_experiment[new_key] = experiment['variables'][key]
-    experiment['variables'] = new_experiment
+    """Map a mongo experiment back, fields that were left out by a projection stay out"""
+    if 'variables' in experiment:
+        new_experiment = {}
+        for key in experiment['variables'].keys():
+            new_key = key.replace("__", ".")
+            new_experiment[new_key] = experiment['variables'][key]
+        experiment['variables'] = new_experiment
     experiment['id'] = str(experiment.pop("_id"))
-    experiment['stdout'] = "".join([line for line in experiment['stdout']])
-    experiment['stderr'] = "".join([line for line in experiment['stderr']])
+    for std_type in ['stdout', 'stderr']:
+        if std_type in experiment:
+            experiment[std_type] = "".join([line for line in experiment[std_type]])
     return experiment
 
 
+ALWAYS_PROJECTED = ("id", "type")  # fields that every projection returns
+
+
+def last_value(value) -> (float, None):
+    """Return the last value of a monitored metric or None if it is not a finite real number
+
+    A run that diverged logs nan or inf, it must never be taken as the best one
+    """
+    if isinstance(value, list):
+        value = value[-1] if len(value) > 0 else None
+    return float(value) if is_numeric(value) and math.isfinite(value) else None
+
+
+def project(doc: (dict, None), fields: list = None, exclude: list = None) -> (dict, None):
+    """Return a copy of the document with only fields or without exclude, dotted names select nested fields
+
+    The document itself is not changed
+    """
+    if doc is None or (not fields and not exclude):
+        return doc
+    if fields:
+        result = {key: doc[key] for key in ALWAYS_PROJECTED if key in doc}
+        for field in fields:
+            keys = field.split(".")
+            source, target = doc, result
+            for key in keys[:-1]:
+                if not isinstance(source.get(key), dict):
+                    break
+                source = source[key]
+                target = target.setdefault(key, {})
+            else:
+                if keys[-1] in source:
+                    target[keys[-1]] = source[keys[-1]]
+        return result
+    result = dict(doc)
+    for field in exclude:
+        keys = field.split(".")
+        target = result
+        for key in keys[:-1]:
+            if not isinstance(target.get(key), dict):
+                break
+            target[key] = dict(target[key])
+            target = target[key]
+        else:
+            target.pop(keys[-1], None)
+    return result
+
+
+def mongo_projection(fields: list = None, exclude: list = None) -> (dict, None):
+    """Return the mongo projection of fields or exclude"""
+    if fields:
+        return dict({field: 1 for field in fields}, type=1)
+    elif exclude:
+        return {field: 0 for field in exclude}
+    return None
+
+
 @singledispatch
 def add_mongo(value, *, key):
     if isinstance(key, list):
@@ -63,6 +128,13 @@ def _(value, *, key):
     return {"$addToSet": {key: value}}
 
 
+def extend_mongo(values, *, key):
+    """$push creates the array if it is missing so no read is needed before appending"""
+    if isinstance(key, list):
+        key = ".".join(key)
+    return {"$push": {key: {"$each": values}}}
+
+
 def set_mongo(value, *, key):
     # value = [value] if key in ["stdout", "stderr"] else value
     if isinstance(key, list):
@@ -85,21 +157,37 @@ def add_inner(fields, n):
 
 def set_inner(fields, n):
     """
-    Set n from a given field in the document.
+    Set n from a given field in the document, creating the parent fields if they are missing.
     """
 
     def transform(doc):
+        ref = doc
         for field in fields[:-1]:
-            ref = doc[field]
+            ref = ref.setdefault(field, {})
         ref[fields[-1]] = n
 
     return transform
 
 
+def extend_inner(fields, values):
+    """
+    Extend a list field in the document with values, creating the field if it is missing.
+    """
+
+    def transform(doc):
+        ref = doc
+        for field in fields[:-1]:
+            ref = ref.setdefault(field, {})
+        ref.setdefault(fields[-1], []).extend(values)
+
+    return transform
+
+
 def map_es_experiment(experiment: dict, doc_type="experiment"):
     if doc_type == "experiment":
         experiment['stdout'] = []
         experiment['stderr'] = []
+        experiment[LAST_VALUES] = {key: last_value(value) for key, value in experiment.get('monitored', {}).items()}
     return experiment
 
 
@@ -107,9 +195,11 @@ def inv_map_es_experiment(experiment: dict, doc_type="experiment"):
     _id = experiment["_id"]
     experiment = experiment['_source']
     experiment['id'] = str(_id)
+    experiment.pop(LAST_VALUES, None)
     if doc_type == 'experiment':
-        experiment['stdout'] = "".join([line for line in experiment['stdout']])
-        experiment['stderr'] = "".join([line for line in experiment['stderr']])
+        for std_type in ['stdout', 'stderr']:
+            if std_type in experiment:
+                experiment[std_type] = "".join([line for line in experiment[std_type]])
     return experiment
 
 
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import shutil
+import struct
+import zlib
+from bisect import bisect_right
+
+index_entry = struct.Struct("<QQQQ")  # chunk offset, chunk length, log offset, log length
+STD_TYPES = ("stdout", "stderr")
+
+
+def log_directory(log_path: str, db_type: str, db_path: str, db_name: str) -> str:
+    """Return the directory of the logs of a database inside the log path
+
+    Several databases can share a log path, e.g. the tinydb of every project, and their experiment ids
+    overlap, so every database has its own directory <log_path>/<db_type>/<db_name>/<hash of the db path>
+    """
+    path_hash = hashlib.sha1(os.path.abspath(os.path.expanduser(db_path)).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(log_path, db_type, db_name, path_hash)
+
+
+class LogStore:
+    """Append only store for the stdout and stderr of experiments
+
+    Every append is written as a zlib compressed chunk at the end of <path>/<exp_id>/<std_type>.chunks
+    and an entry with the offsets of the chunk and of the text it holds is added to the .index file next
+    to it, so a byte range or the tail of a log can be read by decompressing only the chunks it spans.
+    Offsets and sizes are in bytes of the utf-8 encoded log.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _paths(self, exp_id, std_type: str) -> tuple:
+        if std_type not in STD_TYPES:
+            raise ValueError("std_type was not stdout or stderr")
+        exp_dir = os.path.join(self.path, str(exp_id))
+        return os.path.join(exp_dir, std_type + ".chunks"), os.path.join(exp_dir, std_type + ".index")
+
+    def _index(self, exp_id, std_type: str) -> list:
+        _, index_path = self._paths(exp_id, std_type)
+        if not os.path.exists(index_path):
+            return []
+        with open(index_path, "rb") as file_handle:
+            data = file_handle.read()
+        # an entry that was cut short by a crash is ignored
+        entries = len(data) // index_entry.size
+        return [index_entry.unpack_from(data, entry * index_entry.size) for entry in range(entries)]
+
+    def append(self, exp_id, std_type: str, text: str) -> int:
+        """Append text to a log and return the new size of the log"""
+        chunks_path, index_path = self._paths(exp_id, std_type)
+        os.makedirs(os.path.dirname(chunks_path), exist_ok=True)
+        log_offset = self.size(exp_id, std_type)
+        data = text.encode('utf-8')
+        if len(data) == 0:
+            return log_offset
+        chunk = zlib.compress(data)
+        with open(chunks_path, "ab") as file_handle:
+            chunk_offset = file_handle.tell()
+            file_handle.write(chunk)
+        with open(index_path, "ab") as file_handle:
+            file_handle.write(index_entry.pack(chunk_offset, len(chunk), log_offset, len(data)))
+        return log_offset + len(data)
+
+    def size(self, exp_id, std_type: str) -> int:
+        """Return the size of a log from the last entry of its index"""
+        _, index_path = self._paths(exp_id, std_type)
+        if not os.path.exists(index_path):
+            return 0
+        entries = os.path.getsize(index_path) // index_entry.size
+        if entries == 0:
+            return 0
+        with open(index_path, "rb") as file_handle:
+            file_handle.seek((entries - 1) * index_entry.size)
+            _, _, log_offset, log_length = index_entry.unpack(file_handle.read(index_entry.size))
+        return log_offset + log_length
+
+    def _read_chunks(self, exp_id, std_type: str, entries: list) -> bytes:
+        chunks_path, _ = self._paths(exp_id, std_type)
+        data = []
+        with open(chunks_path, "rb") as file_handle:
+            for chunk_offset, chunk_length, _, _ in entries:
+                file_handle.seek(chunk_offset)
+                data.append(zlib.decompress(file_handle.read(chunk_length)))
+        return b"".join(data)
+
+    def read(self, exp_id, std_type: str, start: int = 0, end: int = None) -> str:
+        """Return the part of a log between the byte offsets start and end"""
+        index = self._index(exp_id, std_type)
+        if len(index) == 0:
+            return ""
+        size = index[-1][2] + index[-1][3]
+        end = size if end is None else min(end, size)
+        if start >= end:
+            return ""
+        log_offsets = [entry[2] for entry in index]
+        first = bisect_right(log_offsets, start) - 1
+        last = bisect_right(log_offsets, end - 1)
+        data = self._read_chunks(exp_id, std_type, index[first:last])
+        base = index[first][2]
+        return data[start - base:end - base].decode('utf-8', errors='replace')
+
+    def tail(self, exp_id, std_type: str, lines: int = 10) -> str:
+        """Return the last lines of a log, reading chunks backwards until enough lines are found"""
+        index = self._index(exp_id, std_type)
+        data = b""
+        for first in range(len(index) - 1, -1, -1):
+            data = self._read_chunks(exp_id, std_type, index[first:first + 1]) + data
+            if data.rstrip(b"\n").count(b"\n") >= lines:
+                break
+        text = data.decode('utf-8', errors='replace')
+        trailing_newline = text.endswith("\n")
+        tail_lines = text.rstrip("\n").split("\n")[-lines:] if lines > 0 else []
+        return "\n".join(tail_lines) + ("\n" if trailing_newline and len(tail_lines) > 0 else "")
+
+    def delete(self, exp_id) -> None:
+        shutil.rmtree(os.path.join(self.path, str(exp_id)), ignore_errors=True)
+
+    def delete_all(self) -> None:
+        for exp_dir in os.listdir(self.path):
+            shutil.rmtree(os.path.join(self.path, exp_dir), ignore_errors=True)
@@ -1,3 +1,6 @@
+import copy
+
+
 def valid_list(value=None):
     assert value is None or isinstance(value, (tuple, list)), "value: {} is not a list or None".format(value)
     if value is None:
@@ -6,17 +9,46 @@ def valid_list(value=None):
         return list(value)
 
 
-class ExperimentQuery:
+class Projection:
+    """The fields of the documents returned by a query
+
+    Either only the fields are returned or every field except exclude, nested fields are selected with dots
+    e.g. monitored.loss. The id and type of a document are always returned.
+    """
+
+    def _set_projection(self, fields=None, exclude=None):
+        self._fields = valid_list(fields)
+        self._exclude = valid_list(exclude)
+        assert len(self._fields) == 0 or len(self._exclude) == 0, "fields and exclude cannot be used together"
+
+    @property
+    def fields(self):
+        return self._fields
+
+    @property
+    def exclude(self):
+        return self._exclude
+
+    def with_projection(self, fields=None, exclude=None):
+        """Return a copy of the query that returns only fields or every field except exclude"""
+        query = copy.copy(self)
+        query._set_projection(fields=fields, exclude=exclude)
+        return query
+
+
+class ExperimentQuery(Projection):
     def __init__(self, tags=None, ids=None, schema_hashes=None, status=None, schema_param_hashes=None, names=None,
-                 query_type="all"):
+                 hashes=None, query_type="all", fields=None, exclude=None):
         self._tags = valid_list(tags)
         self._ids = valid_list(ids)
         self._schema_hashes = valid_list(schema_hashes)
         self._schema_param_hashes = valid_list(schema_param_hashes)
+        self._hashes = valid_list(hashes)
         self._status = valid_list(status)
         self._names = valid_list(names)
         assert query_type in ["all", "any"], "query type {} is not valid".format(query_type)
         self._query_type = "and" if query_type == "all" else "or"
+        self._set_projection(fields=fields, exclude=exclude)
 
     @property
     def tags(self):
@@ -34,6 +66,10 @@ class ExperimentQuery:
     def schema_param_hashes(self):
         return self._schema_param_hashes
 
+    @property
+    def hashes(self):
+        return self._hashes
+
     @property
     def names(self):
         return self._names
@@ -48,14 +84,18 @@ class ExperimentQuery:
 
     def is_empty(self):
         return len(self.tags) == len(self.names) == len(self.schema_hashes) == len(self.schema_param_hashes) == len(
-            self.ids) == 0
-    def __repr__(self):
-        return "ids: {}\ntags: {}\nnames: {}\nschema_hashes: {}\nschema_param_hashes {}\nstatus:{}\nquery_type: {}".format(
-            self.ids, self.tags, self.names, self.schema_hashes, self.schema_param_hashes, self.status, self.query_type
-        )
+            self.hashes) == len(self.ids) == len(self.status) == 0
 
-class MultiStageExperimentQuery:
-    def __init__(self, tags=None, ids=None, names=None, steps=None, hashes=None, query_type="all"):
+    def __repr__(self):
+        return "ids: {}\ntags: {}\nnames: {}\nschema_hashes: {}\nschema_param_hashes {}\nhashes: {}\nstatus:{}\n" \
+               "query_type: {}".format(self.ids, self.tags, self.names, self.schema_hashes, self.schema_param_hashes,
+                                       self.hashes, self.status, self.query_type)
+
+class MultiStageExperimentQuery(Projection):
+    def __init__(self, tags=None, ids=None, names=None, steps=None, hashes=None, query_type="all", fields=None,
+                 exclude=None):
+        """The fields and exclude projection applies to the experiments of the stages, the multistage
+        documents only hold their names and ids and are always returned whole"""
         self._tags = valid_list(tags)
         self._ids = valid_list(ids)
         self._hashes = valid_list(hashes)
@@ -63,6 +103,7 @@ class MultiStageExperimentQuery:
         self._names = valid_list(names)
         assert query_type in ["all", "any"], "query type {} is not valid".format(query_type)
         self._query_type = "and" if query_type == "all" else "or"
+        self._set_projection(fields=fields, exclude=exclude)
 
     @property
     def tags(self):
@@ -0,0 +1,45 @@
+import numbers
+from collections import namedtuple
+
+Series = namedtuple("Series", ["step", "timestamp", "value"])
+
+NO_STEP = -1  # stored as the step of values that were logged without one
+
+
+def is_numeric(value) -> bool:
+    """Only real numbers are returned in series, bools and other values are kept in monitored only"""
+    return not isinstance(value, bool) and isinstance(value, numbers.Real)
+
+
+def series_columns(values: list, steps: list = None, timestamps: list = None) -> dict:
+    """Return the step and timestamp columns of a batch of monitored values
+
+    The values themselves are only stored in the monitored list of the key, the columns hold one point
+    for every value, so they are appended in place next to it. Missing steps are stored as NO_STEP and
+    missing timestamps as None
+    """
+    steps = [None] * len(values) if steps is None else steps
+    timestamps = [None] * len(values) if timestamps is None else timestamps
+    assert len(steps) == len(timestamps) == len(values), "series columns must have the same length"
+    return {"step": [NO_STEP if step is None else int(step) for step in steps],
+            "timestamp": [None if timestamp is None else float(timestamp) for timestamp in timestamps]}
+
+
+def decode_series(values: list, columns: dict = None) -> Series:
+    """Combine the monitored values of a key with its step and timestamp columns into NumPy arrays
+
+    Only the real numbers are returned. Values that were appended before the columns were kept have no
+    point and get NO_STEP and nan
+    """
+    import numpy as np
+    columns = {} if columns is None else columns
+    steps = list(columns.get("step", []))[-len(values):] if len(values) > 0 else []
+    timestamps = list(columns.get("timestamp", []))[-len(values):] if len(values) > 0 else []
+    missing = len(values) - len(steps)
+    steps = [NO_STEP] * missing + steps
+    timestamps = [None] * (len(values) - len(timestamps)) + timestamps
+    numeric = [index for index, value in enumerate(values) if is_numeric(value)]
+    return Series(step=np.array([steps[index] for index in numeric], dtype="<i8"),
+                  timestamp=np.array([np.nan if timestamps[index] is None else timestamps[index]
+                                      for index in numeric], dtype="<f8"),
+                  value=np.array([values[index] for index in numeric], dtype="<f8"))
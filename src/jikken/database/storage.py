@@ -0,0 +1,222 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from threading import RLock, Timer
+
+from tinydb.middlewares import CachingMiddleware
+from tinydb.storages import Storage
+
+try:
+    import fcntl
+except ImportError:  # not available on windows, concurrent flushes are not locked there
+    fcntl = None
+
+WRITE_CACHE_SIZE = 1000  # the number of buffered writes that triggers a write of the TinyDB file
+FLUSH_INTERVAL = 1.0  # the maximum number of seconds a write is buffered before the TinyDB file is written
+
+
+class AtomicJSONStorage(Storage):
+    """Store the TinyDB data as JSON in a temporary file that is renamed over the previous one
+
+    A crash while writing leaves the previous file in place instead of a truncated one.
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super(AtomicJSONStorage, self).__init__()
+        self.path = path
+        self.kwargs = kwargs
+
+    def version(self) -> (tuple, None):
+        """Return what changes whenever the file is written, None if there is no file"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def read(self) -> (dict, None):
+        try:
+            with open(self.path) as file_handle:
+                data = file_handle.read()
+        except (IOError, OSError):
+            return None
+        return json.loads(data) if data.strip() else None
+
+    def write(self, data: dict) -> None:
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        try:
+            with open(tmp_path, "w") as file_handle:
+                json.dump(data, file_handle, **self.kwargs)
+                file_handle.flush()
+                os.fsync(file_handle.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def close(self) -> None:
+        pass
+
+
+class WriteBehindMiddleware(CachingMiddleware):
+    """Keep the TinyDB data in memory and write it after write_cache_size writes or flush_interval seconds
+
+    Other processes can write the same file, e.g. the workers of a sweep. The data is read again when the
+    file changed, and the documents this process changed but did not write yet are applied to it, so the
+    writes of the other processes are kept. The documents a write changes are recorded in a changing block
+    around the write. Flushes and the blocks of exclusive hold a lock on a file next to the data.
+
+    A timer flushes buffered writes after flush_interval seconds, so a last write is not kept in memory
+    while the process is idle. The largest id of every table is tracked whenever stored data is read, so
+    new ids are handed out with next_id without scanning the table.
+    """
+
+    def __init__(self, storage_cls=AtomicJSONStorage, write_cache_size: int = WRITE_CACHE_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL):
+        super(WriteBehindMiddleware, self).__init__(storage_cls)
+        self.WRITE_CACHE_SIZE = write_cache_size
+        self._flush_interval = flush_interval
+        self._first_write = None
+        self._version = None
+        self._changed = {}
+        self._lock = RLock()
+        self._lock_depth = 0
+        self._last_ids = {}
+        self._timer = None
+
+    def read(self):
+        with self._lock:
+            version = self.storage.version()
+            if self.cache is None or version != self._version:
+                stored = self.storage.read()
+                self._track(stored or {})
+                self.cache = stored if self.cache is None or self._cache_modified_count == 0 else \
+                    self._merge(stored or {})
+                self._version = version
+            return self.cache
+
+    @contextmanager
+    def changing(self, table: str, doc_ids: list = None):
+        """Record the documents of a table that the write of the block changes, all of them if doc_ids is None
+
+        The timer does not flush while the block runs, so the record is kept until the write is flushed
+        """
+        with self._lock:
+            if doc_ids is None:
+                self._changed[table] = None
+            elif self._changed.get(table, ()) is not None:
+                self._changed.setdefault(table, set()).update(str(doc_id) for doc_id in doc_ids)
+            yield
+
+    def next_id(self, table: str) -> int:
+        """Return a new id of the table, call it in an exclusive block so other processes do not take it"""
+        with self._lock:
+            self._last_ids[table] = self._last_ids.get(table, 0) + 1
+            return self._last_ids[table]
+
+    def insert(self, table: str, doc_id: int, doc: dict) -> None:
+        """Add a document with an id from next_id in a single write"""
+        with self.changing(table, [doc_id]):
+            data = self.read() or {}
+            data.setdefault(table, {})[str(doc_id)] = doc
+            self._last_ids[table] = max(self._last_ids.get(table, 0), doc_id)
+            self.write(data)
+
+    def write(self, data):
+        with self._lock:
+            self.cache = data
+            self._cache_modified_count += 1
+            if self._first_write is None:
+                self._first_write = time.monotonic()
+                self._start_timer()
+            if self._cache_modified_count >= self.WRITE_CACHE_SIZE or \
+                    time.monotonic() - self._first_write >= self._flush_interval:
+                self.flush()
+
+    def flush(self):
+        """Write the buffered data, merged into the file if another process wrote it since it was read"""
+        if self._cache_modified_count == 0:
+            return
+        with self._locked():
+            self._flush()
+
+    @contextmanager
+    def exclusive(self):
+        """Hold the file lock for the block, with the writes of other processes read first and the writes of
+        the block written before it is released, e.g. so that two processes never take the same new id"""
+        with self._locked():
+            self.read()
+            yield
+            if self._cache_modified_count > 0:
+                self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        super(WriteBehindMiddleware, self).close()
+
+    def _start_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = Timer(self._flush_interval, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _track(self, stored: dict) -> None:
+        for table, docs in stored.items():
+            if len(docs) > 0:
+                self._last_ids[table] = max([self._last_ids.get(table, 0)] + [int(doc_id) for doc_id in docs])
+
+    def _flush(self):
+        if self.storage.version() != self._version:
+            stored = self.storage.read() or {}
+            self._track(stored)
+            self.cache = self._merge(stored)
+        self.storage.write(self.cache)
+        self._version = self.storage.version()
+        self._cache_modified_count = 0
+        self._first_write = None
+        self._changed = {}
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _merge(self, stored: dict) -> dict:
+        for table, doc_ids in self._changed.items():
+            cached = {str(doc_id): doc for doc_id, doc in self.cache.get(table, {}).items()}
+            if doc_ids is None:
+                stored[table] = cached
+                continue
+            stored_table = {str(doc_id): doc for doc_id, doc in stored.get(table, {}).items()}
+            for doc_id in doc_ids:
+                if doc_id in cached:
+                    stored_table[doc_id] = cached[doc_id]
+                else:
+                    stored_table.pop(doc_id, None)
+            stored[table] = stored_table
+        for table in self.cache.keys():
+            stored.setdefault(table, {})
+        return stored
+
+    @contextmanager
+    def _locked(self):
+        """Lock the file against other processes and the middleware against other threads, a thread that holds
+        the lock can take it again"""
+        with self._lock:
+            self._lock_depth += 1
+            try:
+                if fcntl is None or self._lock_depth > 1:
+                    yield
+                    return
+                with open(self.storage.path + ".lock", "a") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        yield
+                    finally:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+            finally:
+                self._lock_depth -= 1
@@ -0,0 +1,112 @@
+import time
+from collections import OrderedDict
+from queue import Empty, Queue
+from threading import Thread
+
+BUFFER_LIMIT = 1000  # the number of buffered characters and monitored values that triggers a database write
+FLUSH_INTERVAL = 1.0  # the maximum number of seconds an update is buffered before it is written to the database
+
+
+class BatchWriter:
+    """Write experiment updates to the database from a background thread
+
+    stdout/stderr chunks and monitored values are coalesced per experiment and written through the
+    bulk methods of DataBase once the buffer limit or the flush interval is reached, so the caller
+    never waits for a database round trip. Status updates and calls passed to execute run on the
+    writer thread after the pending batches have been written, which keeps the order of the updates.
+    """
+
+    def __init__(self, db, buffer_limit: int = BUFFER_LIMIT, flush_interval: float = FLUSH_INTERVAL):
+        self._db = db
+        self._buffer_limit = buffer_limit
+        self._flush_interval = flush_interval
+        self._queue = Queue()
+        self._std = OrderedDict()
+        self._monitored = OrderedDict()
+        self._buffered = 0
+        self._oldest = None
+        self._error = None
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def update_std(self, experiment_id, string: str, std_type: str) -> None:
+        self._queue.put(("std", (experiment_id, std_type), string))
+
+    def update_monitored(self, experiment_id, key: str, value, step: int = None, timestamp: float = None) -> None:
+        self._queue.put(("monitored", (experiment_id, key), (value, step, timestamp)))
+
+    def update_status(self, experiment_id, status: str) -> None:
+        self._queue.put(("call", self._db.update_status, (experiment_id, status), None))
+
+    def execute(self, function, *args) -> "Future":
+        """Run a database call on the writer thread and return a future with its result"""
+        from concurrent.futures import Future
+        future = Future()
+        self._queue.put(("call", function, args, future))
+        return future
+
+    def close(self) -> None:
+        """Write all pending updates and stop the writer thread
+
+        Raises the first error the writer thread encountered while writing a batch or a status
+        """
+        if self._thread.is_alive():
+            self._queue.put(("close", None, None))
+            self._thread.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _run(self):
+        while True:
+            timeout = None if self._oldest is None else max(0.0, self._oldest + self._flush_interval - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except Empty:
+                self._flush()
+                continue
+            if item[0] == "close":
+                self._flush()
+                break
+            elif item[0] == "call":
+                self._flush()
+                _, function, args, future = item
+                try:
+                    result = function(*args)
+                except Exception as error:
+                    if future is None:
+                        self._error = self._error or error
+                    else:
+                        future.set_exception(error)
+                else:
+                    if future is not None:
+                        future.set_result(result)
+            else:
+                kind, batch_key, value = item
+                batches = self._std if kind == "std" else self._monitored
+                batches.setdefault(batch_key, []).append(value)
+                self._buffered += len(value) if kind == "std" else 1
+                self._oldest = time.monotonic() if self._oldest is None else self._oldest
+                if self._buffered >= self._buffer_limit or time.monotonic() - self._oldest >= self._flush_interval:
+                    self._flush()
+
+    def _flush(self):
+        std, self._std = self._std, OrderedDict()
+        monitored, self._monitored = self._monitored, OrderedDict()
+        self._buffered = 0
+        self._oldest = None
+        try:
+            for (experiment_id, std_type), strings in std.items():
+                self._db.update_std_batch(experiment_id, strings, std_type)
+            for (experiment_id, key), points in monitored.items():
+                values, steps, timestamps = zip(*points)
+                self._db.update_monitored_batch(experiment_id, key, list(values), steps=list(steps),
+                                                timestamps=list(timestamps))
+        except Exception as error:
+            self._error = self._error or error
@@ -83,9 +83,10 @@ class Experiment:
 
     @property
     def hash(self):
-        hash_key = hash(self.parameters_hash) ^ hash(self._name)
+        """The md5 of the name, parameters and commit of the experiment, it is the same in every process"""
+        hash_key = self.parameters_hash + self._name
         if self.commit_id is not None:
-            hash_key = hash_key ^ hash(self.commit_id)
+            hash_key = hash_key + self.commit_id
         return get_hash(hash_key)
 
     def __hash__(self):
@@ -104,11 +105,13 @@ class Experiment:
             "tags": self.tags,
             "parameter_hash": self.parameters_hash,
             "schema_hash": self.schema_hash,
+            "hash": self.hash,
             "id": self._id,
             "stdout": "",
             "stderr": "",
             "status": "created",
             "monitored": {},
+            "series": {},
             "type": "experiment"
 
         }
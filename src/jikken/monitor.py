@@ -1,23 +1,316 @@
-import logging
-import re
 import ast
+import atexit
+import numbers
+import os
+import struct
+import sys
+import time
+import weakref
+from threading import Event, Lock, Thread
 
-logger = logging.getLogger('jekkin')
-logger.setLevel(logging.INFO)
-ch = logging.StreamHandler()
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - JEKKIN_MONITOR\t%(message)s')
+MONITOR_TAG = "JEKKIN_MONITOR\t"
+CONSTANTS = {"True": True, "False": False, "None": None}
 
-ch.setFormatter(formatter)
-logger.addHandler(ch)
+METRICS_FD_ENV = "JIKKEN_METRICS_FD"  # the env var that advertises the binary metrics channel to the script
+METRICS_FLUSH_INTERVAL = 1.0  # the maximum number of seconds a metric record is buffered in the script
+METRICS_CLOSE_TIMEOUT = 5.0  # the number of seconds the runner waits for the channel to be closed after the child exits
+NO_STEP = -1
+record_header = struct.Struct("<H")  # length of the utf-8 metric name that follows the header
+record_body = struct.Struct("<qdd")  # step, timestamp, value
 
-pattern = "JEKKIN_MONITOR\t([\w_]+)\t([\w.]+)"
-matcher = re.compile(pattern=pattern)
 
-def capture_value(line):
-    results = matcher.search(line)
-    if results:
-        return results.group(1), ast.literal_eval(results.group(2))
+def parse_scalar(text: str):
+    """Parse an int, float (including nan, inf and exponents) or True/False/None, raise ValueError otherwise"""
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    if text in CONSTANTS:
+        return CONSTANTS[text]
+    raise ValueError("{} is not a scalar".format(text))
+
+
+def parse_value(text: str):
+    """Parse a logged value
+
+    Scalars and flat vectors of scalars, either python lists ([1, -2.5e-3, nan]) or numpy arrays
+    ([1. 2. 3.]), are parsed directly. Anything else goes through ast.literal_eval and is kept as a
+    string if it is not a python literal or cannot be evaluated.
+    """
+    try:
+        return parse_scalar(text)
+    except ValueError:
+        pass
+    if len(text) > 1 and text[0] in "[(" and text[-1] in "])":
+        try:
+            vector = [parse_scalar(item) for item in text[1:-1].replace(",", " ").split()]
+        except ValueError:
+            pass
+        else:
+            return vector if text[0] == "[" else tuple(vector)
+    try:
+        return ast.literal_eval(text)
+    except Exception:  # e.g. TypeError for unhashable keys or RecursionError and MemoryError for deep nesting
+        return text
+
+
+def capture_value(line: str):
+    """Return the (name, value) logged by log_value in a line of stderr or None
+
+    Lines without the monitor tag are rejected with a single substring search
+    """
+    if MONITOR_TAG not in line:
+        return None
+    name, _, value = line.partition(MONITOR_TAG)[2].partition("\t")
+    if not name.replace("_", "a").isalnum():
+        return None
+    value = value.strip()
+    if value == "":
+        return None
+    return name, parse_value(value)
+
+
+_logger = None
+
+
+def get_logger():
+    """Return the logger of log_value, logging is only imported and configured when a value is logged"""
+    global _logger
+    if _logger is None:
+        import logging
+        logger = logging.getLogger('jekkin')
+        logger.setLevel(logging.INFO)
+
+        class StderrHandler(logging.StreamHandler):
+            """Write to the current sys.stderr, which may have been replaced after the logger was created"""
+
+            @property
+            def stream(self):
+                return sys.stderr
+
+            @stream.setter
+            def stream(self, value):
+                pass
+
+        ch = StderrHandler()
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - JEKKIN_MONITOR\t%(message)s')
+        ch.setFormatter(formatter)
+        logger.addHandler(ch)
+        _logger = logger
+    return _logger
 
 
 def log_value(name, value):
-    logger.info(msg="{}\t{}".format(name, value))
+    get_logger().info(msg="{}\t{}".format(name, value))
+
+
+def encode_metric(name: str, value: float, step: int = None, timestamp: float = None) -> bytes:
+    """Encode a numeric metric as a binary record of the metrics channel"""
+    name = name.encode('utf-8')
+    step = NO_STEP if step is None else int(step)
+    timestamp = time.time() if timestamp is None else timestamp
+    return record_header.pack(len(name)) + name + record_body.pack(step, timestamp, float(value))
+
+
+def decode_metrics(buffer: bytes) -> tuple:
+    """Decode the complete records of the metrics channel found in the buffer
+
+    Returns:
+        tuple: a list of (name, step, timestamp, value) records and the number of bytes consumed
+    """
+    records = []
+    offset = 0
+    while len(buffer) - offset >= record_header.size:
+        name_length, = record_header.unpack_from(buffer, offset)
+        body_offset = offset + record_header.size + name_length
+        if len(buffer) < body_offset + record_body.size:
+            break
+        name = bytes(buffer[offset + record_header.size:body_offset]).decode('utf-8')
+        step, timestamp, value = record_body.unpack_from(buffer, body_offset)
+        records.append((name, None if step == NO_STEP else step, timestamp, value))
+        offset = body_offset + record_body.size
+    return records, offset
+
+
+class MetricsChannel:
+    """Script side of the binary metrics channel, records are buffered and flushed at most
+    flush_interval seconds after they are written by a daemon thread, even if the script stops writing"""
+
+    def __init__(self, fd: int, flush_interval: float = METRICS_FLUSH_INTERVAL):
+        self._file = os.fdopen(fd, 'wb', buffering=2 ** 16)
+        self._lock = Lock()
+        self._pending = Event()
+        self._flush_interval = flush_interval
+        Thread(target=self._flush_pending, daemon=True).start()
+
+    def write(self, name: str, value: float, step: int = None, timestamp: float = None) -> None:
+        with self._lock:
+            self._file.write(encode_metric(name, value, step, timestamp))
+        self._pending.set()
+
+    def flush(self) -> None:
+        self._pending.clear()
+        try:
+            with self._lock:
+                self._file.flush()
+        except (BrokenPipeError, ValueError):
+            # the runner is gone or the channel is already closed, metrics can no longer be delivered
+            pass
+
+    def _flush_pending(self) -> None:
+        while True:
+            self._pending.wait()
+            time.sleep(self._flush_interval)
+            self.flush()
+
+
+_metrics_channel = None
+
+
+def get_metrics_channel():
+    """Return the metrics channel advertised by the runner or None if the script runs without it"""
+    global _metrics_channel
+    if _metrics_channel is None and METRICS_FD_ENV in os.environ:
+        try:
+            _metrics_channel = MetricsChannel(int(os.environ[METRICS_FD_ENV]))
+        except (OSError, ValueError):
+            return None
+        atexit.register(_metrics_channel.flush)
+    return _metrics_channel
+
+
+def log_metric(name: str, value, step: int = None) -> None:
+    """Log a numeric value through the binary metrics channel of the runner
+
+    Falls back to log_value when the channel is not available or the value is not a real number
+    """
+    channel = get_metrics_channel()
+    if channel is None or isinstance(value, bool) or not isinstance(value, numbers.Real):
+        log_value(name, value)
+    else:
+        channel.write(name, value, step)
+
+
+_open_monitors = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_monitors() -> None:
+    """Flush the monitors that are still open at exit, closed and collected monitors are not kept alive"""
+    for monitor in list(_open_monitors):
+        monitor.flush()
+
+
+class Monitor:
+    """Buffered client for logging values from inside the training script
+
+    Values are kept in memory and written in batches every flush_interval seconds, once buffer_size values
+    are buffered, on flush/close and at exit. Real numbers, including NumPy scalars, go through the binary
+    metrics channel when the script is run by jikken. NumPy arrays, other values and scripts that are run
+    outside jikken are written to stderr in the format read by capture_value, without the overhead of a
+    logging record per value. e.g. ::
+
+        monitor = Monitor()
+        for step, batch in enumerate(batches):
+            monitor.log("batch_loss", train_on_batch(batch), step=step)
+    """
+
+    def __init__(self, flush_interval: float = METRICS_FLUSH_INTERVAL, buffer_size: int = 10000):
+        self._flush_interval = flush_interval
+        self._buffer_size = buffer_size
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        _open_monitors.add(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def log(self, name: str, value, step: int = None) -> None:
+        """Buffer a value, arrays are copied so they can be changed after the call"""
+        if hasattr(value, "tolist"):
+            value = value.tolist()
+        self._buffer.append((name, value, step, time.time()))
+        if len(self._buffer) >= self._buffer_size or time.monotonic() - self._last_flush > self._flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write all buffered values"""
+        buffer, self._buffer = self._buffer, []
+        self._last_flush = time.monotonic()
+        if len(buffer) == 0:
+            return
+        channel = get_metrics_channel()
+        lines = []
+        for name, value, step, timestamp in buffer:
+            if channel is not None and not isinstance(value, bool) and isinstance(value, numbers.Real):
+                channel.write(name, value, step, timestamp=timestamp)
+            else:
+                lines.append("{}{}\t{}\n".format(MONITOR_TAG, name, value))
+        if channel is not None:
+            channel.flush()
+        if len(lines) > 0:
+            sys.stderr.write("".join(lines))
+            sys.stderr.flush()
+
+    def close(self) -> None:
+        self.flush()
+        _open_monitors.discard(self)
+
+
+class MetricsReceiver:
+    """Runner side of the binary metrics channel
+
+    The write end of the pipe is inherited by the child through the fd advertised in env, the
+    records are decoded on a daemon thread and passed to callback(name, step, timestamp, value)
+    until the receiver is closed
+    """
+
+    def __init__(self, callback, close_timeout: float = METRICS_CLOSE_TIMEOUT):
+        self._callback = callback
+        self._close_timeout = close_timeout
+        self._closed = False
+        self._read_fd, self.write_fd = os.pipe()
+        self.env = dict(os.environ, **{METRICS_FD_ENV: str(self.write_fd)})
+        self._thread = Thread(target=self._read_records, daemon=True)
+
+    def start(self) -> None:
+        """Start reading, must be called once the child process has inherited the write end"""
+        os.close(self.write_fd)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Wait until the child side of the channel is closed and every record has been passed on
+
+        A process started by the child can keep the channel open after the child exits, the records
+        that are not read within close_timeout are dropped
+        """
+        if self._thread.is_alive():
+            self._thread.join(self._close_timeout)
+            self._closed = True
+        elif self._thread.ident is None:
+            os.close(self.write_fd)
+            os.close(self._read_fd)
+
+    def _read_records(self):
+        buffer = bytearray()
+        try:
+            while True:
+                chunk = os.read(self._read_fd, 2 ** 16)
+                if chunk == b'':
+                    break
+                buffer.extend(chunk)
+                records, consumed = decode_metrics(buffer)
+                del buffer[:consumed]
+                if self._closed:
+                    break
+                for record in records:
+                    self._callback(*record)
+        finally:
+            os.close(self._read_fd)
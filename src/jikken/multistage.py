@@ -81,9 +81,9 @@ class MultiStageExperiment:
             return -1
 
     def step_hash_key(self, step):
-        hash_key = hash(self._name)
+        hash_key = get_hash(self._name)
         for key, item in self._experiments.items():
-            hash_key = hash(hash_key) ^ hash(key) ^ hash(item)
+            hash_key = get_hash(hash_key + key + item.hash)
             if key == step:
                 break
         return hash_key
@@ -97,7 +97,7 @@ class MultiStageExperiment:
             raise ValueError("step {} is not in multistage".format(step))
 
     def __hash__(self):
-        return self._hashes[self.last_stage]
+        return hash(self._hashes[self.last_stage])
 
     def __eq__(self, other):
         return hash(self) == hash(other)
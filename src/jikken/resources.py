@@ -0,0 +1,149 @@
+import os
+import time
+from threading import Event, Thread
+
+RESOURCE_INTERVAL = None  # the default seconds between two samples of the resources of an experiment, None disables it
+CUMULATIVE = ("proc_cpu_time", "proc_read_bytes", "proc_write_bytes")  # the resources that never decrease
+PROC = "/proc"
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def read_file(path: str) -> (str, None):
+    try:
+        with open(path) as file_handle:
+            return file_handle.read()
+    except (IOError, OSError):
+        return None
+
+
+def child_pids(pid: int) -> list:
+    """Return the pids of the children of a process"""
+    children = []
+    task_dir = os.path.join(PROC, str(pid), "task")
+    try:
+        tids = os.listdir(task_dir)
+    except OSError:
+        return children
+    for tid in tids:
+        data = read_file(os.path.join(task_dir, tid, "children"))
+        if data is None:
+            return scan_child_pids(pid)
+        children.extend(int(child) for child in data.split())
+    return children
+
+
+def scan_child_pids(pid: int) -> list:
+    """Find the children of a process by scanning /proc, used when the kernel has no children files"""
+    children = []
+    for entry in os.listdir(PROC):
+        if entry.isdigit():
+            fields = read_stat(int(entry))
+            if fields is not None and int(fields[1]) == pid:
+                children.append(int(entry))
+    return children
+
+
+def read_stat(pid: int) -> (list, None):
+    """Return the fields of the stat of a process after the command name or None if it is gone
+
+    The first field is field 3 (state) of proc(5)
+    """
+    stat = read_file(os.path.join(PROC, str(pid), "stat"))
+    if stat is None:
+        return None
+    return stat[stat.rindex(")") + 2:].split()
+
+
+def is_exited(fields: list) -> bool:
+    return fields[0] in ("Z", "X")
+
+
+def process_usage(pid: int) -> (dict, None):
+    """Return the resource usage of a single process or None if it is gone
+
+    The cpu time and bytes include the children the process has waited for, so they are kept when a
+    child exits. A zombie has released its memory and threads, its cpu time and bytes are still counted
+    until its parent waits for it and adds them to its own
+    """
+    fields = read_stat(pid)
+    if fields is None:
+        return None
+    exited = is_exited(fields)
+    usage = {
+        "proc_cpu_time": sum(int(ticks) for ticks in fields[11:15]) / CLOCK_TICKS,
+        "proc_threads": 0 if exited else int(fields[17]),
+        "proc_rss_bytes": 0 if exited else int(fields[21]) * PAGE_SIZE,
+        "proc_read_bytes": 0,
+        "proc_write_bytes": 0,
+    }
+    io = read_file(os.path.join(PROC, str(pid), "io"))
+    if io is not None:
+        for line in io.splitlines():
+            key, _, value = line.partition(":")
+            if key in ("read_bytes", "write_bytes"):
+                usage["proc_" + key] = int(value)
+    return usage
+
+
+def tree_usage(pid: int) -> (dict, None):
+    """Return the summed resource usage of a process and all its descendants or None if it has exited"""
+    fields = read_stat(pid)
+    if fields is None or is_exited(fields):
+        return None
+    total = process_usage(pid)
+    if total is None:
+        return None
+    pending = child_pids(pid)
+    while len(pending) > 0:
+        child = pending.pop()
+        usage = process_usage(child)
+        if usage is not None:
+            for key, value in usage.items():
+                total[key] += value
+            pending.extend(child_pids(child))
+    return total
+
+
+def can_sample() -> bool:
+    return os.path.exists(os.path.join(PROC, "self", "stat"))
+
+
+class ResourceSampler:
+    """Sample the cpu time, rss, read/write bytes and thread count of a process tree from a daemon thread
+
+    Every sample is passed to callback(name, step, timestamp, value) once per resource, with the
+    sample index as step. Nothing is sampled if /proc is not available. The cumulative resources never
+    decrease, the usage of descendants that exit without being waited for by the tree is kept from their
+    last sample.
+    """
+
+    def __init__(self, pid: int, callback, interval: float = RESOURCE_INTERVAL):
+        self._pid = pid
+        self._callback = callback
+        self._interval = interval
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        if self._interval is not None and self._interval > 0 and can_sample():
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        step = 0
+        last = {}
+        while not self._stopped.wait(self._interval):
+            usage = tree_usage(self._pid)
+            if usage is None:
+                break
+            for name in CUMULATIVE:
+                usage[name] = last[name] = max(usage[name], last.get(name, 0))
+            timestamp = time.time()
+            for name, value in usage.items():
+                self._callback(name, step, timestamp, value)
+            step += 1
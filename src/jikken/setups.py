@@ -1,5 +1,7 @@
 import os
 
+from .resources import RESOURCE_INTERVAL
+
 
 def prepare_arg(argument):
     """Prepend dashes to conform with cli standards on arguments if necessary"""
@@ -17,7 +19,7 @@ class ExperimentSetup:
     """Configuration Class that holds the inputs for an experiment run"""
 
     def __init__(self, *, name: str, configuration_path: str, script_path: str, args: list = None, tags: list = None,
-                 reference_configuration_path: str = None):
+                 reference_configuration_path: str = None, resource_interval: float = RESOURCE_INTERVAL):
         """
         Args:
             configuration_path (str): The path to the configuration file/dir of the experiment
@@ -28,6 +30,8 @@ class ExperimentSetup:
             reference_configuration_path (str): Optional a path for a reference configuration. If it is given
                 the reference_configuration_path defines the experiment and the configuration_path only requires
                 the updated variables
+            resource_interval (float): Optional, the seconds between two samples of the resources used by the
+                script. If it is None or 0 the resources are not sampled
         """
         assert os.path.exists(configuration_path), "conf path: {} does not exist".format(configuration_path)
         assert os.path.exists(script_path), "script path: {} does not exist".format(script_path)
@@ -42,6 +46,7 @@ class ExperimentSetup:
         assert ref_conf_path is None or os.path.exists(ref_conf_path), "ref conf path: {} does not exist".format(
             ref_conf_path)
         self._ref_conf_path = ref_conf_path
+        self._resource_interval = resource_interval
 
     @property
     def name(self):
@@ -67,13 +72,17 @@ class ExperimentSetup:
     def args(self):
         return self._args
 
+    @property
+    def resource_interval(self):
+        return self._resource_interval
+
 
 class MultiStageExperimentSetup(ExperimentSetup):
     """class"""
 
     def __init__(self, *, name, configuration_path, script_path, output_path, stage_name, input_path=None, args=None,
                  tags=None,
-                 reference_configuration_path=None):
+                 reference_configuration_path=None, resource_interval=RESOURCE_INTERVAL):
         """
         Args:
             name (str): The name of the Multistage Experiment
@@ -85,6 +94,8 @@ class MultiStageExperimentSetup(ExperimentSetup):
             reference_configuration_path (str): Optional a path for a reference configuration. If it is given
                 the reference_configuration_path defines the experiment and the configuration_path only requires
                 the updated variables
+            resource_interval (float): Optional, the seconds between two samples of the resources used by the
+                script. If it is None or 0 the resources are not sampled
         """
         super(MultiStageExperimentSetup, self).__init__(
             name=name,
@@ -92,7 +103,8 @@ class MultiStageExperimentSetup(ExperimentSetup):
             script_path=script_path,
             args=args,
             tags=tags,
-            reference_configuration_path=reference_configuration_path
+            reference_configuration_path=reference_configuration_path,
+            resource_interval=resource_interval
         )
 
         assert input_path is None or os.path.exists(input_path), "input_path doesn't exist: {}".format(input_path)
@@ -0,0 +1,94 @@
+import copy
+import itertools
+import os
+import random
+
+from .utils import get_hash, get_schema, load_variables_from_filepath
+
+
+def load_sweep(sweep_path: str, configuration_path: str) -> dict:
+    """Load a sweep specification
+
+    The specification mirrors the configuration like the update variables of a reference configuration,
+    but every leaf is a list with the candidate values of that variable. If both paths are files the
+    file names do not need to match.
+    """
+    if os.path.isfile(sweep_path) and os.path.isfile(configuration_path):
+        return {os.path.basename(configuration_path): load_variables_from_filepath(sweep_path, root=False)}
+    return load_variables_from_filepath(sweep_path)
+
+
+def flatten_sweep(sweep: dict, prefix: tuple = ()) -> list:
+    """Return a list of (key path, candidate values) for every leaf of the sweep specification"""
+    leaves = []
+    for key in sorted(sweep.keys()):
+        value = sweep[key]
+        if isinstance(value, dict):
+            leaves.extend(flatten_sweep(value, prefix + (key,)))
+        elif isinstance(value, list) and len(value) > 0:
+            leaves.append((prefix + (key,), value))
+        else:
+            raise ValueError("sweep values of {} must be a non empty list".format("/".join(prefix + (key,))))
+    return leaves
+
+
+def set_values(variables: dict, paths: list, values: tuple) -> dict:
+    """Return a copy of the variables with the value of every key path replaced"""
+    new_variables = copy.deepcopy(variables)
+    for path, value in zip(paths, values):
+        ref = new_variables
+        for key in path[:-1]:
+            ref = ref[key]
+        if path[-1] not in ref:
+            raise KeyError("sweep variable {} not in configuration".format("/".join(path)))
+        ref[path[-1]] = copy.deepcopy(value)
+    return new_variables
+
+
+def grid_variants(variables: dict, sweep: dict):
+    """Lazily generate the variables of every combination of the sweep values"""
+    leaves = flatten_sweep(sweep)
+    paths = [path for path, _ in leaves]
+    for values in itertools.product(*[candidates for _, candidates in leaves]):
+        yield set_values(variables, paths, values)
+
+
+def random_variants(variables: dict, sweep: dict, samples: int, seed: int = None):
+    """Lazily generate the variables of random combinations of the sweep values
+
+    At most samples unique combinations are generated, fewer if the grid is smaller than that
+    """
+    leaves = flatten_sweep(sweep)
+    paths = [path for path, _ in leaves]
+    grid_size = 1
+    for _, candidates in leaves:
+        grid_size *= len(candidates)
+    rng = random.Random(seed)
+    seen = set()
+    while len(seen) < min(samples, grid_size):
+        indices = tuple(rng.randrange(len(candidates)) for _, candidates in leaves)
+        if indices not in seen:
+            seen.add(indices)
+            yield set_values(variables, paths, [candidates[index] for index, (_, candidates) in zip(indices, leaves)])
+
+
+def unique_variants(variants, extra_vars: dict = None):
+    """Skip variants whose parameters hash has already been generated
+
+    The hash is the parameters_hash that the Experiment of the variant would have
+    """
+    extra_vars = {} if extra_vars is None else extra_vars
+    seen = set()
+    for variables in variants:
+        parameters_hash = get_hash(get_schema({**variables, **extra_vars}, parameters=True))
+        if parameters_hash not in seen:
+            seen.add(parameters_hash)
+            yield variables
+
+
+def worker_cpus(worker_index: int, workers: int) -> set:
+    """Return the cpus a sweep worker is pinned to, the available cpus are split evenly among the workers"""
+    available = sorted(os.sched_getaffinity(0))
+    per_worker = max(1, len(available) // workers)
+    start = (worker_index * per_worker) % len(available)
+    return set(available[start:start + per_worker])
@@ -5,8 +5,6 @@ import os
 from hashlib import md5
 from tempfile import TemporaryDirectory
 
-import yaml
-from git import InvalidGitRepositoryError, Repo
 from contextlib import contextmanager
 
 
@@ -34,6 +32,7 @@ def prepare_variables(*, config_directory, reference_directory=None):
 
 def get_repo_origin(directory):
     """Get the url of the git origin of a repo """
+    from git import InvalidGitRepositoryError, Repo
     url = None
     try:
         repo = Repo(directory)
@@ -46,6 +45,7 @@ def get_repo_origin(directory):
 
 def get_commit_status(directory):
     """Get the commit status of a repo (dirty or not)"""
+    from git import InvalidGitRepositoryError, Repo
     status = None
     try:
         repo = Repo(directory)
@@ -64,6 +64,7 @@ def get_commit_id(directory):
     Returns:
             (str): the commit_id
     """
+    from git import InvalidGitRepositoryError, Repo
     try:
         repo = Repo(directory)
         commit_id = repo.commit().hexsha
@@ -87,6 +88,7 @@ def load_variables_from_dir(experiment_dir):
 
 def load_variables_from_filepath(experiment_filepath, root=True):
     """Load variables dict from a config path (directory or file)"""
+    import yaml
     if os.path.isdir(experiment_filepath):
         variables = load_variables_from_dir(experiment_filepath)
     elif experiment_filepath.endswith("yaml") or experiment_filepath.endswith("json"):
@@ -159,6 +161,7 @@ def update_variables(reference_dict, update_dict):
 
 def create_directory_from_variables(root_dir, variables):
     """Create a new config dir from a variables dict"""
+    import yaml
     for key in variables.keys():
         key_dir = os.path.join(root_dir, key)
         os.makedirs(os.path.dirname(key_dir), exist_ok=True)
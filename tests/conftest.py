@@ -58,14 +58,15 @@ def file_setup(tmpdir):
 
 
 database_types = ("tiny",
+                  "sqlite",
                   "mongo",
                   "es"
                   )
 
 
-@pytest.fixture(params=database_types,ids=["tiny-db", "mongo-db", "elasticsearch"])
+@pytest.fixture(params=database_types,ids=["tiny-db", "sqlite-db", "mongo-db", "elasticsearch"])
 def db_config(tmpdir, request):
-    if request.param == 'tiny':
+    if request.param in ('tiny', 'sqlite'):
         db_path = str(tmpdir.mkdir("temp"))
     elif request.param == 'mongo':
 
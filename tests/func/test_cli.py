@@ -17,6 +17,32 @@ def test_jikken_cli_run(file_setup, mocker):
     assert result.output == "starting experiment\nexperiment finished\n"
 
 
+def test_jikken_cli_sweep(file_setup, mocker):
+    conf_file, script_file, _ = file_setup
+    sweep = mocker.patch.object(jikken.cli.api, 'sweep', return_value=["1", "2"])
+    runner = CliRunner()
+    result = runner.invoke(jikken.cli.jikken_cli, ['sweep', script_file, "-c", conf_file, "-s", conf_file, "-n", "test",
+                                                   "-w", "2", "--samples", "5", "--pin"])
+    assert result.exit_code == 0
+    assert result.output == "experiments run: 2\n"
+    _, kwargs = sweep.call_args
+    assert kwargs["workers"] == 2
+    assert kwargs["samples"] == 5
+    assert kwargs["pin_cpus"] is True
+    assert kwargs["setup"].resource_interval is None
+
+
+def test_jikken_cli_stage_run_passes_the_resource_interval(file_setup, tmpdir, mocker):
+    conf_file, script_file, _ = file_setup
+    run_stage = mocker.patch.object(jikken.cli.api, 'run_stage')
+    runner = CliRunner()
+    result = runner.invoke(jikken.cli.jikken_cli, ['stage', 'run', script_file, "-c", conf_file, "-n", "test", "-s",
+                                                   "first", "-o", tmpdir.join("out").strpath,
+                                                   "--resource_interval", "0.5"])
+    assert result.exit_code == 0
+    assert run_stage.call_args[1]["setup"].resource_interval == 0.5
+
+
 def list_stub(*args, **kwargs):
     return [
         {"name": "test_{}".format(index), "stdout": "hi", "stderr": "bye",
@@ -50,7 +76,7 @@ def test_jikken_cli_list_tags(mocker):
 
 
 def test_jikken_cli_list(mocker):
-    mocker.patch.object(jikken.cli.api, 'list_experiments', new=list_stub)
+    mocker.patch.object(jikken.cli.api, 'iter_experiments', new=list_stub)
     runner = CliRunner()
     result = runner.invoke(jikken.cli.jikken_cli, ['list', "exp", "--stdout", "--stderr", "--no-monitored", "--no-git"])
     expected_results = \
@@ -96,7 +122,7 @@ def test_jikken_cli_list(mocker):
 
 
 def test_jikken_cli_list_no_args(mocker):
-    mocker.patch.object(jikken.cli.api, 'list_experiments', new=list_stub)
+    mocker.patch.object(jikken.cli.api, 'iter_experiments', new=list_stub)
     runner = CliRunner()
     result = runner.invoke(jikken.cli.jikken_cli, ['list', "exp"])
     expected_results = \
@@ -121,3 +147,35 @@ def test_jikken_cli_list_no_args(mocker):
 """
     assert result.output.replace(" ", "") == expected_results.replace(" ", "")
     assert result.exit_code == 0
+
+
+def test_jikken_cli_count_passes_the_query(mocker):
+    count = mocker.patch.object(jikken.cli.api, 'count', return_value=3)
+    runner = CliRunner()
+    result = runner.invoke(jikken.cli.jikken_cli, ['list', "count", "-t", "tag_1"])
+    assert result.exit_code == 0
+    assert result.output == "number of items: 3\n"
+    _, kwargs = count.call_args
+    assert kwargs["query"].tags == ["tag_1"]
+    # And without any filter everything is counted
+    runner.invoke(jikken.cli.jikken_cli, ['list', "count"])
+    _, kwargs = count.call_args
+    assert kwargs["query"] is None
+
+
+def test_jikken_cli_db_indexes(mocker):
+    stats = {"experiment": {"tags_index": {"ops": 4, "since": "2020-01-01"}}}
+    mocker.patch.object(jikken.cli.api, 'index_stats', return_value=stats)
+    runner = CliRunner()
+    result = runner.invoke(jikken.cli.jikken_cli, ['db', "indexes"])
+    assert result.exit_code == 0
+    assert result.output.split("\n")[1] == "tags_index: 4 ops since 2020-01-01"
+
+
+def test_jikken_cli_db_migrate(mocker):
+    migrate = mocker.patch.object(jikken.cli.api, 'migrate', return_value=3)
+    runner = CliRunner()
+    result = runner.invoke(jikken.cli.jikken_cli, ['db', "migrate"])
+    assert result.exit_code == 0
+    assert migrate.called
+    assert result.output == "migrated 3 documents\n"
@@ -1,8 +1,11 @@
 import json
+import sys
+import warnings
 from contextlib import contextmanager
 
 import jikken
-from jikken.api import run, ExperimentSetup
+from jikken.api import run, run_async, run_experiment, ExperimentSetup
+from jikken.experiment import Experiment
 
 
 def setup_database_stub(db):
@@ -73,3 +76,166 @@ def test_run_experiment_and_experiment_is_added_to_database(file_setup, jikken_d
     expected_output = json.dumps(config_json)
     exp = jikken_db.list_experiments()[0]
     assert exp['stdout'][2:-3] == expected_output
+
+
+def test_run_skips_an_experiment_that_already_completed(file_setup, jikken_db, capsys, mocker):
+    mocker.patch.object(jikken.api, 'setup_database', side_effect=lambda: setup_database_stub(jikken_db))
+    conf_path, script_path, config_json = file_setup
+    # GIVEN an experiment that has completed
+    setup = ExperimentSetup(name="test", configuration_path=conf_path, script_path=script_path)
+    exp_id = run(setup=setup)
+    assert jikken_db.get(exp_id, "experiment")['status'] == 'completed'
+    # WHEN I run the same experiment again
+    # THEN the completed experiment is returned without running the script
+    assert run(setup=setup) == exp_id
+    assert jikken_db.count() == 1
+    # AND it is run again if it is forced
+    assert run(setup=setup, force=True) != exp_id
+    assert jikken_db.count() == 2
+
+
+CHATTY_SCRIPT = \
+    """
+import sys
+from jikken import log_value
+sys.stderr.write("warning\\n" * 20000)
+sys.stderr.flush()
+log_value("loss", 0.5)
+print("finished")
+"""
+
+
+def test_run_experiment_reads_stdout_and_stderr_concurrently(tmpdir, jikken_db, capsys):
+    # GIVEN a script that writes more to stderr than a pipe can hold before writing to stdout
+    script_file = tmpdir.join('chatty.py')
+    script_file.write(CHATTY_SCRIPT)
+    exp_id = jikken_db.add(Experiment(name="chatty", variables={}, code_dir=str(tmpdir)))
+    # WHEN I run the experiment
+    run_experiment(db=jikken_db, exp_id=exp_id, cmd=[sys.executable, script_file.strpath])
+    # THEN the child is not stalled and both streams and the monitored value are captured
+    exp = jikken_db.get(exp_id, "experiment")
+    assert exp['status'] == 'completed'
+    assert exp['stdout'] == "finished\n"
+    assert exp['stderr'] == "warning\n" * 20000
+    assert exp['monitored']['loss'] == [0.5]
+
+
+def test_run_experiment_does_not_warn_about_line_buffering(tmpdir, jikken_db, capsys):
+    # GIVEN a script that writes a line
+    script_file = tmpdir.join('quiet.py')
+    script_file.write("print('finished')\n")
+    exp_id = jikken_db.add(Experiment(name="quiet", variables={}, code_dir=str(tmpdir)))
+    # WHEN I run the experiment
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        run_experiment(db=jikken_db, exp_id=exp_id, cmd=[sys.executable, script_file.strpath])
+    # THEN the binary pipes are opened without asking for line buffering
+    assert not any("line buffering" in str(warning.message) for warning in caught)
+    assert jikken_db.get(exp_id, "experiment")['stdout'] == "finished\n"
+
+
+def test_run_async_runs_many_experiments_with_one_database(file_setup, jikken_db, capsys, mocker):
+    mocker.patch.object(jikken.api, 'setup_database', return_value=setup_database_stub(jikken_db))
+    conf_path, script_path, config_json = file_setup
+    # GIVEN the setups of three experiments
+    setups = [ExperimentSetup(name="test_{}".format(index), configuration_path=conf_path, script_path=script_path)
+              for index in range(3)]
+    # WHEN I run them concurrently with at most two at the same time
+    exp_ids = run_async(setups=setups, max_concurrency=2)
+    # THEN all of them are added to the database and completed
+    assert len(exp_ids) == 3
+    expected_output = json.dumps(config_json)
+    for index, exp_id in enumerate(exp_ids):
+        exp = jikken_db.get(exp_id, "experiment")
+        assert exp['name'] == "test_{}".format(index)
+        assert exp['status'] == 'completed'
+        assert exp['stdout'][2:-3] == expected_output
+
+
+LONG_LINE_SCRIPT = \
+    """
+import sys
+sys.stdout.write("a" * 3000000 + "\\n")
+sys.stdout.write("last")
+"""
+
+
+def test_run_async_reads_lines_longer_than_the_stream_limit(tmpdir, jikken_db, capsys, mocker):
+    mocker.patch.object(jikken.api, 'setup_database', return_value=setup_database_stub(jikken_db))
+    # GIVEN a script that writes a line longer than the buffer of the stream reader
+    script_file = tmpdir.join('long_line.py')
+    script_file.write(LONG_LINE_SCRIPT)
+    tmpdir.join('config.json').write("{}")
+    setup = ExperimentSetup(name="long_line", configuration_path=tmpdir.join('config.json').strpath,
+                            script_path=script_file.strpath)
+    # WHEN I run it concurrently
+    exp_id, = run_async(setups=[setup])
+    # THEN the whole line and the last line without a line break are captured
+    exp = jikken_db.get(exp_id, "experiment")
+    assert exp['status'] == 'completed'
+    assert exp['stdout'] == "a" * 3000000 + "\nlast"
+
+
+METRICS_SCRIPT = \
+    """
+from jikken import log_metric
+for step in range(1000):
+    log_metric("loss", 1.0 / (step + 1), step=step)
+log_metric("finished", True)
+"""
+
+
+def test_run_experiment_receives_metrics_through_the_binary_channel(tmpdir, jikken_db, capsys):
+    # GIVEN a script that logs many numeric metrics
+    script_file = tmpdir.join('metrics.py')
+    script_file.write(METRICS_SCRIPT)
+    exp_id = jikken_db.add(Experiment(name="metrics", variables={}, code_dir=str(tmpdir)))
+    # WHEN I run the experiment
+    run_experiment(db=jikken_db, exp_id=exp_id, cmd=[sys.executable, script_file.strpath])
+    # THEN all numeric values are stored in order
+    exp = jikken_db.get(exp_id, "experiment")
+    assert exp['monitored']['loss'] == [1.0 / (step + 1) for step in range(1000)]
+    # AND their steps are kept in the series of the metric
+    assert jikken_db.get_series(exp_id, "loss").step.tolist() == list(range(1000))
+    # AND values that are not numbers fall back to the stderr protocol
+    assert exp['monitored']['finished'] == [True]
+    assert exp['status'] == 'completed'
+
+
+def test_run_experiment_samples_the_resources_of_the_script(tmpdir, jikken_db, capsys):
+    # GIVEN a script that runs for a while
+    script_file = tmpdir.join('sleep.py')
+    script_file.write("import time\ntime.sleep(0.5)\n")
+    exp_id = jikken_db.add(Experiment(name="resources", variables={}, code_dir=str(tmpdir)))
+    # WHEN I run it with a short resource interval
+    run_experiment(db=jikken_db, exp_id=exp_id, cmd=[sys.executable, script_file.strpath], resource_interval=0.05)
+    # THEN the resources of the script are stored as monitored series
+    exp = jikken_db.get(exp_id, "experiment")
+    assert len(exp['monitored']['proc_rss_bytes']) > 0
+    assert max(exp['monitored']['proc_rss_bytes']) > 0
+    steps = jikken_db.get_series(exp_id, "proc_cpu_time").step.tolist()
+    assert steps == list(range(len(steps)))
+
+
+MONITOR_SCRIPT = \
+    """
+from jikken import Monitor
+monitor = Monitor()
+for step in range(100):
+    monitor.log("loss", 1.0 / (step + 1), step=step)
+monitor.log("weights", [0.5, -1.5])
+"""
+
+
+def test_run_experiment_receives_values_of_a_monitor(tmpdir, jikken_db, capsys):
+    # GIVEN a script that logs values with a Monitor and exits without flushing it
+    script_file = tmpdir.join('monitor.py')
+    script_file.write(MONITOR_SCRIPT)
+    exp_id = jikken_db.add(Experiment(name="monitor", variables={}, code_dir=str(tmpdir)))
+    # WHEN I run the experiment
+    run_experiment(db=jikken_db, exp_id=exp_id, cmd=[sys.executable, script_file.strpath])
+    # THEN the values are flushed at exit, numbers with their steps and vectors through stderr
+    exp = jikken_db.get(exp_id, "experiment")
+    assert jikken_db.get_series(exp_id, "loss").step.tolist() == list(range(100))
+    assert exp['monitored']['weights'] == [[0.5, -1.5]]
+    assert exp['status'] == 'completed'
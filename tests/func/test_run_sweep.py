@@ -0,0 +1,76 @@
+import json
+from contextlib import contextmanager
+from multiprocessing import SimpleQueue
+
+import jikken
+from jikken.api import interrupt_started, sweep, ExperimentSetup
+from jikken.experiment import Experiment
+
+
+def setup_database_stub(db):
+    @contextmanager
+    def db_stub():
+        # the sweep workers are other processes, their buffered writes are flushed like setup_database does
+        try:
+            yield db
+        finally:
+            db.flush()
+
+    return db_stub
+
+
+def test_sweep_runs_every_unique_variant(file_setup, tmpdir, jikken_db, capsys, mocker):
+    mocker.patch.object(jikken.api, 'setup_database', new=setup_database_stub(jikken_db))
+    conf_path, script_path, config_json = file_setup
+    # GIVEN a sweep over two values of a variable, one of them repeated
+    sweep_file = tmpdir.join('sweep.json')
+    sweep_file.write(json.dumps({"training_parameters": {"batch_size": [100, 200, 200]}}))
+    setup = ExperimentSetup(name="test", configuration_path=conf_path, script_path=script_path)
+    # WHEN I run the sweep
+    exp_ids = sweep(setup=setup, sweep_path=sweep_file.strpath, workers=1)
+    # THEN one experiment is run for every unique value
+    assert len(exp_ids) == 2
+    batch_sizes = []
+    for exp_id in exp_ids:
+        exp = jikken_db.get(exp_id, "experiment")
+        assert exp['status'] == 'completed'
+        batch_sizes.append(exp['variables']['configuration.json']['training_parameters']['batch_size'])
+    assert batch_sizes == [100, 200]
+
+
+def run_variant_failing_on_200(*, setup, variables, single_file, force=False):
+    batch_size = variables["configuration.json"]["training_parameters"]["batch_size"]
+    if batch_size == 200:
+        raise ConnectionError("the db is down")
+    return str(batch_size)
+
+
+def test_sweep_keeps_the_ids_of_the_variants_that_did_not_fail(file_setup, tmpdir, capsys, mocker):
+    mocker.patch.object(jikken.api, 'run_variant', new=run_variant_failing_on_200)
+    conf_path, script_path, config_json = file_setup
+    # GIVEN a sweep whose second variant fails
+    sweep_file = tmpdir.join('sweep.json')
+    sweep_file.write(json.dumps({"training_parameters": {"batch_size": [100, 200, 300]}}))
+    setup = ExperimentSetup(name="test", configuration_path=conf_path, script_path=script_path)
+    # WHEN I run the sweep
+    exp_ids = sweep(setup=setup, sweep_path=sweep_file.strpath, workers=2)
+    # THEN the other variants are returned and the failure is reported
+    assert exp_ids == ["100", "300"]
+    assert "Variant Failed: the db is down" in capsys.readouterr().out
+
+
+def test_interrupted_sweep_marks_the_unfinished_experiments(jikken_db, mocker):
+    mocker.patch.object(jikken.api, 'setup_database', new=setup_database_stub(jikken_db))
+    # GIVEN the experiments started by the workers of a sweep that was interrupted
+    started = SimpleQueue()
+    exp_ids = [jikken_db.add(Experiment(name="test_{}".format(index), variables={"index": index}, code_dir=""))
+               for index in range(3)]
+    jikken_db.update_status(exp_ids[0], "completed")
+    jikken_db.update_status(exp_ids[1], "running")
+    for exp_id in exp_ids:
+        started.put(exp_id)
+    # WHEN the sweep cleans up after terminating its workers
+    interrupt_started(started)
+    # THEN the experiments that did not finish are interrupted
+    assert [jikken_db.get(exp_id, "experiment")["status"] for exp_id in exp_ids] == \
+        ["completed", "interrupted", "interrupted"]
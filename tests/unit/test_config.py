@@ -36,3 +36,43 @@ def test_load_local_config(home_dir, tmpdir):
     config = get_config(str(new_config_file))
     expected_config = JikkenConfig(db_type='mongo', db_path="jikken_db/")
     assert config == expected_config
+
+
+def test_load_config_with_log_store(home_dir, tmpdir):
+    new_config_file = tmpdir.join("config")
+    new_config = \
+        """
+        [db]
+        path = jikken_db/
+        type = tiny
+        [logs]
+        path = ~/jikken_logs/
+        """
+    with new_config_file.open('w') as file_handle:
+        file_handle.write(new_config)
+
+    config = get_config(str(new_config_file))
+    expected_config = JikkenConfig(db_type='tiny', db_path="jikken_db/",
+                                   log_path=os.path.join(str(home_dir), "jikken_logs/"))
+    assert config == expected_config
+
+
+def test_load_config_with_refresh_policy(home_dir, tmpdir):
+    new_config_file = tmpdir.join("config")
+    new_config = \
+        """
+        [db]
+        path = http://localhost:9200
+        type = es
+        refresh = false
+        """
+    with new_config_file.open('w') as file_handle:
+        file_handle.write(new_config)
+
+    config = get_config(str(new_config_file))
+    assert config.refresh == "false"
+    # And an unknown policy is rejected
+    with new_config_file.open('w') as file_handle:
+        file_handle.write(new_config.replace("false", "sometimes"))
+    with pytest.raises(ValueError):
+        get_config(str(new_config_file))
@@ -1,6 +1,10 @@
+import copy
+
 import pytest
+import jikken.database.database
 from jikken import MultiStageExperiment
-from jikken.database import ExperimentQuery, MultiStageExperimentQuery
+from jikken.database import DataBase, ExperimentQuery, MultiStageExperimentQuery, close_databases, setup_database
+from jikken.database.config import JikkenConfig
 from jikken.experiment import Experiment
 
 
@@ -273,6 +277,76 @@ def test_list_ms_experiments_one_experiment_is_returned_properly(db_one_multista
             assert exp['type'] == 'experiment'
 
 
+def test_get_many_keeps_the_order_of_the_ids(db_three_experiments):
+    # Given a db with three experiments
+    db = db_three_experiments
+    ids = [doc["id"] for doc in db.list_experiments()]
+    missing_id = db.add(Experiment(name="missing", variables={}, code_dir=""))
+    db.delete(missing_id)
+    # When I get them in reverse order together with a deleted id
+    docs = db.get_many(ids[::-1] + [missing_id])
+    # Then they are returned in the order of the ids and the deleted one is None
+    assert [doc["id"] for doc in docs[:-1]] == ids[::-1]
+    assert docs[-1] is None
+
+
+def test_multistage_stages_are_fetched_with_one_request(db_five_multistage, mocker):
+    # Given a db with five mse
+    db = db_five_multistage
+    get = mocker.spy(db._database, "get")
+    get_many = mocker.spy(db._database, "get_many")
+    # When I list them
+    mse_experiments = db.list_ms_experiments()
+    # Then the experiments of all their stages are fetched with a single request
+    assert get.call_count == 0
+    assert get_many.call_count == 1
+    stage_types = {exp["type"] for mse in mse_experiments for _, exp in mse["experiments"]}
+    assert stage_types == {"experiment"}
+
+
+def test_iter_experiments_yields_the_same_experiments_as_list(db_three_experiments):
+    # Given a db with three experiments
+    db = db_three_experiments
+    query = ExperimentQuery(tags=["tag_1"])
+    # When I iterate over them two at a time
+    docs = db.iter_experiments(query=query, page_size=2)
+    # Then they are yielded lazily and match the listed experiments
+    assert not isinstance(docs, list)
+    assert [doc["id"] for doc in docs] == [doc["id"] for doc in db.list_experiments(query=query)]
+    # And When I iterate over them by ids
+    ids = [doc["id"] for doc in db.list_experiments()]
+    # Then every page of ids is read
+    assert [doc["id"] for doc in db.iter_experiments(query=ExperimentQuery(ids=ids), page_size=2)] == ids
+
+
+def test_list_experiments_returns_only_the_projected_fields(db_three_experiments):
+    # Given a db with three experiments
+    db = db_three_experiments
+    # When I list them with only some fields
+    docs = db.list_experiments(query=ExperimentQuery(fields=["name", "tags"]))
+    # Then only those fields, the id and the type are returned
+    assert len(docs) == 3
+    assert {tuple(sorted(doc.keys())) for doc in docs} == {("id", "name", "tags", "type")}
+    # And When I list them without some fields
+    docs = db.list_experiments(query=ExperimentQuery(exclude=["stdout", "stderr", "variables"]))
+    # Then every other field is returned
+    assert len(docs) == 3
+    for doc in docs:
+        assert "name" in doc and "monitored" in doc
+        assert "stdout" not in doc and "stderr" not in doc and "variables" not in doc
+
+
+def test_list_ms_experiments_projects_the_stages(db_five_multistage):
+    # Given a db with five mse
+    db = db_five_multistage
+    # When I list them with only the names of the experiments of their stages
+    mse_experiments = db.list_ms_experiments(query=MultiStageExperimentQuery(fields=["name"]))
+    # Then the stages hold only the projected fields
+    assert len(mse_experiments) == 5
+    stage_keys = {tuple(sorted(exp.keys())) for mse in mse_experiments for _, exp in mse["experiments"]}
+    assert stage_keys == {("id", "name", "type")}
+
+
 @pytest.mark.test_listing
 def test_list_ms_experiments(db_five_multistage, tmpdir):
     # Given a database with five mse inside
@@ -397,3 +471,280 @@ def test_update_status_raises(db_one_experiment):
     # Then db raises an error
     with pytest.raises(ValueError):
         db.update_status(_id, status)
+
+
+def test_update_std_batch_appends_all_strings(db_one_experiment):
+    # Given a db with one experiment
+    db, _id = db_one_experiment
+    # When I update the stdout with a batch of strings
+    db.update_std_batch(_id, ["first\n", "second\n"], "stdout")
+    db.update_std_batch(_id, ["third\n"], "stdout")
+    # Then all the strings are appended in order
+    exp = db.get(_id, "experiment")
+    assert exp["stdout"] == "first\nsecond\nthird\n"
+
+
+def test_update_monitored_batch_appends_all_values(db_one_experiment):
+    # Given a db with one experiment
+    db, _id = db_one_experiment
+    # When I update a monitored key with batches of values
+    db.update_monitored_batch(_id, key="loss", values=[0.5, 0.5])
+    db.update_monitored_batch(_id, key="loss", values=[0.25, 0.1])
+    # Then all the values are appended in order, including repeated values
+    exp = db.get(_id, "experiment")
+    assert exp["monitored"]["loss"] == [0.5, 0.5, 0.25, 0.1]
+
+
+def test_update_monitored_does_not_read_the_experiment(db_one_experiment, mocker):
+    # Given a db with one experiment
+    db, _id = db_one_experiment
+    spy = mocker.spy(db._database, "get")
+    # When I update a new and an existing monitored key
+    db.update_monitored(_id, key="loss", value=0.5)
+    db.update_monitored_batch(_id, key="loss", values=[0.25])
+    # Then the experiment is never fetched before writing
+    assert spy.call_count == 0
+    assert db.get(_id, "experiment")["monitored"]["loss"] == [0.5, 0.25]
+
+
+def test_best_returns_the_k_best_last_values_in_order(db_three_experiments):
+    # Given a db with three experiments with a monitored loss and one with a value that is not a number
+    db = db_three_experiments
+    ids = [doc["id"] for doc in db.list_experiments()]
+    for loss, _id in zip([0.5, 0.1, 0.3], ids):
+        db.update_monitored_batch(_id, "loss", [1.0, loss])
+    db.update_monitored(ids[0], "accuracy", "nan")
+    # When I ask for the two best ones
+    best = db.best(metric="loss", optimum="min", k=2)
+    # Then the two lowest last values are returned best first
+    assert [doc["id"] for doc in best] == [ids[1], ids[2]]
+    assert [doc["id"] for doc in db.best(metric="loss", optimum="max", k=1)] == [ids[0]]
+    # And the experiments without a real number are skipped
+    assert db.best(metric="accuracy") == []
+    # And the projection of the query is applied to the best ones
+    assert set(db.best(query=ExperimentQuery(fields=["name"]), metric="loss")[0].keys()) == {"id", "type", "name"}
+
+
+def test_best_skips_last_values_that_are_not_finite(db_three_experiments):
+    # Given a db with one run that converged and two that diverged
+    db = db_three_experiments
+    ids = [doc["id"] for doc in db.list_experiments()]
+    for loss, _id in zip([0.1, float("nan"), float("inf")], ids):
+        db.update_monitored_batch(_id, "loss", [1.0, loss])
+    # Then only the run that converged is the best one, whatever the optimum
+    assert [doc["id"] for doc in db.best(metric="loss", optimum="min", k=3)] == [ids[0]]
+    assert [doc["id"] for doc in db.best(metric="loss", optimum="max", k=3)] == [ids[0]]
+
+
+def test_distinct_and_grouped_counts(db_multiple_experiments):
+    # Given a db with nine experiments, the nth one has the tags tag_0 to tag_n-1
+    db = db_multiple_experiments
+    # When I ask for the distinct tags
+    tags = db.distinct("tags")
+    # Then every tag is returned once
+    assert sorted(tags) == ["tag_{}".format(index) for index in range(9)]
+    # And When I count the experiments per tag
+    counts = db.count(group_by="tags")
+    # Then every experiment is counted for each of its tags
+    assert counts == {"tag_{}".format(index): 9 - index for index in range(9)}
+    # And the query restricts the counted experiments
+    assert db.count(query=ExperimentQuery(tags=["tag_7"]), group_by="name") == {"exp_8": 1, "exp_9": 1}
+    assert db.count(query=ExperimentQuery(tags=["tag_7"])) == 2
+
+
+def test_count_matches_the_query(db_multiple_experiments, one_multistage):
+    # Given a db with nine experiments
+    db = db_multiple_experiments
+    # When I count the experiments that match a query
+    # Then only the matching experiments are counted
+    assert db.count(query=ExperimentQuery(tags=["tag_5", "tag_6"])) == 3
+    assert db.count(query=ExperimentQuery(names=["exp_1", "exp_2"])) == 2
+    # And a query on the status alone is not treated as empty
+    completed = db.list_experiments(query=ExperimentQuery(names=["exp_1"]))[0]["id"]
+    db.update_status(completed, "completed")
+    assert db.count(query=ExperimentQuery(status=["completed"])) == 1
+    assert db.count(query=ExperimentQuery(status=["completed"]), group_by="status") == {"completed": 1}
+    # And When I add a multistage experiment
+    experiments = db.count(doc_type="experiment")
+    db.add(one_multistage)
+    # Then the doc type can be counted without a query
+    assert db.count(doc_type="multistage") == 1
+    assert db.count(query=MultiStageExperimentQuery(names=["testname"])) == 1
+    # And everything is counted without either
+    assert db.count() == db.count(doc_type="experiment") + 1
+    # And the stages were added as new experiments
+    assert experiments == 9
+    assert db.count(doc_type="experiment") == experiments + len(list(one_multistage))
+
+
+def test_add_many_and_delete_many(jikken_db, multiple_experiments):
+    # Given an empty db
+    db = jikken_db
+    # When I add many experiments at once
+    ids = db.add_many(multiple_experiments)
+    # Then they are added in order
+    assert [doc["name"] for doc in db.get_many(ids)] == [exp.name for exp in multiple_experiments]
+    # And When I delete some of them at once
+    db.delete_many(ids[:5])
+    # Then only the others are left
+    assert sorted(doc["id"] for doc in db.list_experiments()) == sorted(ids[5:])
+
+
+def test_find_completed_matches_the_experiment_hash(db_one_experiment, one_experiment):
+    # Given a db with one experiment that is still running
+    db, _id = db_one_experiment
+    db.update_status(_id, "running")
+    # Then it is not returned as a completed result
+    assert db.find_completed(one_experiment) is None
+    # When the experiment completes
+    db.update_status(_id, "completed")
+    # Then an experiment with the same name, parameters and commit finds it
+    assert db.find_completed(one_experiment)["id"] == _id
+    # And an experiment with other parameters does not
+    other = Experiment(name=one_experiment.name, variables={"single_variable": 1}, code_dir="")
+    assert db.find_completed(other) is None
+
+
+def test_find_completed_skips_a_dirty_working_tree(db_one_experiment, one_experiment):
+    # Given a completed experiment
+    db, _id = db_one_experiment
+    db.update_status(_id, "completed")
+    # When the same experiment is run from a working tree with uncommitted changes
+    dirty = copy.copy(one_experiment)
+    dirty._commit_status = True
+    # Then it is not taken from the completed one, the uncommitted code may differ
+    assert dirty.hash == one_experiment.hash
+    assert db.find_completed(dirty) is None
+
+
+def test_get_series_returns_steps_timestamps_and_values(db_one_experiment):
+    # Given a db with one experiment
+    db, _id = db_one_experiment
+    # When I update a monitored key with numeric values, steps and timestamps
+    db.update_monitored_batch(_id, key="loss", values=[0.5, 0.25], steps=[0, 1], timestamps=[10.0, 11.0])
+    db.update_monitored(_id, key="loss", value=0.125, step=2, timestamp=12.0)
+    # Then the series of the key has all the points in order
+    series = db.get_series(_id, "loss")
+    assert series.step.tolist() == [0, 1, 2]
+    assert series.timestamp.tolist() == [10.0, 11.0, 12.0]
+    assert series.value.tolist() == [0.5, 0.25, 0.125]
+    # And the monitored values are still stored as a list
+    assert db.get(_id, "experiment")["monitored"]["loss"] == [0.5, 0.25, 0.125]
+
+
+def test_monitored_values_and_series_are_written_and_read_together(db_one_experiment, mocker):
+    # Given a db with one experiment
+    db, _id = db_one_experiment
+    update_key = mocker.spy(db._database, "update_key")
+    # When I update a monitored key with numeric values and read its series
+    db.update_monitored_batch(_id, key="loss", values=[0.5, 0.25], steps=[0, 1])
+    series = db.get_series(_id, "loss")
+    # Then the values and their steps are written by one update
+    assert update_key.call_count == 0
+    assert series.step.tolist() == [0, 1]
+    assert series.value.tolist() == [0.5, 0.25]
+
+
+@pytest.fixture()
+def db_with_log_store(tmpdir, one_experiment):
+    config = JikkenConfig(db_path=str(tmpdir.mkdir("db")), db_type="tiny", log_path=str(tmpdir.mkdir("logs")))
+    db = DataBase(config=config)
+    _id = db.add(one_experiment)
+    yield db, _id
+    db.delete_all()
+    db.stop_db()
+
+
+def test_logs_are_kept_out_of_the_document_with_a_log_store(db_with_log_store):
+    # Given a db with a log store and one experiment
+    db, _id = db_with_log_store
+    # When I update the stdout
+    db.update_std_batch(_id, ["line 1\n", "line 2\n"], "stdout")
+    db.update_std(_id, "line 3\n", "stdout")
+    # Then the listed document only has the size of the log
+    exp = db.list_experiments()[0]
+    assert exp["stdout"] == ""
+    assert exp["logs"]["stdout"]["bytes"] == 21
+    # And the log is read from the store when asked
+    assert db.list_experiments(load_logs=True)[0]["stdout"] == "line 1\nline 2\nline 3\n"
+    assert db.get(_id, "experiment")["stdout"] == "line 1\nline 2\nline 3\n"
+    assert db.read_log(_id, "stdout", start=7, end=14) == "line 2\n"
+    assert db.tail_log(_id, "stdout", lines=1) == "line 3\n"
+
+
+def test_databases_that_share_a_log_path_keep_their_own_logs(tmpdir, one_experiment):
+    # Given two tiny dbs of different projects with the same log path
+    log_path = str(tmpdir.mkdir("shared_logs"))
+    dbs = [DataBase(config=JikkenConfig(db_path=str(tmpdir.mkdir(project)), db_type="tiny", log_path=log_path))
+           for project in ("project_1", "project_2")]
+    # When both add an experiment, which gets the same id, and write its stdout
+    ids = [db.add(one_experiment) for db in dbs]
+    for db, text in zip(dbs, ["first\n", "second\n"]):
+        db.update_std(ids[0], text, "stdout")
+    assert ids[0] == ids[1]
+    # Then each db reads its own log, and deleting the experiments of one keeps the logs of the other
+    assert dbs[0].read_log(ids[0], "stdout") == "first\n"
+    dbs[0].delete_all()
+    assert dbs[1].read_log(ids[1], "stdout") == "second\n"
+    dbs[1].delete_all()
+    for db in dbs:
+        db.stop_db()
+
+
+def test_tail_and_read_inline_logs(db_one_experiment):
+    db, _id = db_one_experiment
+    db.update_std(_id, "line 1\nline 2\n", "stderr")
+    assert db.tail_log(_id, "stderr", lines=1) == "line 2\n"
+    assert db.read_log(_id, "stderr", start=7) == "line 2\n"
+
+
+def test_database_handles_are_shared_per_config(tmpdir):
+    # Given two configs that are equal and one that is not
+    config = JikkenConfig(db_path=str(tmpdir.mkdir("db")), db_type="tiny")
+    same_config = JikkenConfig(db_path=config.db_path, db_type="tiny")
+    other_config = JikkenConfig(db_path=str(tmpdir.mkdir("other")), db_type="tiny")
+    # Then equal configs share a handle
+    db = DataBase(config=config)
+    assert DataBase(config=same_config) is db
+    assert DataBase(config=other_config) is not db
+    # And a handle that is stopped connects again when it is used
+    _id = db.add(Experiment(name="exp", variables={}, code_dir=""))
+    db.stop_db()
+    assert db.get(_id, "experiment")["name"] == "exp"
+    # And closing the handles of the process creates new ones
+    close_databases()
+    assert DataBase(config=config) is not db
+
+
+def test_database_handles_are_closed_at_exit_once_one_is_created(tmpdir, mocker):
+    # Given a registry without handles
+    register = mocker.patch("atexit.register")
+
+    class Handles(DataBase):
+        pass
+
+    config = JikkenConfig(db_path=str(tmpdir.mkdir("db")), db_type="tiny")
+    # Then nothing is registered until a handle is created
+    assert not register.called
+    # When two handles are created
+    Handles(config=config)
+    Handles(config=JikkenConfig(db_path=str(tmpdir.mkdir("other")), db_type="tiny"))
+    # Then the handles are closed at exit by a single hook
+    register.assert_called_once_with(Handles.close_all)
+    Handles.close_all()
+
+
+def test_setup_database_reads_the_config_once(tmpdir, monkeypatch, mocker):
+    # Given a working directory with a jikken config
+    config_dir = tmpdir.mkdir(".jikken")
+    config_dir.join("config").write("[db]\npath = {}\ntype = tiny\n".format(tmpdir.mkdir("db")))
+    monkeypatch.chdir(tmpdir)
+    get_config = mocker.spy(jikken.database.database, "get_config")
+    # When the database is set up twice
+    with setup_database() as db:
+        pass
+    with setup_database() as same_db:
+        pass
+    # Then the config file is read once and the same handle is used
+    assert get_config.call_count == 1
+    assert same_db is db
@@ -0,0 +1,150 @@
+import pytest
+from jikken.database.db_es import MAPPINGS, ElasticSearchDB, GROUP_SIZE, LAST_VALUES, create_es_exp_query, \
+    create_es_mse_query, extend_script, keyword_field, source_filter
+from jikken.database.query import ExperimentQuery, MultiStageExperimentQuery
+
+
+def term_fields(query_dsl) -> set:
+    """Return the fields of every term and terms filter of an es query"""
+    if isinstance(query_dsl, list):
+        return set().union(*[term_fields(item) for item in query_dsl])
+    if not isinstance(query_dsl, dict):
+        return set()
+    fields = set()
+    for key, value in query_dsl.items():
+        if key in ("term", "terms"):
+            fields.update(value.keys())
+        else:
+            fields.update(term_fields(value))
+    return fields
+
+
+def test_every_filtered_field_is_a_keyword():
+    # Given queries that filter on every field
+    exp_query = create_es_exp_query(ExperimentQuery(tags=["a"], schema_hashes=["b"], schema_param_hashes=["c"],
+                                                    hashes=["d"], status=["completed"]))
+    mse_query = create_es_mse_query(MultiStageExperimentQuery(tags=["a"], hashes=["b"], steps=["c"]))
+    # Then each filtered field is mapped as a keyword so its terms match exactly
+    for collection, query_dsl in (("experiment", exp_query), ("multistage", mse_query)):
+        fields = term_fields(query_dsl)
+        properties = MAPPINGS[collection]["properties"]
+        assert all(properties[field]["type"] == "keyword" for field in fields)
+    assert term_fields(exp_query) == {"tags", "schema_hash", "parameter_hash", "hash", "status"}
+
+
+@pytest.mark.parametrize("field, expected", [("name", "name.keyword"), ("tags", "tags"), ("status", "status")])
+def test_keyword_field(field, expected):
+    assert keyword_field(field) == expected
+
+
+@pytest.mark.parametrize("fields, exclude, expected", [
+    (["name"], None, {"_source_include": ["name", "type"]}),
+    (None, ["stdout"], {"_source_exclude": ["stdout"]}),
+    (None, None, {}),
+])
+def test_source_filter_uses_the_parameters_of_es_6_0(fields, exclude, expected):
+    assert source_filter(fields, exclude) == expected
+
+
+@pytest.fixture
+def es_client(mocker):
+    """A mocked es client with an empty experiment index"""
+    client = mocker.Mock()
+    client.indices.get_mapping.return_value = {}
+    client.indices.get_field_mapping.return_value = {}
+    mocker.patch.object(ElasticSearchDB, "_connect", return_value=client)
+    return client
+
+
+def test_group_count_asks_again_until_every_bucket_is_returned(es_client):
+    # Given an es server with more values than the buckets of the first request
+    client = es_client
+    client.search.side_effect = [
+        {"aggregations": {"groups": {"sum_other_doc_count": 3, "buckets": [{"key": "a", "doc_count": 2}]}}},
+        {"aggregations": {"groups": {"sum_other_doc_count": 0, "buckets": [{"key": "a", "doc_count": 2},
+                                                                             {"key": "b", "doc_count": 3}]}}},
+    ]
+    db = ElasticSearchDB("http://localhost:9200", "test")
+    # When I count the experiments per tag
+    counts = db.group_count("tags", ExperimentQuery())
+    # Then a plain terms aggregation is asked again with more buckets
+    sizes = [call[1]["body"]["aggs"]["groups"]["terms"]["size"] for call in client.search.call_args_list]
+    assert sizes == [GROUP_SIZE, 2 * GROUP_SIZE]
+    assert counts == {"a": 2, "b": 3}
+
+
+def test_group_count_uses_the_keyword_sub_field_of_old_indices(es_client):
+    # Given an index created before the templates, where tags was mapped dynamically as text
+    client = es_client
+    dynamic = {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}}
+    client.indices.get_field_mapping.return_value = {
+        "test_experiment": {"mappings": {"experiment": {"tags": {"full_name": "tags", "mapping": {"tags": dynamic}}}}}}
+    client.search.return_value = {"aggregations": {"groups": {"sum_other_doc_count": 0, "buckets": []}}}
+    db = ElasticSearchDB("http://localhost:9200", "test")
+    # When I count the experiments per tag
+    db.group_count("tags", ExperimentQuery())
+    # Then the keyword sub field is aggregated
+    assert client.search.call_args[1]["body"]["aggs"]["groups"]["terms"]["field"] == "tags.keyword"
+
+
+def test_field_mapping_is_asked_once_per_field(es_client):
+    # Given an index where tags is mapped as keyword
+    client = es_client
+    client.indices.get_field_mapping.return_value = {"test_experiment": {"mappings": {"experiment": {
+        "tags": {"full_name": "tags", "mapping": {"tags": {"type": "keyword"}}}}}}}
+    client.search.return_value = {"aggregations": {"groups": {"sum_other_doc_count": 0, "buckets": []}}}
+    db = ElasticSearchDB("http://localhost:9200", "test")
+    # When I count the experiments per tag twice
+    db.group_count("tags", ExperimentQuery())
+    db.group_count("tags", ExperimentQuery())
+    # Then the mapping is only asked for the first count
+    assert client.indices.get_field_mapping.call_count == 1
+    assert client.search.call_args[1]["body"]["aggs"]["groups"]["terms"]["field"] == "tags"
+
+
+@pytest.mark.parametrize("properties, backfilled", [({"name": {"type": "text"}}, True),
+                                                    ({LAST_VALUES: {"type": "object"}}, False)])
+def test_last_values_are_backfilled_once(es_client, properties, backfilled):
+    # Given an experiment index with or without the last values in its mapping
+    es_client.indices.get_mapping.return_value = {"test_experiment": {"mappings": {"experiment": {
+        "properties": properties}}}}
+    es_client.update_by_query.return_value = {"updated": 2}
+    db = ElasticSearchDB("http://localhost:9200", "test")
+    # When the db is migrated
+    updated = db.migrate()
+    # Then only the experiments of an index that predates the last values are updated
+    assert es_client.update_by_query.called == backfilled
+    assert updated == (2 if backfilled else 0)
+
+
+def test_opening_the_db_does_not_backfill(es_client):
+    # Given an experiment index that predates the last values
+    es_client.indices.get_mapping.return_value = {"test_experiment": {"mappings": {"experiment": {
+        "properties": {"name": {"type": "text"}}}}}}
+    # When the db is opened
+    ElasticSearchDB("http://localhost:9200", "test")
+    # Then no experiment is updated
+    assert not es_client.update_by_query.called
+
+
+def test_extend_script_passes_the_names_as_params():
+    # Given a metric whose name would end a painless string
+    metric = "it's a \\ loss"
+    # When I build the script that appends its values
+    script = extend_script([(["monitored", metric], [0.5, 0.25]), (["series", metric], [{"chunk": 1}])])
+    # Then the name is only in the params, with the last value of the metric
+    assert metric not in script["source"]
+    assert script["params"]["extensions"] == [{"path": ["monitored", metric], "value": [0.5, 0.25]},
+                                              {"path": ["series", metric], "value": [{"chunk": 1}]}]
+    assert script["params"]["last"] == {metric: 0.25}
+
+
+def test_add_appends_with_the_extend_script(es_client):
+    # Given an elasticsearch backend
+    db = ElasticSearchDB("http://localhost:9200", "test")
+    # When I add one value to a nested key
+    db.update_key("1", "it's new", ["stdout", "lines"], mode="add")
+    # Then the key is a param of the script that extends it
+    script = es_client.update.call_args[1]["body"]["script"]
+    assert "lines" not in script["source"]
+    assert script["params"]["extensions"] == [{"path": ["stdout", "lines"], "value": ["it's new"]}]
@@ -1,5 +1,7 @@
+import pymongo
 import pytest
-from jikken.database.db_mongo import add_mongo
+from jikken.database.db_mongo import add_mongo, create_mongodb_exp_query, create_mongodb_mse_query, INDEXES
+from jikken.database.query import ExperimentQuery, MultiStageExperimentQuery
 
 keys_to_add = (
     # key, value, expected
@@ -15,3 +17,33 @@ keys_to_add = (
 def test_add_mongo(key, value, expected):
     query = add_mongo(value, key=key)
     assert query == expected
+
+
+def filtered_fields(query: dict) -> set:
+    """Return the fields a mongo query filters on, $text stands for the fields of the text index"""
+    fields = set()
+    for key, value in query.items():
+        if key == "$and":
+            fields.update(*[filtered_fields(clause) for clause in value])
+        else:
+            fields.add(key)
+    return fields
+
+
+queries = (
+    ("experiment", create_mongodb_exp_query(ExperimentQuery(tags=["a"], schema_hashes=["a"], status=["completed"],
+                                                            schema_param_hashes=["a"], names=["a"], hashes=["a"]))),
+    ("multistage", create_mongodb_mse_query(MultiStageExperimentQuery(tags=["a"], names=["a"], steps=["a"],
+                                                                      hashes=["a"]))),
+)
+
+
+@pytest.mark.parametrize("collection,query", queries)
+def test_every_query_field_has_an_index(collection, query):
+    # Given the fields that a query with every filter filters on
+    fields = filtered_fields(query)
+    # Then each of them is the first key of a declared index
+    indexed = {keys[0][0] for _, keys, _ in INDEXES[collection]}
+    text_indexed = any(keys[0][1] == pymongo.TEXT for _, keys, _ in INDEXES[collection])
+    assert fields - {"$text"} <= indexed
+    assert "$text" not in fields or text_indexed
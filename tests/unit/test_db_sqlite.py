@@ -0,0 +1,113 @@
+import pytest
+from jikken.database.db_sqlite import SQLiteDB, create_sqlite_exp_query, create_sqlite_mse_query
+from jikken.database.query import ExperimentQuery, MultiStageExperimentQuery
+from jikken.database.series import NO_STEP
+
+exp_queries = (
+    ExperimentQuery(tags=["a", "b"]),
+    ExperimentQuery(tags=["a", "b"], query_type="any"),
+    ExperimentQuery(status=["completed"]),
+    ExperimentQuery(hashes=["a"], status=["completed"]),
+    ExperimentQuery(schema_hashes=["a"]),
+    ExperimentQuery(schema_param_hashes=["a"]),
+)
+
+
+@pytest.fixture
+def sqlite_db(tmpdir):
+    db = SQLiteDB(tmpdir.strpath, "test")
+    yield db
+    db.stop_db()
+
+
+def query_plan(db, sql, params) -> str:
+    return " ".join(row[-1] for row in db._connection().execute("EXPLAIN QUERY PLAN " + sql, params))
+
+
+@pytest.mark.parametrize("query", exp_queries)
+def test_experiment_queries_use_an_index(sqlite_db, query):
+    # Given a query that filters on a field
+    clause, params = create_sqlite_exp_query(query, "test_experiment")
+    # Then sqlite searches an index instead of scanning the experiments
+    plan = query_plan(sqlite_db, "SELECT id FROM test_experiment WHERE " + clause, params)
+    assert "SCAN test_experiment" not in plan
+    assert "INDEX" in plan
+
+
+@pytest.mark.parametrize("query", [MultiStageExperimentQuery(hashes=["a"]), MultiStageExperimentQuery(steps=["a"])])
+def test_multistage_queries_use_an_index(sqlite_db, query):
+    clause, params = create_sqlite_mse_query(query, "test_multistage")
+    plan = query_plan(sqlite_db, "SELECT id FROM test_multistage WHERE " + clause, params)
+    assert "SCAN test_multistage" not in plan
+    assert "INDEX" in plan
+
+
+def test_db_is_in_wal_mode(sqlite_db):
+    assert sqlite_db._connection().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_monitored_values_are_rows_of_the_metrics_table(sqlite_db):
+    # Given an experiment
+    exp_id = sqlite_db.add({"type": "experiment", "name": "test", "tags": [], "monitored": {}})
+    # When I append monitored values
+    sqlite_db.update_key(exp_id, [0.5, "nan"], ["monitored", "loss"], mode="extend")
+    sqlite_db.update_key(exp_id, [0.25], ["monitored", "loss"], mode="extend")
+    # Then every value is a row with its position as step and the document is not changed
+    rows = sqlite_db._connection().execute("SELECT step, value FROM test_metrics WHERE exp_id = ?",
+                                           (int(exp_id),)).fetchall()
+    assert rows == [(0, 0.5), (1, '"nan"'), (2, 0.25)]
+    doc = sqlite_db._connection().execute("SELECT doc FROM test_experiment").fetchone()[0]
+    assert "loss" not in doc
+    assert sqlite_db.get(exp_id, "experiment")["monitored"] == {"loss": [0.5, "nan", 0.25]}
+
+
+def test_connections_are_per_thread(sqlite_db):
+    from threading import Thread
+    # Given an experiment
+    exp_id = sqlite_db.add({"type": "experiment", "name": "test", "tags": [], "monitored": {}})
+    # When other threads append monitored values
+    threads = [Thread(target=sqlite_db.update_key, args=(exp_id, [index], ["monitored", "loss"], "extend"))
+               for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Then every value is stored
+    assert sorted(sqlite_db.get(exp_id, "experiment")["monitored"]["loss"]) == [0, 1, 2, 3]
+
+
+def test_monitored_values_do_not_rewrite_the_document(sqlite_db):
+    # Given an experiment with a large stdout
+    exp_id = sqlite_db.add({"type": "experiment", "name": "test", "tags": [], "monitored": {}, "series": {},
+                            "stdout": "line\n" * 100000})
+    statements = []
+    sqlite_db._connection().set_trace_callback(statements.append)
+    # When I append a monitored value with its step and timestamp
+    sqlite_db.append_monitored(exp_id, "loss", [0.5], steps=[3], timestamps=[10.0])
+    sqlite_db._connection().set_trace_callback(None)
+    # Then only a metrics row is written and the series is read from it
+    assert [sql for sql in statements if sql.startswith(("UPDATE", "INSERT"))] == \
+        ["INSERT INTO test_metrics (exp_id, key, step, value, logged_step, timestamp) VALUES ({}, 'loss', 0, 0.5, 3, "
+         "10.0)".format(exp_id)]
+    series = sqlite_db.get_series(exp_id, "loss")
+    assert (series.step.tolist(), series.timestamp.tolist(), series.value.tolist()) == ([3], [10.0], [0.5])
+
+
+def test_metrics_tables_without_series_columns_get_them(tmpdir):
+    import sqlite3
+    # Given a metrics table created before the series columns were added
+    connection = sqlite3.connect(tmpdir.join("jikken_db.sqlite").strpath)
+    connection.execute("CREATE TABLE test_experiment (id INTEGER PRIMARY KEY AUTOINCREMENT, doc TEXT NOT NULL)")
+    connection.execute("CREATE TABLE test_metrics (exp_id INTEGER NOT NULL REFERENCES test_experiment(id) "
+                       "ON DELETE CASCADE, key TEXT NOT NULL, step INTEGER NOT NULL, value, "
+                       "PRIMARY KEY (exp_id, key, step)) WITHOUT ROWID")
+    connection.execute("INSERT INTO test_experiment (doc) VALUES ('{\"type\": \"experiment\"}')")
+    connection.execute("INSERT INTO test_metrics VALUES (1, 'loss', 0, 0.5)")
+    connection.commit()
+    connection.close()
+    # When the db is opened
+    db = SQLiteDB(tmpdir.strpath, "test")
+    # Then the old values have no step and new ones are appended with theirs
+    db.append_monitored("1", "loss", [0.25], steps=[1])
+    assert db.get_series("1", "loss").step.tolist() == [NO_STEP, 1]
+    db.stop_db()
@@ -1,5 +1,7 @@
 import os
 import copy
+import subprocess
+import sys
 import pytest
 from jikken.api import Experiment
 import git
@@ -156,3 +158,17 @@ def test_experiment_from_dict_is_same(jikken_experiment):
     exp, expected_variables, _, tmpdir = jikken_experiment
     new_exp = Experiment.from_dict(exp.to_dict())
     assert new_exp == exp
+
+
+def test_experiment_hash_is_the_same_in_every_process(experiment_setup):
+    # Given an experiment
+    expected_variables, tags, tmpdir = experiment_setup
+    exp = Experiment(name="exp", variables=expected_variables, code_dir=tmpdir.strpath)
+    code = "from jikken.api import Experiment; print(Experiment(name='exp', variables={}, code_dir={}).hash)".format(
+        repr(expected_variables), repr(tmpdir.strpath))
+    for seed in ["1", "2"]:
+        # When the same experiment is created in processes with different string hash seeds
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        output = subprocess.check_output([sys.executable, "-c", code], env=env)
+        # Then its hash does not change
+        assert output.decode().strip() == exp.hash
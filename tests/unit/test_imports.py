@@ -0,0 +1,36 @@
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["git", "yaml", "asyncio", "multiprocessing", "subprocess", "blessings", "pygments", "numpy",
+                 "tinydb", "sqlite3", "pymongo", "elasticsearch"]
+
+
+@pytest.mark.parametrize("module", ["jikken", "jikken.cli"])
+def test_import_does_not_load_heavy_dependencies(module):
+    # Given a fresh interpreter
+    code = "import {}, sys; print(' '.join(m for m in {} if m in sys.modules))".format(module, HEAVY_MODULES)
+    # When the module is imported
+    output = subprocess.check_output([sys.executable, "-c", code])
+    # Then none of the heavy dependencies are imported until a command or function needs them
+    assert output.decode().split() == []
+
+
+def test_lazy_package_attributes():
+    import jikken
+    from jikken.experiment import Experiment
+    from jikken.multistage import MultiStageExperiment
+    assert jikken.Experiment is Experiment
+    assert jikken.MultiStageExperiment is MultiStageExperiment
+    with pytest.raises(AttributeError):
+        jikken.missing
+
+
+def test_import_does_not_load_the_experiment_classes():
+    # Given a fresh interpreter
+    code = "import jikken, sys; print('jikken.experiment' in sys.modules, 'jikken.multistage' in sys.modules)"
+    # When the package is imported
+    output = subprocess.check_output([sys.executable, "-c", code])
+    # Then the experiment classes are only imported on first use, whatever the python version
+    assert output.decode().split() == ["False", "False"]
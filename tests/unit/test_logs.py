@@ -0,0 +1,45 @@
+import pytest
+from jikken.database.logs import LogStore
+
+
+@pytest.fixture()
+def log_store(tmpdir):
+    store = LogStore(str(tmpdir.mkdir("logs")))
+    for index in range(5):
+        store.append("exp_1", "stdout", "".join("line {}\n".format(index * 3 + line) for line in range(3)))
+    return store
+
+
+def test_append_returns_log_size(log_store):
+    full_log = "".join("line {}\n".format(line) for line in range(15))
+    assert log_store.size("exp_1", "stdout") == len(full_log.encode('utf-8'))
+    assert log_store.append("exp_1", "stdout", "é\n") == len(full_log.encode('utf-8')) + 3
+
+
+def test_read_returns_byte_ranges_across_chunks(log_store):
+    full_log = "".join("line {}\n".format(line) for line in range(15))
+    assert log_store.read("exp_1", "stdout") == full_log
+    assert log_store.read("exp_1", "stdout", start=5, end=40) == full_log[5:40]
+    assert log_store.read("exp_1", "stdout", start=len(full_log) - 3) == full_log[-3:]
+    assert log_store.read("exp_1", "stdout", start=len(full_log)) == ""
+
+
+def test_tail_returns_last_lines(log_store):
+    assert log_store.tail("exp_1", "stdout", lines=4) == "line 11\nline 12\nline 13\nline 14\n"
+    assert log_store.tail("exp_1", "stdout", lines=100) == "".join("line {}\n".format(line) for line in range(15))
+
+
+def test_missing_logs_are_empty(log_store):
+    assert log_store.size("exp_1", "stderr") == 0
+    assert log_store.read("exp_2", "stdout") == ""
+    assert log_store.tail("exp_2", "stdout") == ""
+
+
+def test_delete_removes_logs(log_store):
+    log_store.delete("exp_1")
+    assert log_store.size("exp_1", "stdout") == 0
+
+
+def test_wrong_std_type_raises(log_store):
+    with pytest.raises(ValueError):
+        log_store.append("exp_1", "error", "text")
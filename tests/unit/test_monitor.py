@@ -1,5 +1,12 @@
+import gc
+import os
+import select
+import time
+
 import pytest
-from jikken.monitor import log_value, capture_value
+from jikken.monitor import log_value, log_metric, capture_value, encode_metric, decode_metrics, Monitor, \
+    MetricsChannel, MetricsReceiver, METRICS_FD_ENV
+import jikken.monitor
 
 testdata = [
     # name, value
@@ -15,7 +22,139 @@ def test_logging_and_capturing_value(name, value, capsys):
     """Check that a value gets captured when it gets logged"""
     log_value(name=name, value=value)
     out, err = capsys.readouterr()
-    for line in err:
+    for line in err.splitlines():
         result = capture_value(line)
         assert result[0] == name
         assert result[1] == value
+
+
+parsed_values = [
+    # logged text, parsed value
+    ("-3", -3),
+    ("1.5e-08", 1.5e-08),
+    ("-inf", float("-inf")),
+    ("True", True),
+    ("[0.1, -2, 3e5]", [0.1, -2, 3e5]),
+    ("[1. 2. 3.]", [1.0, 2.0, 3.0]),
+    ("(1, 2)", (1, 2)),
+    ("{'a': 1}", {"a": 1}),
+    ("two words", "two words"),
+]
+
+
+@pytest.mark.parametrize("text,value", parsed_values)
+def test_capture_value_parses_logged_values(text, value):
+    line = "2018-01-01 00:00:00,000 - jekkin - INFO - JEKKIN_MONITOR\tloss\t{}\n".format(text)
+    assert capture_value(line) == ("loss", value)
+
+
+def test_capture_value_parses_nan():
+    name, value = capture_value("JEKKIN_MONITOR\tloss\tnan\n")
+    assert name == "loss" and value != value
+
+
+@pytest.mark.parametrize("text", ["{[1]: 2}", "[" * 100000 + "]" * 100000])
+def test_capture_value_keeps_values_that_cannot_be_evaluated(text):
+    # Given a logged value that literal_eval fails on with another error than a syntax error
+    line = "JEKKIN_MONITOR\tx\t{}\n".format(text)
+    # When I capture it
+    name, value = capture_value(line)
+    # Then the text is kept
+    assert name == "x" and value == text
+
+
+@pytest.mark.parametrize("line", ["warning: JEKKIN is deprecated\n", "JEKKIN_MONITOR\tno name\t1\n",
+                                  "JEKKIN_MONITOR\tloss\t\n"])
+def test_capture_value_rejects_other_lines(line):
+    assert capture_value(line) is None
+
+
+def test_encoded_metrics_are_decoded_in_order():
+    # Given a buffer with two metric records and a partial third one
+    buffer = encode_metric("loss", 0.5, step=1, timestamp=10.0) + encode_metric("acc", 1, timestamp=11.0)
+    third = encode_metric("loss", 0.25, step=2, timestamp=12.0)
+    records, consumed = decode_metrics(buffer + third[:5])
+    # Then the complete records are decoded and the partial one is left in the buffer
+    assert records == [("loss", 1, 10.0, 0.5), ("acc", None, 11.0, 1.0)]
+    assert consumed == len(buffer)
+
+
+def test_log_metric_falls_back_to_log_value_without_channel(mocker, monkeypatch):
+    monkeypatch.delenv(METRICS_FD_ENV, raising=False)
+    log_value = mocker.patch("jikken.monitor.log_value")
+    log_metric("loss", 0.5)
+    log_value.assert_called_once_with("loss", 0.5)
+
+
+def test_monitor_buffers_values_until_flush(capsys, monkeypatch):
+    # Given a monitor in a script that is run outside jikken
+    monkeypatch.delenv(METRICS_FD_ENV, raising=False)
+    monitor = Monitor(flush_interval=60)
+    # When values are logged
+    monitor.log("loss", 0.5, step=1)
+    monitor.log("finished", True)
+    # Then nothing is written until the monitor is flushed
+    assert capsys.readouterr().err == ""
+    monitor.close()
+    lines = capsys.readouterr().err.splitlines()
+    assert [capture_value(line) for line in lines] == [("loss", 0.5), ("finished", True)]
+
+
+def test_monitor_accepts_numpy_values(capsys, monkeypatch):
+    np = pytest.importorskip("numpy")
+    monkeypatch.delenv(METRICS_FD_ENV, raising=False)
+    # Given a numpy array that is changed after it is logged
+    weights = np.array([0.5, -1.5])
+    with Monitor() as monitor:
+        monitor.log("loss", np.float32(0.25))
+        monitor.log("weights", weights)
+        weights[0] = 2.0
+    # Then the logged values are plain python values of the array at the time of the call
+    lines = capsys.readouterr().err.splitlines()
+    assert [capture_value(line) for line in lines] == [("loss", 0.25), ("weights", [0.5, -1.5])]
+
+
+def test_metrics_channel_flushes_when_the_script_stops_writing():
+    # Given a metrics channel on a pipe
+    read_fd, write_fd = os.pipe()
+    channel = MetricsChannel(write_fd, flush_interval=0.01)
+    # When a single metric is written and nothing follows
+    channel.write("loss", 0.5, step=1, timestamp=10.0)
+    # Then it is flushed without waiting for another write
+    readable, _, _ = select.select([read_fd], [], [], 5)
+    assert readable == [read_fd]
+    assert decode_metrics(os.read(read_fd, 1024))[0] == [("loss", 1, 10.0, 0.5)]
+    os.close(read_fd)
+
+
+def test_metrics_receiver_close_does_not_wait_for_processes_holding_the_channel():
+    # Given a receiver whose channel is still held by a process started by the child
+    records = []
+    receiver = MetricsReceiver(lambda *record: records.append(record), close_timeout=0.1)
+    held_fd = os.dup(receiver.write_fd)
+    receiver.start()
+    # When the receiver is closed
+    start = time.monotonic()
+    receiver.close()
+    # Then it gives up after the timeout and the later records are not passed on
+    assert time.monotonic() - start < 5
+    os.write(held_fd, encode_metric("loss", 0.5))
+    os.close(held_fd)
+    time.sleep(0.1)
+    assert records == []
+
+
+def test_monitors_are_flushed_at_exit_without_being_kept_alive(capsys, monkeypatch):
+    monkeypatch.delenv(METRICS_FD_ENV, raising=False)
+    # Given an open monitor with a buffered value and many monitors that are no longer used
+    monitor = Monitor(flush_interval=60)
+    monitor.log("loss", 0.5)
+    for _ in range(100):
+        Monitor()
+    gc.collect()
+    # Then only the open monitor is flushed at exit
+    assert list(jikken.monitor._open_monitors) == [monitor]
+    jikken.monitor._flush_monitors()
+    assert [capture_value(line) for line in capsys.readouterr().err.splitlines()] == [("loss", 0.5)]
+    monitor.close()
+    assert len(jikken.monitor._open_monitors) == 0
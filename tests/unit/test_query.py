@@ -1,5 +1,6 @@
 import pytest
-from jikken.database.query import valid_list
+from jikken.database.query import valid_list, ExperimentQuery
+from jikken.database.helpers import project
 
 values = [
     # value, expected_return
@@ -25,3 +26,40 @@ invalid_values = [
 def test_valid_list_raises_error(value):
     with pytest.raises(AssertionError):
         valid_list(value)
+
+
+doc = {"id": "1", "type": "experiment", "name": "exp", "monitored": {"loss": [1, 2], "acc": [0.5]}, "stdout": "out"}
+projections = [
+    # fields, exclude, expected
+    (None, None, doc),
+    (["name"], None, {"id": "1", "type": "experiment", "name": "exp"}),
+    (["monitored.loss", "missing"], None, {"id": "1", "type": "experiment", "monitored": {"loss": [1, 2]}}),
+    (None, ["stdout", "monitored.acc"], {"id": "1", "type": "experiment", "name": "exp",
+                                         "monitored": {"loss": [1, 2]}}),
+]
+
+
+@pytest.mark.parametrize("fields, exclude, expected", projections)
+def test_project(fields, exclude, expected):
+    # Given a document
+    original = {key: dict(value) if isinstance(value, dict) else value for key, value in doc.items()}
+    # When I project it
+    result = project(doc, fields, exclude)
+    # Then only the projected fields are returned and the document is not changed
+    assert result == expected
+    assert doc == original
+
+
+def test_query_cannot_have_fields_and_exclude():
+    with pytest.raises(AssertionError):
+        ExperimentQuery(fields=["name"], exclude=["stdout"])
+
+
+def test_with_projection_returns_a_copy():
+    # Given a query
+    query = ExperimentQuery(tags=["tag"])
+    # When I add a projection to it
+    projected = query.with_projection(fields=["monitored"])
+    # Then the copy has the projection and the query is unchanged
+    assert projected.fields == ["monitored"] and projected.tags == ["tag"]
+    assert query.fields == []
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+import jikken.resources
+from jikken.resources import ResourceSampler, can_sample, tree_usage
+
+pytestmark = pytest.mark.skipif(not can_sample(), reason="/proc is not available")
+
+
+def test_tree_usage_includes_children():
+    # Given a process with a child that sleeps
+    child = "import subprocess, sys; subprocess.call([sys.executable, '-c', 'import time; time.sleep(2)'])"
+    with subprocess.Popen([sys.executable, "-c", child]) as p:
+        # When I sample the tree usage after the child has started
+        for _ in range(50):
+            usage = tree_usage(p.pid)
+            if usage["proc_threads"] >= 2:
+                break
+            time.sleep(0.05)
+        p.kill()
+    # Then the usage of both processes is summed
+    assert usage["proc_threads"] >= 2
+    assert usage["proc_rss_bytes"] > 0
+    assert usage["proc_cpu_time"] >= 0
+
+
+def test_tree_usage_of_missing_process_is_none():
+    assert tree_usage(2 ** 22 + 1) is None
+
+
+def test_sampler_passes_samples_to_callback():
+    samples = []
+    sampler = ResourceSampler(os.getpid(), lambda *sample: samples.append(sample), interval=0.01)
+    sampler.start()
+    deadline = time.monotonic() + 10
+    while len(samples) < 10 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sampler.stop()
+    assert len(samples) >= 10
+    names = {name for name, _, _, _ in samples}
+    assert names == {"proc_cpu_time", "proc_threads", "proc_rss_bytes", "proc_read_bytes", "proc_write_bytes"}
+    assert samples[0][1] == 0
+
+
+def test_sampler_never_decreases_the_cumulative_resources(mocker):
+    # Given a process tree whose cpu time drops when a child that was not waited for exits
+    bytes_used = {"proc_read_bytes": 0, "proc_write_bytes": 0}
+    usages = iter([dict(bytes_used, proc_cpu_time=2.0, proc_threads=2),
+                   dict(bytes_used, proc_cpu_time=1.0, proc_threads=1), None])
+    mocker.patch.object(jikken.resources, "tree_usage", side_effect=lambda pid: next(usages))
+    samples = []
+    sampler = ResourceSampler(os.getpid(), lambda *sample: samples.append(sample), interval=0.01)
+    # When the tree is sampled until it exits
+    sampler._run()
+    # Then the cpu time keeps its highest value and the other resources follow the tree
+    assert [value for name, _, _, value in samples if name == "proc_cpu_time"] == [2.0, 2.0]
+    assert [value for name, _, _, value in samples if name == "proc_threads"] == [2, 1]
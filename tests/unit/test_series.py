@@ -0,0 +1,27 @@
+import numpy as np
+from jikken.database.series import decode_series, series_columns, NO_STEP
+
+
+def test_series_columns_hold_a_point_for_every_value():
+    columns = series_columns([0.5, "text"], steps=[3, None], timestamps=[10.0, None])
+    assert columns == {"step": [3, NO_STEP], "timestamp": [10.0, None]}
+
+
+def test_decode_series_keeps_only_numbers():
+    # Given monitored values and their columns
+    values = [0.5, "text", 2, True]
+    columns = {"step": [0, 1, 2, 3], "timestamp": [10.0, 11.0, None, 13.0]}
+    # When I decode them
+    series = decode_series(values, columns)
+    # Then I get typed arrays of the numeric values with their points
+    assert series.step.dtype == np.int64
+    assert series.step.tolist() == [0, 2]
+    assert series.timestamp[0] == 10.0 and np.isnan(series.timestamp[1])
+    assert series.value.tolist() == [0.5, 2.0]
+
+
+def test_values_stored_before_the_columns_have_no_step():
+    series = decode_series([0.5, 0.25, 0.125], {"step": [7], "timestamp": [12.0]})
+    assert series.step.tolist() == [NO_STEP, NO_STEP, 7]
+    assert series.value.tolist() == [0.5, 0.25, 0.125]
+    assert np.isnan(series.timestamp[:2]).all()
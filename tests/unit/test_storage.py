@@ -0,0 +1,134 @@
+import json
+import os
+import time
+
+import tinydb
+from jikken.database.db_tinydb import TinyDB
+from jikken.database.storage import AtomicJSONStorage, WriteBehindMiddleware
+
+
+def test_atomic_storage_replaces_the_file(tmpdir):
+    # Given an atomic storage
+    path = tmpdir.join("db.json").strpath
+    storage = AtomicJSONStorage(path)
+    # When I write it twice
+    storage.write({"table": {"1": {"value": 1}}})
+    storage.write({"table": {"1": {"value": 2}}})
+    # Then the file holds the last data and no temporary file is left
+    assert storage.read() == {"table": {"1": {"value": 2}}}
+    assert os.listdir(tmpdir.strpath) == ["db.json"]
+
+
+def test_middleware_buffers_writes_until_flush(tmpdir):
+    # Given a TinyDB with a write behind middleware that does not flush on its own
+    path = tmpdir.join("db.json").strpath
+    db = tinydb.TinyDB(path, storage=WriteBehindMiddleware(AtomicJSONStorage, write_cache_size=100,
+                                                           flush_interval=60))
+    # When I insert documents
+    for index in range(3):
+        db.insert({"value": index})
+    # Then nothing is written until the db is closed
+    assert AtomicJSONStorage(path).read() is None
+    db.close()
+    assert len(AtomicJSONStorage(path).read()["_default"]) == 3
+
+
+def test_middleware_flushes_after_write_cache_size(tmpdir):
+    # Given a TinyDB that flushes every second write
+    path = tmpdir.join("db.json").strpath
+    storage = WriteBehindMiddleware(AtomicJSONStorage, write_cache_size=2, flush_interval=60)
+    db = tinydb.TinyDB(path, storage=storage)
+    storage.flush()
+    # When I insert three documents
+    for index in range(3):
+        db.insert({"value": index})
+    # Then the first two are written
+    assert len(AtomicJSONStorage(path).read()["_default"]) == 2
+
+
+def test_middleware_flushes_a_last_write_after_flush_interval(tmpdir):
+    # Given a TinyDB that flushes after a tenth of a second
+    path = tmpdir.join("db.json").strpath
+    db = tinydb.TinyDB(path, storage=WriteBehindMiddleware(AtomicJSONStorage, write_cache_size=100,
+                                                           flush_interval=0.1))
+    # When I insert a document and do not write again
+    db.insert({"value": 1})
+    assert AtomicJSONStorage(path).read() is None
+    time.sleep(0.5)
+    # Then the document is written
+    assert len(AtomicJSONStorage(path).read()["_default"]) == 1
+
+
+def test_tinydb_takes_new_ids_after_the_stored_ones(tmpdir, mocker):
+    # Given a file with experiments that another backend added
+    first = TinyDB(tmpdir.strpath, "test")
+    first_ids = [first.add({"type": "experiment", "name": "first"}) for _ in range(2)]
+    first.flush()
+    second = TinyDB(tmpdir.strpath, "test")
+    all_docs = mocker.spy(second._db["experiment"], "all")
+    # When I add an experiment with a new backend
+    exp_id = second.add({"type": "experiment", "name": "second"})
+    # Then it gets the next id without scanning the table
+    assert first_ids == ["1", "2"]
+    assert exp_id == "3"
+    assert all_docs.call_count == 0
+    assert second.get(exp_id, "experiment")["name"] == "second"
+
+
+def test_tinydb_adds_a_document_with_one_write(tmpdir, mocker):
+    # Given a TinyDB backend
+    db = TinyDB(tmpdir.strpath, "test")
+    write = mocker.spy(db._storage, "write")
+    # When I add an experiment
+    exp_id = db.add({"type": "experiment", "name": "test"})
+    # Then the document and its id are written at once
+    assert write.call_count == 1
+    assert db.get(exp_id, "experiment")["id"] == exp_id
+
+
+def test_tinydb_flush_keeps_the_writes_of_other_processes(tmpdir):
+    # Given two backends on the same file, like two workers of a sweep
+    first = TinyDB(tmpdir.strpath, "test")
+    second = TinyDB(tmpdir.strpath, "test")
+    # When both add an experiment and change it before either flushes
+    exp_id = first.add({"type": "experiment", "name": "first", "status": "created"})
+    second_id = second.add({"type": "experiment", "name": "second", "status": "created"})
+    first.update_key(exp_id, "completed", "status")
+    second.update_key(second_id, "running", "status")
+    second.flush()
+    first.flush()
+    # Then the file has the documents and changes of both
+    with open(tmpdir.join("jikken_db.json").strpath) as file_handle:
+        stored = json.load(file_handle)["test_experiment"]
+    assert second_id != exp_id
+    assert stored[exp_id]["name"] == "first"
+    assert stored[exp_id]["status"] == "completed"
+    assert stored[second_id]["name"] == "second"
+    assert stored[second_id]["status"] == "running"
+
+
+def test_tinydb_documents_are_not_shared_with_the_cache(tmpdir):
+    # Given a TinyDB backend with an experiment
+    db = TinyDB(tmpdir.strpath, "test")
+    exp_id = db.add({"type": "experiment", "name": "test", "tags": ["a"]})
+    # When I change the returned document
+    db.get(exp_id, "experiment")["tags"].append("b")
+    # Then the stored document is unchanged
+    assert db.get(exp_id, "experiment")["tags"] == ["a"]
+
+
+def test_tinydb_keeps_every_monitored_value_once(tmpdir, mocker):
+    # Given a TinyDB backend with an experiment
+    db = TinyDB(tmpdir.strpath, "test")
+    exp_id = db.add({"type": "experiment", "name": "test", "monitored": {}, "series": {}})
+    get_many = mocker.spy(db, "get_many")
+    # When I append two batches of one value
+    db.append_monitored(exp_id, "loss", [0.5], steps=[0], timestamps=[10.0])
+    db.append_monitored(exp_id, "loss", [0.25], steps=[1])
+    # Then the values are only in monitored and the series extends its step and timestamp columns
+    exp = db.get(exp_id, "experiment")
+    assert exp["monitored"]["loss"] == [0.5, 0.25]
+    assert exp["series"]["loss"] == {"step": [0, 1], "timestamp": [10.0, None]}
+    # And the series is read with only the key
+    assert db.get_series(exp_id, "loss").value.tolist() == [0.5, 0.25]
+    assert get_many.call_args[1]["fields"] == ["series.loss", "monitored.loss"]
@@ -0,0 +1,52 @@
+import pytest
+from jikken.sweep import grid_variants, random_variants, unique_variants, flatten_sweep, worker_cpus
+
+VARIABLES = {"config.yaml": {"training": {"batch_size": 32, "lr": 0.1}, "layers": [1, 2]}}
+
+
+def test_grid_variants_expand_every_combination():
+    sweep = {"config.yaml": {"training": {"batch_size": [16, 32], "lr": [0.1, 0.01, 0.001]}}}
+    variants = list(grid_variants(VARIABLES, sweep))
+    assert len(variants) == 6
+    assert {(v["config.yaml"]["training"]["batch_size"], v["config.yaml"]["training"]["lr"]) for v in variants} == \
+           {(16, 0.1), (16, 0.01), (16, 0.001), (32, 0.1), (32, 0.01), (32, 0.001)}
+    # And the reference variables are not changed
+    assert VARIABLES["config.yaml"]["training"]["batch_size"] == 32
+
+
+def test_list_values_are_swept_as_lists_of_lists():
+    sweep = {"config.yaml": {"layers": [[1], [1, 2, 3]]}}
+    assert [v["config.yaml"]["layers"] for v in grid_variants(VARIABLES, sweep)] == [[1], [1, 2, 3]]
+
+
+def test_random_variants_are_unique_and_bounded_by_the_grid():
+    sweep = {"config.yaml": {"training": {"batch_size": [16, 32], "lr": [0.1, 0.01]}}}
+    assert len(list(random_variants(VARIABLES, sweep, samples=3, seed=1))) == 3
+    assert len(list(random_variants(VARIABLES, sweep, samples=10, seed=1))) == 4
+
+
+def test_unique_variants_skip_repeated_parameters():
+    sweep = {"config.yaml": {"training": {"batch_size": [16, 16, 32]}}}
+    assert len(list(unique_variants(grid_variants(VARIABLES, sweep)))) == 2
+
+
+@pytest.mark.parametrize("sweep", [{"config.yaml": {"training": {"batch_size": 16}}},
+                                   {"config.yaml": {"training": {"batch_size": []}}}])
+def test_sweep_leaves_must_be_non_empty_lists(sweep):
+    with pytest.raises(ValueError):
+        flatten_sweep(sweep)
+
+
+def test_sweep_variables_must_exist_in_configuration():
+    sweep = {"config.yaml": {"training": {"momentum": [0.9]}}}
+    with pytest.raises(KeyError):
+        list(grid_variants(VARIABLES, sweep))
+
+
+def test_worker_cpus_split_the_available_cpus_evenly(mocker):
+    # Given eight available cpus
+    mocker.patch("os.sched_getaffinity", return_value={0, 1, 2, 3, 4, 5, 6, 7})
+    # Then every one of four workers gets its own two cpus
+    assert [worker_cpus(index, 4) for index in range(4)] == [{0, 1}, {2, 3}, {4, 5}, {6, 7}]
+    # And workers beyond the cpus share them one by one
+    assert [worker_cpus(index, 10) for index in range(10)] == [{index % 8} for index in range(10)]
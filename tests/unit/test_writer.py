@@ -0,0 +1,62 @@
+import pytest
+from jikken.database import BatchWriter
+
+
+def test_writer_coalesces_updates_into_batches(mocker):
+    # Given a writer that only flushes when it is closed
+    db = mocker.Mock()
+    writer = BatchWriter(db, buffer_limit=1000, flush_interval=60)
+    # When I send stdout lines and monitored values
+    for index in range(3):
+        writer.update_std("exp_1", "line {}\n".format(index), "stdout")
+        writer.update_monitored("exp_1", "loss", index)
+    writer.close()
+    # Then they are written with one bulk call per stream and monitored key
+    db.update_std_batch.assert_called_once_with("exp_1", ["line 0\n", "line 1\n", "line 2\n"], "stdout")
+    db.update_monitored_batch.assert_called_once_with("exp_1", "loss", [0, 1, 2], steps=[None, None, None],
+                                                      timestamps=[None, None, None])
+
+
+def test_writer_flushes_pending_batches_before_status(mocker):
+    # Given a writer
+    db = mocker.Mock()
+    calls = []
+    db.update_std_batch.side_effect = lambda *args: calls.append("std")
+    db.update_status.side_effect = lambda *args: calls.append("status")
+    with BatchWriter(db, buffer_limit=1000, flush_interval=60) as writer:
+        # When I update the stdout and then the status
+        writer.update_std("exp_1", "line\n", "stdout")
+        writer.update_status("exp_1", "completed")
+    # Then the stdout is written before the status
+    assert calls == ["std", "status"]
+
+
+def test_writer_flushes_when_buffer_limit_is_reached(mocker):
+    # Given a writer with a small buffer limit
+    db = mocker.Mock()
+    with BatchWriter(db, buffer_limit=2, flush_interval=60) as writer:
+        # When I send more monitored values than the limit
+        for index in range(4):
+            writer.update_monitored("exp_1", "loss", index, step=index)
+    # Then the values are written in batches of the buffer limit
+    assert db.update_monitored_batch.call_args_list == [
+        mocker.call("exp_1", "loss", [0, 1], steps=[0, 1], timestamps=[None, None]),
+        mocker.call("exp_1", "loss", [2, 3], steps=[2, 3], timestamps=[None, None])]
+
+
+def test_writer_execute_returns_result(mocker):
+    db = mocker.Mock()
+    db.add.return_value = "exp_1"
+    with BatchWriter(db) as writer:
+        assert writer.execute(db.add, "experiment").result() == "exp_1"
+
+
+def test_writer_close_raises_write_errors(mocker):
+    # Given a db that fails on status updates
+    db = mocker.Mock()
+    db.update_status.side_effect = ValueError("status: wrong not correct")
+    writer = BatchWriter(db)
+    writer.update_status("exp_1", "wrong")
+    # Then the error is raised when the writer is closed
+    with pytest.raises(ValueError):
+        writer.close()